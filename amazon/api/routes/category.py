@@ -1,33 +1,143 @@
 import uuid
-from fastapi import APIRouter
+import binascii
+from typing import AsyncIterator, Iterable, Optional, Sequence
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic_core import to_json
 from shared.models.category import Category
+from shared.services.category_index import paginate
 from shared.utils import get_category_pool, event_loop_lock
 
 router = APIRouter()
 
 
+def _iter_ndjson(categories: Iterable[Category]):
+    for category in categories:
+        yield category.model_dump_json() + "\n"
+
+
+async def _start_ndjson(categories: AsyncIterator[Category]) -> AsyncIterator[str]:
+    # The first row is read before the response starts, a query which fails
+    # outright still answers 500. A later failure aborts the chunked body,
+    # which clients see as a broken response, not as a shorter tree
+    try:
+        first = await anext(categories)
+    except StopAsyncIteration:
+        first = None
+
+    async def iter_lines():
+        try:
+            if first is None:
+                return
+            yield first.model_dump_json() + "\n"
+            async for category in categories:
+                yield category.model_dump_json() + "\n"
+        finally:
+            await categories.aclose()
+
+    return iter_lines()
+
+
+def _etag_headers(etag: Optional[str]) -> dict[str, str]:
+    # Clients have to revalidate, but a matching ETag costs them an empty 304
+    if etag is None:
+        return {}
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+async def _get_etag(category_pool) -> Optional[str]:
+    # Read before the data: if the tree is replaced in between, the response is
+    # newer than its ETag and the next request simply downloads it again
+    version = await category_pool.get_version(None, event_loop_lock)
+    return f'"v{version}"' if version is not None else None
+
+
+def _is_not_modified(request: Request, etag: Optional[str]) -> bool:
+    if etag is None:
+        return False
+
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _not_modified_response(etag: str):
+    return Response(status_code=304, headers=_etag_headers(etag))
+
+
+def _json_response(response: dict, etag: Optional[str] = None):
+    # Models are serialized straight to bytes by pydantic-core, skipping the
+    # jsonable_encoder pass FastAPI does on plain return values
+    return Response(
+        content=to_json(response),
+        media_type="application/json",
+        headers=_etag_headers(etag),
+    )
+
+
+def _paginate(
+    categories: Sequence[Category],
+    after: Optional[str],
+    limit: Optional[int],
+    depth_desc: bool = False,
+):
+    try:
+        return paginate(categories, after, limit, depth_desc)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def _stream_response(
+    request_id: uuid.UUID,
+    categories: Sequence[Category],
+    next_cursor: Optional[str] = None,
+    etag: Optional[str] = None,
+):
+    headers = {
+        "X-Request-Id": str(request_id),
+        "X-Category-Count": str(len(categories)),
+        **_etag_headers(etag),
+    }
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+
+    return StreamingResponse(
+        _iter_ndjson(categories),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
 @router.post("/replace")
 async def replace_categories(categories: list[Category]):
     request_id = uuid.uuid4()
 
     category_pool = await get_category_pool()
 
-    is_ok = await category_pool.replace(categories, None, event_loop_lock)
+    stats = await category_pool.replace(categories, None, event_loop_lock)
 
     response = {
         "request_id": request_id,
         "total": len(categories),
-        "message": "ok" if is_ok else "failed",
+        "message": "ok" if stats is not None else "failed",
+        "stats": stats,
+        "version": category_pool.version,
     }
 
     return response
 
 
 @router.get("/get_by_name")
-async def get_category_by_name(name: str):
+async def get_category_by_name(request: Request, name: str):
     request_id = uuid.uuid4()
 
     category_pool = await get_category_pool()
+    etag = await _get_etag(category_pool)
+    if _is_not_modified(request, etag):
+        return _not_modified_response(etag)
     category = await category_pool.get_by_name(name, None, event_loop_lock)
 
     response = {
@@ -35,32 +145,68 @@ async def get_category_by_name(name: str):
         "category": category if category else "not found",
     }
 
-    return response
+    return _json_response(response, etag)
+
+
+@router.get("/get_by_node_id")
+async def get_category_by_node_id(request: Request, node_id: int):
+    request_id = uuid.uuid4()
+
+    category_pool = await get_category_pool()
+    etag = await _get_etag(category_pool)
+    if _is_not_modified(request, etag):
+        return _not_modified_response(etag)
+    category = await category_pool.get_by_node_id(node_id, None, event_loop_lock)
+
+    response = {
+        "request_id": request_id,
+        "category": category if category else "not found",
+    }
+
+    return _json_response(response, etag)
 
 
 @router.get("/get_by_depth")
-async def get_category_by_depth(depth: int, strict: bool = False):
+async def get_category_by_depth(
+    request: Request,
+    depth: int,
+    strict: bool = False,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, ge=1),
+    stream: bool = False,
+):
     request_id = uuid.uuid4()
 
     category_pool = await get_category_pool()
-    categories, num_of_categories = await category_pool.get_by_depth(
+    etag = await _get_etag(category_pool)
+    if _is_not_modified(request, etag):
+        return _not_modified_response(etag)
+    categories, _ = await category_pool.get_by_depth(
         depth, strict, None, event_loop_lock
     )
+    categories, next_cursor = _paginate(categories, after, limit, not strict)
+
+    if stream:
+        return _stream_response(request_id, categories, next_cursor, etag)
 
     response = {
         "request_id": request_id,
         "categories": categories,
-        "count": num_of_categories,
+        "count": len(categories),
+        "next": next_cursor,
     }
 
-    return response
+    return _json_response(response, etag)
 
 
 @router.get("/get_by_ancestor")
-async def get_category_by_ancestor(ancestor: str):
+async def get_category_by_ancestor(request: Request, ancestor: str):
     request_id = uuid.uuid4()
 
     category_pool = await get_category_pool()
+    etag = await _get_etag(category_pool)
+    if _is_not_modified(request, etag):
+        return _not_modified_response(etag)
     categories = await category_pool.get_by_ancestor(ancestor, None, event_loop_lock)
 
     response = {
@@ -68,14 +214,17 @@ async def get_category_by_ancestor(ancestor: str):
         "categories": categories,
     }
 
-    return response
+    return _json_response(response, etag)
 
 
 @router.get("/get_by_parent")
-async def get_category_by_parent(parent: str):
+async def get_category_by_parent(request: Request, parent: str):
     request_id = uuid.uuid4()
 
     category_pool = await get_category_pool()
+    etag = await _get_etag(category_pool)
+    if _is_not_modified(request, etag):
+        return _not_modified_response(etag)
     categories = await category_pool.get_by_parent(parent, None, event_loop_lock)
 
     response = {
@@ -83,22 +232,36 @@ async def get_category_by_parent(parent: str):
         "categories": categories,
     }
 
-    return response
+    return _json_response(response, etag)
 
 
 @router.get("/get_by_leaf")
-async def get_category_by_leaf(is_leaf: bool):
+async def get_category_by_leaf(
+    request: Request,
+    is_leaf: bool,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, ge=1),
+    stream: bool = False,
+):
     request_id = uuid.uuid4()
 
     category_pool = await get_category_pool()
+    etag = await _get_etag(category_pool)
+    if _is_not_modified(request, etag):
+        return _not_modified_response(etag)
     categories = await category_pool.get_by_leaf(is_leaf, None, event_loop_lock)
+    categories, next_cursor = _paginate(categories, after, limit)
+
+    if stream:
+        return _stream_response(request_id, categories, next_cursor, etag)
 
     response = {
         "request_id": request_id,
         "categories": categories,
+        "next": next_cursor,
     }
 
-    return response
+    return _json_response(response, etag)
 
 
 @router.post("/get_by_ancestors_and_depth")
@@ -115,4 +278,51 @@ async def get_category_by_ancestors_and_depth(ancestors: list[str], depth: int):
         "categories": categories,
     }
 
-    return response
+    return _json_response(response)
+
+
+@router.get("/subtree")
+async def get_category_subtree(
+    request: Request,
+    root: Optional[str] = None,
+    root_depth: Optional[int] = None,
+    min_depth: Optional[int] = None,
+    max_depth: Optional[int] = None,
+):
+    request_id = uuid.uuid4()
+
+    category_pool = await get_category_pool()
+    etag = await _get_etag(category_pool)
+    if _is_not_modified(request, etag):
+        return _not_modified_response(etag)
+    lines = await _start_ndjson(
+        category_pool.iter_subtree(
+            root, root_depth, min_depth, max_depth, None, event_loop_lock
+        )
+    )
+
+    # The size is not known up front, so unlike the paged routes there is no
+    # X-Category-Count
+    return StreamingResponse(
+        lines,
+        media_type="application/x-ndjson",
+        headers={"X-Request-Id": str(request_id), **_etag_headers(etag)},
+    )
+
+
+@router.get("/path")
+async def get_category_path(request: Request, name: str, depth: Optional[int] = None):
+    request_id = uuid.uuid4()
+
+    category_pool = await get_category_pool()
+    etag = await _get_etag(category_pool)
+    if _is_not_modified(request, etag):
+        return _not_modified_response(etag)
+    categories = await category_pool.get_path(name, depth, None, event_loop_lock)
+
+    response = {
+        "request_id": request_id,
+        "categories": categories,
+    }
+
+    return _json_response(response, etag)
@@ -0,0 +1,175 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import curl_cffi
+
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Generic, Optional, TypeVar
+from curl_cffi.requests import AsyncSession, Response
+
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+# The API is restarting or overloaded, anything else is the caller's problem
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+T = TypeVar("T")
+
+# Control plane calls of the scrapers (cookies, proxies, categories) share one
+# session per process. curl keeps its connections to the API alive between
+# calls, so a rotation every few pages no longer pays for a TCP handshake
+
+
+class ApiClient:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs) -> "ApiClient":
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.initialize(*args, **kwargs)
+        return cls._instance
+
+    def initialize(
+        self,
+        api_url: str = API_URL,
+        timeout: float = 60.0,
+        max_connections: int = 10,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._session: Optional[AsyncSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> AsyncSession:
+        # curl handles belong to the event loop they were first used in, every
+        # asyncio.run gets a pool of its own
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._loop is not loop:
+            self._session = AsyncSession(
+                max_clients=self.max_connections,
+                http_version=curl_cffi.CurlHttpVersion.V1_1,
+                timeout=self.timeout,
+            )
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    def _get_delay(self, attempt: int) -> float:
+        # Exponential backoff, the jitter keeps workers which failed together
+        # from retrying together
+        return self.backoff * 2**attempt * random.uniform(0.5, 1.0)
+
+    async def request(self, method: str, route: str, **kwargs) -> Response:
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = await session.request(method, f"{self.api_url}{route}", **kwargs)
+                if (
+                    resp.status_code not in RETRY_STATUS_CODES
+                    or attempt == self.max_retries
+                ):
+                    return resp
+                reason = f"Got status {resp.status_code}"
+            except curl_cffi.CurlError as e:
+                if attempt == self.max_retries:
+                    raise
+                reason = f"Got error {e}"
+
+            delay = self._get_delay(attempt)
+            logging.warning(f"[api][{route}]: {reason}, retrying in {delay:.1f} s")
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(self, method: str, route: str, **kwargs):
+        # Not retried, a half read body cannot be resumed by the client
+        async with self._get_session().stream(
+            method, f"{self.api_url}{route}", **kwargs
+        ) as resp:
+            yield resp
+
+    async def fetch_cookies(
+        self, browser_type: str = "firefox", do_fetch_pool: bool = True
+    ) -> tuple[dict[str, Any], int]:
+        resp = await self.request(
+            "POST",
+            "/cookie/fetch",
+            json={"browser_type": browser_type, "do_fetch_pool": do_fetch_pool},
+        )
+        return resp.json(), resp.status_code
+
+    async def rotate_proxy(
+        self,
+        provider: str = "iproyal",
+        tag: str = "general",
+        proxy_type: str = "dynamic",
+    ) -> tuple[dict[str, Any], int]:
+        resp = await self.request(
+            "POST",
+            "/proxy/rotate",
+            json={"provider": provider, "tag": tag, "proxy_type": proxy_type},
+        )
+        return resp.json(), resp.status_code
+
+    async def fetch_cookies_batch(
+        self, size: int, **kwargs
+    ) -> list[tuple[dict[str, Any], int]]:
+        return await asyncio.gather(
+            *(self.fetch_cookies(**kwargs) for _ in range(size))
+        )
+
+    async def rotate_proxy_batch(
+        self, size: int, **kwargs
+    ) -> list[tuple[dict[str, Any], int]]:
+        return await asyncio.gather(*(self.rotate_proxy(**kwargs) for _ in range(size)))
+
+
+class Prefetcher(Generic[T]):
+    # Keeps `size` calls of `fetch` running ahead of their use, so a rotation
+    # takes a result which is already there instead of waiting for the API.
+    # Results older than `max_age` are dropped, proxy sessions expire
+    def __init__(
+        self, fetch: Callable[[], Awaitable[T]], size: int = 1, max_age: float = 300.0
+    ):
+        self.fetch = fetch
+        self.size = size
+        self.max_age = max_age
+        self._pending: deque[tuple[float, asyncio.Task]] = deque()
+
+    def _fill(self):
+        while len(self._pending) < self.size:
+            self._pending.append((time.monotonic(), asyncio.create_task(self.fetch())))
+
+    async def get(self) -> T:
+        now = time.monotonic()
+        while self._pending and now - self._pending[0][0] > self.max_age:
+            _, task = self._pending.popleft()
+            if task.done() and not task.cancelled():
+                # Nobody awaits it any more, an error would be reported as lost
+                task.exception()
+            task.cancel()
+
+        if self._pending:
+            _, task = self._pending.popleft()
+        else:
+            task = asyncio.create_task(self.fetch())
+        self._fill()
+        return await task
+
+    async def close(self):
+        tasks = [task for _, task in self._pending]
+        self._pending.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
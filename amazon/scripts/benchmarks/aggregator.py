@@ -0,0 +1,181 @@
+import os
+import sys
+
+# aggregator.py imports from the scripts/categories package marker
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../categories")
+)
+
+import __init__
+
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+from shared.models.category import Category
+from aggregator import iter_categories
+
+
+def make_tree(
+    keyword: str,
+    num_of_nodes: int,
+    max_children: int,
+    rng: random.Random,
+    first_node_id: int = 0,
+):
+    tree = {"path": keyword, "url": f"https://amazon.com/s?k={keyword}", "inner": {}}
+    frontier = [tree]
+    created = 1
+    while frontier and created < num_of_nodes:
+        node = frontier.pop(0)
+        for _ in range(rng.randint(1, max_children)):
+            if created >= num_of_nodes:
+                break
+            # A few names repeat across branches, like on the real tree
+            name = f"{keyword} {created}" if rng.random() > 0.02 else "Accessories"
+            node_id = first_node_id + created
+            child = {"url": f"https://amazon.com/s?rh=n%3A{node_id}", "inner": {}}
+            node["inner"][name] = child
+            frontier.append(child)
+            created += 1
+    return tree
+
+
+# Recursive implementation the aggregator used before, kept as the baseline
+
+
+def explore_with_depth(
+    node: dict, name: str, path: str, parent: str, ancestor: str, depth: int = 0
+):
+    innerdata = {
+        "name": name,
+        "parent": parent,
+        "ancestor": ancestor if depth > 0 else None,
+        "is_leaf": False,
+        "depth": depth,
+        "url": node["url"],
+        "path": path,
+        "inner": {},
+    }
+
+    if not node["inner"]:
+        innerdata["is_leaf"] = True
+        return innerdata
+
+    for category in node["inner"]:
+        new_path = f"{path}/{category}"
+        subdata = explore_with_depth(
+            node["inner"][category],
+            category,
+            new_path,
+            innerdata["name"],
+            ancestor,
+            depth + 1,
+        )
+        innerdata["inner"][category] = subdata
+    return innerdata
+
+
+def process_node(node: dict, processed: set):
+    k = f"[depth={node['depth']}][name={node['name']}]"
+    if k in processed:
+        return []
+
+    processed.add(k)
+
+    if not node:
+        return []
+
+    inner = node["inner"]
+
+    record = Category(**node)
+    output = [record]
+
+    for category in inner:
+        innerdata = process_node(inner[category], processed)
+        output += innerdata
+    return output
+
+
+def legacy(filenames: list[str]) -> list[Category]:
+    dict_data = {}
+    for filename in filenames:
+        with open(filename, "r", encoding="utf-8") as file:
+            jsondata = json.load(file)
+        name = jsondata["path"]
+        dict_data[name] = explore_with_depth(jsondata, name, name, name, name)
+
+    processed = set()
+    lst_data = []
+    for name in dict_data:
+        lst_data += process_node(dict_data[name], processed)
+    return lst_data
+
+
+def measure(label: str, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {elapsed:8.2f} s  peak {peak / 2**20:8.1f} MiB")
+    return result
+
+
+def main(num_of_nodes: int, num_of_keywords: int, max_children: int, seed: int):
+    rng = random.Random(seed)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filenames = []
+        for i in range(num_of_keywords):
+            keyword = f"Keyword {i}"
+            tree = make_tree(
+                keyword,
+                num_of_nodes // num_of_keywords,
+                max_children,
+                rng,
+                i * num_of_nodes,
+            )
+            filename = os.path.join(tmp_dir, f"{keyword}.json")
+            with open(filename, "w", encoding="utf-8") as file:
+                json.dump(tree, file)
+            filenames.append(filename)
+
+        print(f"nodes={num_of_nodes} keywords={num_of_keywords}")
+        expected = measure("recursive (legacy)", lambda: legacy(filenames))
+        # The storage consumes the generator, counting stands in for the COPY
+        count = measure(
+            "generator (streamed)",
+            lambda: sum(1 for _ in iter_categories(filenames)),
+        )
+        collected = list(iter_categories(filenames))
+
+    # The legacy walk deduplicated by (depth, name) and dropped the repeated
+    # names, the node id keeps them, everything else must come out unchanged
+    def fields(category: Category):
+        return tuple(
+            category.model_dump(exclude={"node_id", "parent_node_id"}).values()
+        )
+
+    collected_fields = {fields(category) for category in collected}
+    print(f"categories: legacy={len(expected)} streamed={count}")
+    print(
+        "legacy output preserved: "
+        + str(all(fields(category) in collected_fields for category in expected))
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--keywords", type=int, default=15)
+    parser.add_argument("--max_children", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.nodes, args.keywords, args.max_children, args.seed)
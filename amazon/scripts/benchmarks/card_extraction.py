@@ -0,0 +1,170 @@
+import os
+import sys
+
+# card_extractor.py imports from the scripts/products package marker
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../products")
+)
+
+import __init__
+
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+from typing import Any, Callable
+from engine import preprocess_txt
+from products import make_card, make_fixtures
+from card_extractor import (
+    CARD_FIELDS,
+    Unsupported,
+    extract_card,
+    extract_card_bs4,
+    extract_card_fast,
+)
+
+# Runs the fast extractor and the bs4 reference over every card of a corpus of
+# recorded responses (see products.py for the format) and compares them field
+# by field. Exits with 1 on any difference, so it can gate changes to either
+
+
+def make_edge_cards(rng: random.Random) -> list[str]:
+    # Cards the synthetic fixtures do not cover, each of them has to come out
+    # of both extractors the same way, whether the fast one takes it or not
+    card = make_card("B000000001", rng)
+    return [
+        card.replace(
+            "<h2>",
+            "<div>You are seeing this ad based on the product relevance</div><h2>",
+        ),
+        card.replace("<h2>", "<h2>Sponsored</h2><h2>", 1),
+        card.replace("<span>Product", "<span>Tom &amp; Jerry&nbsp;Product", 1),
+        card.replace('href="/dp/', 'href="/dp/x?a=1&copy=2&b=', 1),
+        card.replace('href="/dp/', 'href="/dp/x?a=1&amp;b=', 1),
+        card.replace("<h2>", "<h2><!-- comment -->", 1),
+        card.replace("<h2>", "<h2><script>var x = 1;</script>", 1),
+        card.replace("<h2>", "<h2><p>Block</p>", 1),
+        card.replace("<h2>", "<h2><a>Nested", 1).replace("</h2>", "</a></h2>", 1),
+        card.replace('<div data-cy="reviews-block">', '<div data-cy="other">'),
+        card.replace("out of 5 stars", "stars"),
+        card.replace('<span class="a-price">$', '<span class="a-price">', 1),
+        card.replace('<div data-cy="title-recipe">', "<div>"),
+        card.replace("<h2>", '<h2><svg viewBox="0 0 1 1"><path d="M0"/></svg>', 1),
+        card.replace("<div ", "<DIV ", 1),
+        card.replace(' class="a-price"', ' class="a-price" class="x"', 1),
+        card.replace("</span></a></h2>", "</span></h2>", 1),
+        card.replace("<h2>", "<h2>\r\n", 1),
+        card[: len(card) // 2],
+    ]
+
+
+def load_cards(fixture_dir: str) -> list[str]:
+    cards = []
+    for file_name in sorted(os.listdir(fixture_dir)):
+        if not file_name.endswith(".txt") or file_name.count(".") != 1:
+            continue
+        with open(f"{fixture_dir}/{file_name}", "r") as file:
+            try:
+                json_data = preprocess_txt(file.read())
+            except Exception as e:
+                logging.warning(f"Skipping unreadable page {file_name}: {e}")
+                continue
+        cards.extend(record["html"] for record in json_data["data"])
+    return cards
+
+
+def get_outcome(extract: Callable[[str], Any], html: str) -> Any:
+    # Errors count as results, the reference failing a page is behavior too
+    try:
+        return extract(html)
+    except Exception as e:
+        return ("error", type(e).__name__)
+
+
+def compare(cards: list[str], max_reported: int) -> int:
+    num_of_fast = 0
+    num_of_mismatches = 0
+    for index, html in enumerate(cards):
+        expected = get_outcome(extract_card_bs4, html)
+        actual = get_outcome(extract_card, html)
+        try:
+            extract_card_fast(html)
+            num_of_fast += 1
+        except (Unsupported, ValueError):
+            pass
+
+        if expected == actual:
+            continue
+
+        num_of_mismatches += 1
+        if num_of_mismatches > max_reported:
+            continue
+        print(f"card {index}:")
+        if isinstance(expected, dict) and isinstance(actual, dict):
+            for field in CARD_FIELDS:
+                if expected[field] != actual[field]:
+                    print(f"  {field}: {expected[field]!r} != {actual[field]!r}")
+        else:
+            print(f"  {expected!r} != {actual!r}")
+
+    print(
+        f"cards {len(cards)}  fast path {num_of_fast} "
+        + f"({num_of_fast / max(len(cards), 1) * 100:.1f}%)  "
+        + f"mismatches {num_of_mismatches}"
+    )
+    return num_of_mismatches
+
+
+def time_extractor(
+    extract: Callable[[str], Any], cards: list[str], repeat: int
+) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in cards:
+            get_outcome(extract, html)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    logging.disable(logging.WARNING)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixture_dir = args.fixture_dir
+        if not fixture_dir:
+            fixture_dir = f"{tmp_dir}/fixtures"
+            os.makedirs(fixture_dir)
+            make_fixtures(fixture_dir, args.categories, args.max_pages, 48, rng)
+        cards = load_cards(fixture_dir)
+
+    if not args.fixture_dir:
+        cards.extend(make_edge_cards(rng))
+
+    num_of_mismatches = compare(cards, args.max_reported)
+
+    bs4_time = time_extractor(extract_card_bs4, cards, args.repeat)
+    fast_time = time_extractor(extract_card, cards, args.repeat)
+    print(
+        f"bs4 {bs4_time:.3f} s  fast {fast_time:.3f} s  "
+        + f"speedup {bs4_time / max(fast_time, 1e-9):.1f}x"
+    )
+
+    sys.exit(1 if num_of_mismatches else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # Recorded responses, synthetic cards and the edge cases without one
+    parser.add_argument("--fixture_dir", type=str, default=None)
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--max_pages", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max_reported", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args)
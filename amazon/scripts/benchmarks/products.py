@@ -0,0 +1,318 @@
+import os
+import re
+import sys
+
+# engine.py imports from the scripts/products package marker
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../products")
+)
+
+import __init__
+
+import json
+import time
+import uuid
+import random
+import logging
+import asyncio
+import argparse
+import tempfile
+
+from collections import Counter
+from typing import Optional
+from shared.models.category import Category
+from engine import PRESETS, ProductEngine, RawTextSink, SegmentSink, EngineConfig
+from scheduler import largest_first, load_estimates
+from asin_index import AsinIndex
+
+# Replays the same recorded pages through every preset. Fixtures are raw
+# responses named "{category name}-{page}.txt", which is what the v1 preset
+# (RawTextSink) writes, so any v1 run doubles as a recording. Without a
+# fixture directory a synthetic one is generated
+
+
+def make_card(asin: str, rng: random.Random) -> str:
+    price = rng.randint(100, 50000) / 100
+    return (
+        f'<div data-uuid="{uuid.UUID(int=rng.getrandbits(128))}">'
+        + '<div data-cy="title-recipe">'
+        + f'<h2><a href="/dp/{asin}"><span>Product {asin}</span></a></h2></div>'
+        + '<div data-cy="reviews-block">'
+        + '<div class="a-row a-size-small">'
+        + f'<i data-cy="reviews-ratings-slot">{rng.randint(10, 50) / 10} out of 5 stars</i>'
+        + f'<a class="a-size-base s-underline-text">{rng.randint(0, 90000):,}</a></div>'
+        + '<div class="a-row a-size-base">'
+        + f'<span class="a-size-base a-color-secondary">{rng.randint(1, 9)}K+ bought in past month</span>'
+        + "</div></div>"
+        + '<div data-cy="price-recipe"><div>'
+        + f'<span class="a-price">${price:,.2f}${price:,.2f}</span>'
+        + "</div></div></div>"
+    )
+
+
+def make_page(asins: list[str], total_count: int, rng: random.Random) -> str:
+    records = [
+        [
+            "dispatch",
+            "data-search-metadata",
+            {
+                "metadata": {
+                    "asinOnPageCount": len(asins),
+                    "totalResultCount": total_count,
+                }
+            },
+        ]
+    ]
+    for i, asin in enumerate(asins):
+        records.append(
+            [
+                "dispatch",
+                f"data-main-slot:search-result-{i}",
+                {"asin": asin, "index": i, "html": make_card(asin, rng)},
+            ]
+        )
+    return "&&&\n".join(json.dumps(record) for record in records) + "&&&\n"
+
+
+def make_fixtures(
+    fixture_dir: str,
+    num_of_categories: int,
+    max_pages: int,
+    page_size: int,
+    rng: random.Random,
+) -> list[Category]:
+    # Categories share a pool of asins, like nested categories do
+    asin_pool = [f"B{i:09d}" for i in range(num_of_categories * page_size * 4)]
+    categories = []
+    for i in range(num_of_categories):
+        name = f"Category {i}"
+        num_of_pages = rng.randint(1, max_pages)
+        total_count = (num_of_pages - 1) * page_size + rng.randint(1, page_size)
+        for page in range(1, num_of_pages + 2):
+            in_page_count = min(page_size, max(total_count - (page - 1) * page_size, 0))
+            asins = rng.sample(asin_pool, in_page_count)
+            with open(f"{fixture_dir}/{name}-{page}.txt", "w") as file:
+                file.write(make_page(asins, total_count, rng))
+        categories.append(
+            Category(
+                id=uuid.UUID(int=rng.getrandbits(128)),
+                name=name,
+                depth=1,
+                url=f"https://amazon.com/s?rh=n%3A{1000 + i}&fs=true",
+                path=name,
+            )
+        )
+    return categories
+
+
+def load_categories(fixture_dir: str) -> list[Category]:
+    names = {
+        file_name.rsplit("-", 1)[0]
+        for file_name in os.listdir(fixture_dir)
+        if file_name.endswith(".txt") and file_name.count(".") == 1
+    }
+    return [
+        Category(
+            id=uuid.uuid5(uuid.NAMESPACE_URL, name),
+            name=name,
+            depth=1,
+            url="https://amazon.com/s?k=x",
+            path=name,
+        )
+        for name in sorted(names)
+    ]
+
+
+class FixturePageFetcher:
+    # Stands in for HttpPageFetcher, `latency` simulates the round trip so the
+    # concurrent and the sequential rotation policies can be told apart
+    def __init__(self, fixture_dir: str, latency: float = 0.0):
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self.num_of_requests = 0
+        self.num_of_sessions = 0
+
+    async def open_session(self, previous, rotate_cookies: bool):
+        self.num_of_sessions += 1
+        return None
+
+    async def close_session(self, session):
+        pass
+
+    async def close(self):
+        pass
+
+    def get_limit_keys(self, session) -> dict[str, Optional[str]]:
+        return {}
+
+    async def fetch(
+        self, session, category: Category, page: int, url: str
+    ) -> tuple[Optional[str], bool, int]:
+        self.num_of_requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        file_path = f"{self.fixture_dir}/{category.name}-{page}.txt"
+        if not os.path.isfile(file_path):
+            return None, False, 404
+        with open(file_path, "r") as file:
+            return file.read(), True, 200
+
+
+def prepare(
+    config: EngineConfig,
+    out_dir: str,
+    keep_rate_limits: bool,
+    pages_in_flight: int = 1,
+    parse_workers: Optional[int] = None,
+    is_segmented: bool = False,
+    has_asin_index: bool = False,
+) -> EngineConfig:
+    if is_segmented and config.name != "v1":
+        config.sink = SegmentSink(run_id=config.sink.run_id)
+    config.sink.data_dir = out_dir
+    if isinstance(config.sink, RawTextSink):
+        config.sink.out_dir = out_dir
+    config.overwrite = True
+    if not keep_rate_limits:
+        config.rate_limits = None
+    if not config.rotation.concurrent:
+        config.pages_in_flight = pages_in_flight
+    config.parse_workers = parse_workers
+    if has_asin_index:
+        config.asin_index = AsinIndex(f"{out_dir}/asin_index")
+    config.progress_path = f"{out_dir}/progress.json"
+    return config
+
+
+async def run_preset(
+    name: str,
+    categories: list[Category],
+    fixture_dir: str,
+    out_dir: str,
+    latency: float,
+    keep_rate_limits: bool,
+    pages_in_flight: int,
+    is_largest_first: bool,
+    is_verbose: bool = False,
+    parse_workers: Optional[int] = None,
+    is_segmented: bool = False,
+    has_asin_index: bool = False,
+):
+    config = prepare(
+        PRESETS[name](),
+        out_dir,
+        keep_rate_limits,
+        pages_in_flight,
+        parse_workers,
+        is_segmented,
+        has_asin_index,
+    )
+    if is_largest_first and os.path.exists(config.progress_path):
+        # Sizes seen by the previous repeat
+        config.category_priority = largest_first(load_estimates(config.progress_path))
+    fetcher = FixturePageFetcher(fixture_dir, latency)
+    engine = ProductEngine(config, fetcher)
+
+    start = time.perf_counter()
+    runs = await engine.process_categories(categories)
+    elapsed = time.perf_counter() - start
+    # What the run left on disk, the progress file aside
+    out_files = [
+        f"{out_dir}/{file_name}"
+        for file_name in os.listdir(out_dir)
+        if file_name not in {"progress.json", "asin_index"}
+    ]
+    out_size = sum(os.path.getsize(file_path) for file_path in out_files)
+
+    # "exceeded product cap (96/70)" and "exceeded product cap (83/70)" alike
+    reasons = Counter(re.sub(r" \(.*\)$", "", run.stop_reason) for run in runs)
+    label = f"{name} k={config.pages_in_flight} p={parse_workers}"
+    print(
+        f"{label:<15} {elapsed:8.2f} s  requests {fetcher.num_of_requests:6d}  "
+        + f"sessions {fetcher.num_of_sessions:5d}  "
+        + f"pages {sum(run.num_of_pages for run in runs):6d}  "
+        + f"products {sum(run.num_of_products for run in runs):8d}  "
+        + f"files {len(out_files):6d} ({out_size / (1 << 20):.1f} MB)"
+    )
+    for reason, count in reasons.most_common():
+        print(f"     {count:6d} x {reason}")
+    if is_verbose and config.progress_path:
+        with open(config.progress_path, "r") as file:
+            for stage, metrics in json.load(file)["metrics"].items():
+                print(f"     {stage}: {json.dumps(metrics)}")
+
+
+async def main(args):
+    logging.disable(logging.WARNING)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixture_dir = args.fixture_dir
+        if fixture_dir:
+            categories = load_categories(fixture_dir)
+        else:
+            fixture_dir = f"{tmp_dir}/fixtures"
+            os.makedirs(fixture_dir)
+            categories = make_fixtures(
+                fixture_dir, args.categories, args.max_pages, args.page_size, rng
+            )
+
+        print(f"categories={len(categories)} latency={args.latency}s")
+        # "default" leaves the preset's parse workers (one per core)
+        parse_workers_list = [
+            None if value == "default" else int(value)
+            for value in args.parse_workers.split(",")
+        ]
+        for name in args.presets.split(","):
+            for pages_in_flight in map(int, args.pages_in_flight.split(",")):
+                if pages_in_flight > 1 and PRESETS[name]().rotation.concurrent:
+                    continue
+
+                for parse_workers in parse_workers_list:
+                    out_dir = f"{tmp_dir}/{name}_{pages_in_flight}_{parse_workers}"
+                    os.makedirs(out_dir)
+                    for _ in range(args.repeat):
+                        # A repeated run sees the pages of the previous one
+                        await run_preset(
+                            name,
+                            categories,
+                            fixture_dir,
+                            out_dir,
+                            args.latency,
+                            args.keep_rate_limits,
+                            pages_in_flight,
+                            args.largest_first,
+                            args.verbose,
+                            parse_workers,
+                            args.segmented,
+                            args.asin_index,
+                        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture_dir", type=str, default=None)
+    parser.add_argument("--presets", type=str, default=",".join(PRESETS))
+    parser.add_argument("--categories", type=int, default=40)
+    parser.add_argument("--max_pages", type=int, default=20)
+    parser.add_argument("--page_size", type=int, default=48)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--repeat", type=int, default=1)
+    # Sliding window sizes tried on the sequential presets
+    parser.add_argument("--pages_in_flight", type=str, default="1")
+    # Parse worker counts to try, 0 parses in a thread of the scraper
+    parser.add_argument("--parse_workers", type=str, default="default")
+    parser.add_argument("--keep_rate_limits", action="store_true")
+    # Repeats start with the largest categories of the previous run
+    parser.add_argument("--largest_first", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    # Pages go to compressed segments instead of a JSON file each (v2-v4)
+    parser.add_argument("--segmented", action="store_true")
+    # Seen asins come from an ASIN index instead of the pages of the last run
+    parser.add_argument("--asin_index", action="store_true")
+    # Prints the stage metrics of the progress file after each run
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
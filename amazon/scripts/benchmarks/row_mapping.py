@@ -0,0 +1,111 @@
+import __init__
+
+import uuid
+import timeit
+import argparse
+
+from fastapi.encoders import jsonable_encoder
+from pydantic_core import to_json
+from shared.models.category import Category
+from shared.storages.row_mapping import categories_from_rows
+
+
+def make_rows(num_of_rows: int) -> list[dict]:
+    # Plain dicts stand in for asyncpg records, both are read with row["column"]
+    rows = []
+    for i in range(num_of_rows):
+        depth = i % 6
+        rows.append(
+            {
+                "id": uuid.uuid4(),
+                "name": f"Category {i}",
+                "depth": depth,
+                "ancestor": f"Root {i % 40}" if depth else None,
+                "parent": f"Category {i - 1}" if depth else f"Category {i}",
+                "path": "/".join(f"Category {i - k}" for k in range(depth, -1, -1)),
+                "url": f"https://www.amazon.com/s?rh=n%3A{1000000 + i}",
+                "is_leaf": depth == 5,
+                "node_id": 1000000 + i,
+                "parent_node_id": 1000000 + i - 1 if depth else None,
+                "natural_key": f"node:{1000000 + i}",
+            }
+        )
+    return rows
+
+
+def constructed(rows: list[dict]) -> list[Category]:
+    return [
+        Category.model_construct(
+            id=row["id"],
+            name=row["name"],
+            depth=row["depth"],
+            ancestor=row["ancestor"],
+            parent=row["parent"],
+            path=row["path"],
+            url=row["url"],
+            is_leaf=row["is_leaf"],
+            node_id=row["node_id"],
+            parent_node_id=row["parent_node_id"],
+        )
+        for row in rows
+    ]
+
+
+def validated(rows: list[dict]) -> list[Category]:
+    return [
+        Category(
+            id=row["id"],
+            name=row["name"],
+            depth=row["depth"],
+            ancestor=row["ancestor"],
+            parent=row["parent"],
+            path=row["path"],
+            url=row["url"],
+            is_leaf=row["is_leaf"],
+            node_id=row["node_id"],
+            parent_node_id=row["parent_node_id"],
+        )
+        for row in rows
+    ]
+
+
+def report(label: str, seconds: float, num_of_rows: int):
+    print(
+        f"{label:<36} {seconds * 1000:9.2f} ms total "
+        + f"{seconds / num_of_rows * 1e6:8.3f} us/row"
+    )
+
+
+def main(num_of_rows: int, repeat: int):
+    rows = make_rows(num_of_rows)
+    categories = categories_from_rows(rows)
+    response = {"request_id": uuid.uuid4(), "categories": categories}
+
+    def best(func):
+        return min(timeit.repeat(func, number=1, repeat=repeat))
+
+    print(f"rows={num_of_rows} repeat={repeat} (best run)")
+    report("map: Category(...) validated", best(lambda: validated(rows)), num_of_rows)
+    report("map: model_construct", best(lambda: constructed(rows)), num_of_rows)
+    report(
+        "map: categories_from_rows",
+        best(lambda: categories_from_rows(rows)),
+        num_of_rows,
+    )
+    report(
+        "serialize: jsonable_encoder",
+        best(lambda: jsonable_encoder(response)),
+        num_of_rows,
+    )
+    report(
+        "serialize: pydantic_core.to_json", best(lambda: to_json(response)), num_of_rows
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    main(args.rows, args.repeat)
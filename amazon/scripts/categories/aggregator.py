@@ -5,71 +5,78 @@ import uuid
 import json
 import logging
 
-from shared.services.category_pool import CategoryPool
+from typing import Iterable, Iterator
 from shared.models.category import Category
+from shared.utils import parse_node_id
 from shared.storages.category.postgresql import PostgreSQLCategoryStorage
 
 OUT_DIR = DEFAULT_DATA_DIR
 
 
-def explore_with_depth(
-    node: dict, name: str, path: str, parent: str, ancestor: str, depth: int = 0
-):
-    innerdata = {
-        "name": name,
-        "parent": parent,
-        "ancestor": ancestor if depth > 0 else None,
-        "is_leaf": False,
-        "depth": depth,
-        "url": node["url"],
-        "path": path,
-        "inner": {},
-    }
-
-    if not node["inner"]:
-        innerdata["is_leaf"] = True
-        return innerdata
-
-    for category in node["inner"]:
-        new_path = f"{path}/{category}"
-        subdata = explore_with_depth(
-            node["inner"][category],
-            category,
-            new_path,
-            innerdata["name"],
-            ancestor,
-            depth + 1,
+def iter_tree(tree: dict, keyword: str, processed: set) -> Iterator[Category]:
+    # Pre-order walk with an explicit stack, children in crawl order. A node
+    # whose node id, or (depth, name) when the URL has none, was already emitted
+    # is skipped with its whole subtree
+    stack = [(tree, keyword, keyword, keyword, None, 0)]
+    while stack:
+        node, name, path, parent, parent_node_id, depth = stack.pop()
+
+        node_id = parse_node_id(node["url"])
+        k = node_id if node_id is not None else (depth, name)
+        if k in processed:
+            continue
+        processed.add(k)
+
+        inner: dict = node["inner"]
+        yield Category(
+            name=name,
+            depth=depth,
+            ancestor=keyword if depth > 0 else None,
+            parent=parent,
+            path=path,
+            url=node["url"],
+            is_leaf=not inner,
+            node_id=node_id,
+            parent_node_id=parent_node_id,
         )
-        innerdata["inner"][category] = subdata
-    return innerdata
 
+        stack.extend(
+            (
+                inner[category],
+                category,
+                f"{path}/{category}",
+                name,
+                node_id,
+                depth + 1,
+            )
+            for category in reversed(inner)
+        )
 
-def process_node(node: dict, processed: set):
-    k = f"[depth={node['depth']}][name={node['name']}]"
-    if k in processed:
-        return []
-
-    processed.add(k)
-
-    if not node:
-        return []
 
-    inner = node["inner"]
+def iter_categories(filenames: list[str]) -> Iterator[Category]:
+    # Only one keyword tree is held in memory at a time
+    processed = set()
+    for filename in filenames:
+        with open(filename, "r", encoding="utf-8") as file:
+            tree = json.load(file)
+        if not tree:
+            logging.warning(f"Skipping empty category tree {filename}")
+            continue
+        yield from iter_tree(tree, tree["path"], processed)
 
-    record = Category(**node)
-    output = [record]
 
-    for category in inner:
-        innerdata = process_node(inner[category], processed)
-        output += innerdata
-    return output
+def dump_categories(categories: Iterable[Category], filename: str):
+    with open(filename, "w", encoding="utf-8") as file:
+        for category in categories:
+            file.write(category.model_dump_json() + "\n")
+            yield category
 
 
 def get_filenames():
     return [
         os.path.join(DEFAULT_DATA_DIR, filename)
         for filename in os.listdir(DEFAULT_DATA_DIR)
-        if ".json" in filename
+        if filename.endswith(".json")
         and "\uf07c" not in filename
         and "|" not in filename
         and "processed" not in filename
@@ -78,49 +85,35 @@ def get_filenames():
     ]
 
 
-async def aggregate():
-    dict_data = {}
-    lst_data = []
-    processed = set()
-
-    for old_filename in get_filenames():
-        new_filename = old_filename.split(".json")[0] + ".processed.json"
-        with open(old_filename, "r", encoding="utf-8") as read_file, open(
-            new_filename, "w"
-        ) as write_file:
-            jsondata = json.load(read_file)
-            category_name = jsondata["path"]
-            processed_jsondata = explore_with_depth(
-                jsondata,
-                category_name,
-                category_name,
-                category_name,
-                category_name,
-            )
-            dict_data[category_name] = processed_jsondata
-            json.dump(
-                processed_jsondata,
-                write_file,
-                indent=2,
-            )
+async def aggregate(dump: bool = False):
+    categories = iter_categories(get_filenames())
+    if dump:
+        categories = dump_categories(
+            categories, os.path.join(DEFAULT_OUT_DIR, "final.ndjson")
+        )
 
-    with open(os.path.join(DEFAULT_OUT_DIR, "final.json"), "w") as file:
-        json.dump(dict_data, file, indent=2)
+    num_of_records = 0
 
-    for category_name in dict_data:
-        ancestor = category_name
-        node = dict_data[ancestor]
-        lst_data += process_node(node, processed)
+    def count(categories: Iterable[Category]):
+        nonlocal num_of_records
+        for category in categories:
+            num_of_records += 1
+            yield category
 
     storage = PostgreSQLCategoryStorage(os.getenv("POSTGRESQL_CONN_STR"))
     await storage.initialize()
-    pool = CategoryPool(storage)
 
-    num_of_records = len(lst_data)
-    success = await pool.replace(lst_data, uuid.uuid4())
+    # Categories are generated while they are copied into the storage. Written
+    # to the storage itself, a CategoryPool would load the whole table back
+    # into its index; the API picks the new version up on its own
+    stats = await storage.replace(count(categories), uuid.uuid4())
 
-    if not success:
+    if stats is None:
         logging.error(f"Failed to ingest {num_of_records} categories")
 
     else:
-        logging.info(f"Successfully ingested {num_of_records} categories")
+        logging.info(
+            f"Successfully ingested {num_of_records} categories "
+            + f"(inserted={stats.inserted}, updated={stats.updated}, "
+            + f"deleted={stats.deleted}, unchanged={stats.unchanged})"
+        )
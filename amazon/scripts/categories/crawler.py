@@ -0,0 +1,750 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import asyncio
+import logging
+import aiofiles
+
+from typing import Any, Optional
+from urllib.parse import urlparse
+from playwright.async_api import Page, Playwright, Browser, BrowserContext
+from shared.utils import parse_node_id
+from shared.models.crawl_unit import CrawlUnit
+from shared.storages.crawl_queue.base import CrawlQueueStorage
+from shared.storages.crawl_queue.postgresql import PostgreSQLCrawlQueueStorage
+
+from scraper import (
+    OUT_DIR,
+    get_cookies,
+    init_browser,
+    extract_sub_categories,
+    get_sub_categories_from_root_categories,
+)
+
+
+class HostLimiter:
+    # Politeness per host: at most `max_concurrency` requests in flight and
+    # consecutive requests spaced by at least `min_interval` seconds
+    def __init__(self, max_concurrency: int = 4, min_interval: float = 0.5):
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._next_slot: dict[str, float] = {}
+
+    async def acquire(self, url: str) -> str:
+        host = urlparse(url).netloc
+        semaphore = self._semaphores.setdefault(
+            host, asyncio.Semaphore(self.max_concurrency)
+        )
+        await semaphore.acquire()
+
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            # A cancelled wait gives the permit back, the limiter outlives the unit
+            try:
+                await asyncio.sleep(slot - now)
+            except BaseException:
+                semaphore.release()
+                raise
+
+        return host
+
+    def release(self, host: str):
+        self._semaphores[host].release()
+
+
+class CrawlTask:
+    __slots__ = ("keyword", "path", "node")
+
+    def __init__(self, keyword: str, path: tuple[str, ...], node: dict):
+        self.keyword = keyword
+        # Category names from the root of the keyword, empty for the root task
+        self.path = path
+        # Node of the nested output, its "inner" is filled in place
+        self.node = node
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.path[-1] if self.path else None
+
+    @property
+    def depth(self) -> int:
+        return len(self.path)
+
+
+def fingerprint(sub_categories: dict[str, Any]) -> str:
+    # Hash of the child set of a page. Child URLs carry per-visit parameters
+    # (ref, qid), so a child is identified by its name and browse node only
+    children = sorted(
+        f"{name}\t{parse_node_id(node['url']) or ''}"
+        for name, node in sub_categories.items()
+    )
+    return hashlib.sha1("\n".join(children).encode("utf-8")).hexdigest()
+
+
+class CrawlJournal:
+    # Append-only JSONL checkpoint of a crawl. Every fetched page is written
+    # as an event with the subcategories it yielded, replaying the events
+    # rebuilds the trees, the explored set and the frontier of an interrupted
+    # crawl. A "done" event closes the journal, the next crawl starts afresh
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._file = None
+
+    def load(self) -> list[dict[str, Any]]:
+        events = []
+        if not os.path.isfile(self.file_path):
+            return events
+
+        valid_size = 0
+        with open(self.file_path, "rb") as file:
+            for line in file:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # Torn write of a killed process, only the tail can be torn
+                    break
+                valid_size += len(line)
+
+        if events and events[-1]["op"] == "done":
+            events, valid_size = [], 0
+        os.truncate(self.file_path, valid_size)
+        return events
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        self._file = open(self.file_path, "a", encoding="utf-8")
+
+    def _write(self, event: dict[str, Any]):
+        # Flushed line by line: a killed process loses at most the event in
+        # flight, which is then fetched again on resume
+        self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def record_root(self, keyword: str, data: dict[str, Any]):
+        self._write({"op": "root", "keyword": keyword, "data": data})
+
+    def record_expand(self, keyword: str, path: tuple[str, ...], inner: dict):
+        self._write(
+            {"op": "expand", "keyword": keyword, "path": list(path), "inner": inner}
+        )
+
+    def record_done(self):
+        self._write({"op": "done"})
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class Frontier:
+    # Shared work queue for all keywords. Categories are deduplicated by browse
+    # node id across keywords, the aggregator keeps only the first occurrence of
+    # a node anyway. Links without a node id fall back to the name per keyword,
+    # like the explored set of the depth-first scraper, and all by URL
+    def __init__(self):
+        self._queue: asyncio.Queue[CrawlTask] = asyncio.Queue()
+        self._seen_node_ids: set[int] = set()
+        self._seen_names: dict[str, set[str]] = {}
+        self._seen_urls: dict[str, set[str]] = {}
+
+    def register_root(
+        self, keyword: str, node: dict, path: tuple[str, ...] = ()
+    ) -> CrawlTask:
+        self._seen_names.setdefault(keyword, set())
+        self._seen_urls.setdefault(keyword, set())
+        return CrawlTask(keyword, path, node)
+
+    def register_children(
+        self, task: CrawlTask, sub_categories: dict[str, Any]
+    ) -> list[CrawlTask]:
+        seen_names = self._seen_names[task.keyword]
+        seen_urls = self._seen_urls[task.keyword]
+
+        tasks = []
+        for name, node in sub_categories.items():
+            node_id = parse_node_id(node["url"])
+            if node_id is not None:
+                if node_id in self._seen_node_ids:
+                    logging.info(f"{name} (node {node_id}) already explored -> ignore")
+                    continue
+                self._seen_node_ids.add(node_id)
+            else:
+                if name in seen_names:
+                    logging.info(f"{name} found in explored categories -> ignore")
+                    continue
+                seen_names.add(name)
+
+            if node["url"] in seen_urls:
+                continue
+            seen_urls.add(node["url"])
+
+            tasks.append(CrawlTask(task.keyword, task.path + (name,), node))
+
+        return tasks
+
+    def put(self, task: CrawlTask):
+        self._queue.put_nowait(task)
+
+    async def get(self) -> CrawlTask:
+        return await self._queue.get()
+
+    def task_done(self):
+        self._queue.task_done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def join(self):
+        await self._queue.join()
+
+
+class PlaywrightFetcher:
+    # One page per worker, pages are spread over a few browser contexts which
+    # all carry the same cookie set
+    def __init__(self, is_headless: bool, browser_type_str: str, num_contexts: int):
+        self.is_headless = is_headless
+        self.browser_type_str = browser_type_str
+        self.num_contexts = max(1, num_contexts)
+        self._playwright: Playwright = None
+        self._browser: Browser = None
+        self._contexts: list[BrowserContext] = []
+        self._num_of_pages = 0
+
+    async def start(self):
+        (cookies, _), _ = await get_cookies()
+        self._playwright, self._browser, context = await init_browser(
+            self.is_headless, self.browser_type_str, cookies
+        )
+        self._contexts.append(context)
+        for _ in range(self.num_contexts - 1):
+            context = await self._browser.new_context()
+            if cookies and isinstance(cookies, list):
+                await context.add_cookies(cookies)
+            self._contexts.append(context)
+
+    async def open_worker(self) -> Page:
+        context = self._contexts[self._num_of_pages % len(self._contexts)]
+        self._num_of_pages += 1
+        return await context.new_page()
+
+    async def close_worker(self, page: Page):
+        await page.close()
+
+    async def fetch_root(self, page: Page, keyword: str) -> dict[str, Any]:
+        return await get_sub_categories_from_root_categories(
+            self._playwright, self._browser, page.context, page, keyword
+        )
+
+    async def fetch_sub_categories(
+        self, page: Page, url: str, category_name: str
+    ) -> dict[str, Any]:
+        await page.goto(url, timeout=0, wait_until="domcontentloaded")
+        return await extract_sub_categories(page, category_name)
+
+    async def close(self):
+        logging.info("Gracefully cleaning up Playwright remnants...")
+        if self._browser:
+            await self._browser.close()
+        if self._playwright:
+            await self._playwright.stop()
+
+
+class CategoryCrawler:
+    # Breadth-first crawl of several category trees at once. Every worker owns
+    # one page of the fetcher and pulls from the shared frontier, so the wall
+    # time scales with the pool size instead of tree size * page latency.
+    # The output has the same nested shape as `scraper.process_keyword`; when a
+    # category shows up twice, the occurrence closest to the root is the one
+    # that gets explored.
+    #
+    # Every expanded node keeps the fingerprint of its child set. Given the trees
+    # of the previous crawl, a page whose fingerprint did not change gets its old
+    # subtree back instead of having its children fetched again. Keyword trees
+    # older than `full_refresh_interval` seconds are walked in full, None
+    # disables the incremental mode
+    def __init__(
+        self,
+        fetcher,
+        num_workers: int = 4,
+        host_limiter: HostLimiter = None,
+        journal: CrawlJournal = None,
+        previous_trees: Optional[dict[str, dict[str, Any]]] = None,
+        full_refresh_interval: Optional[float] = None,
+        max_pages: Optional[int] = None,
+    ):
+        self.fetcher = fetcher
+        self.num_workers = max(1, num_workers)
+        self.host_limiter = host_limiter or HostLimiter()
+        self.journal = journal
+        self.frontier = Frontier()
+        self.trees: dict[str, dict[str, Any]] = {}
+        self.previous_trees = previous_trees or {}
+        self.full_refresh_interval = full_refresh_interval
+        self._refreshed_at: dict[str, float] = {}
+        # Page budget of a queue unit, the tasks left over are handed back
+        self.max_pages = max_pages
+        self.deferred: list[CrawlTask] = []
+        self._num_of_started = 0
+        self._num_of_fetched = 0
+        self._num_of_reused = 0
+
+    def _select_previous_trees(self, keywords: list[str]):
+        now = time.time()
+        for keyword in keywords:
+            previous = self.previous_trees.get(keyword) or {}
+            refreshed_at = previous.get("refreshed_at")
+            if (
+                self.full_refresh_interval is None
+                or refreshed_at is None
+                or now - refreshed_at >= self.full_refresh_interval
+            ):
+                self.previous_trees.pop(keyword, None)
+                self._refreshed_at[keyword] = now
+                logging.info(f"[{keyword}] Full refresh of the category tree")
+            else:
+                self._refreshed_at[keyword] = refreshed_at
+                logging.info(f"[{keyword}] Incremental crawl of the category tree")
+
+    def _get_previous_node(self, task: CrawlTask) -> Optional[dict[str, Any]]:
+        node = self.previous_trees.get(task.keyword)
+        for name in task.path:
+            if not node:
+                return None
+            node = node.get("inner", {}).get(name)
+        return node
+
+    def _reuse_unchanged(self, task: CrawlTask, sub_categories: dict[str, Any]):
+        # Same child set as last time: the previous subtree replaces the fresh,
+        # unexpanded children
+        previous = self._get_previous_node(task)
+        fp = fingerprint(sub_categories)
+        if previous and previous.get("fingerprint") == fp:
+            sub_categories = previous["inner"]
+        return sub_categories, fp
+
+    def _schedule(self, task: CrawlTask):
+        # Until its page is fetched again a node keeps its previous subtree, so
+        # the dump of an interrupted crawl is still a complete baseline
+        previous = self._get_previous_node(task) if task.path else None
+        if previous and "fingerprint" in previous:
+            task.node["inner"] = previous["inner"]
+            task.node["fingerprint"] = previous["fingerprint"]
+        self.frontier.put(task)
+
+    def _expand(self, task: CrawlTask, sub_categories: dict[str, Any], schedule) -> int:
+        # Registers the children of a page with the frontier. Children carrying
+        # a fingerprint were expanded by the previous crawl, their subtrees are
+        # registered in turn, the rest is handed to `schedule` to be fetched
+        num_of_scheduled = 0
+        stack = [(task, sub_categories)]
+        while stack:
+            parent, inner = stack.pop()
+            children = self.frontier.register_children(parent, inner)
+
+            accepted = {id(child.node) for child in children}
+            for node in inner.values():
+                if id(node) not in accepted and "fingerprint" in node:
+                    # Explored through another path of this crawl
+                    node["inner"] = {}
+                    del node["fingerprint"]
+
+            for child in children:
+                if "fingerprint" in child.node:
+                    self._num_of_reused += 1
+                    stack.append((child, child.node["inner"]))
+                else:
+                    schedule(child)
+                    num_of_scheduled += 1
+
+        return num_of_scheduled
+
+    async def _process(self, worker, task: CrawlTask):
+        if self.max_pages is not None and self._num_of_started >= self.max_pages:
+            self.deferred.append(task)
+            return
+        self._num_of_started += 1
+
+        if task.name is None:
+            logging.info(f"Preparing root categories of {task.keyword}")
+            data = await self.fetcher.fetch_root(worker, task.keyword)
+            if not data:
+                return
+            data["inner"], fp = self._reuse_unchanged(task, data["inner"])
+            task.node.update(data)
+            task.node["fingerprint"] = fp
+            task.node["refreshed_at"] = self._refreshed_at[task.keyword]
+            sub_categories = data["inner"]
+            if self.journal:
+                self.journal.record_root(task.keyword, data)
+        else:
+            url = task.node["url"]
+            logging.info(f"(category_name, url) = ({task.name}, {url})")
+            host = await self.host_limiter.acquire(url)
+            try:
+                sub_categories = await self.fetcher.fetch_sub_categories(
+                    worker, url, task.name
+                )
+            finally:
+                self.host_limiter.release(host)
+            sub_categories, fp = self._reuse_unchanged(task, sub_categories)
+            task.node["inner"] = sub_categories
+            task.node["fingerprint"] = fp
+            if self.journal:
+                self.journal.record_expand(task.keyword, task.path, sub_categories)
+
+        self._num_of_fetched += 1
+        num_of_added = self._expand(task, sub_categories, self._schedule)
+        logging.info(
+            f"[{task.keyword}] depth={task.depth} {task.name or task.keyword}: "
+            + f"{num_of_added} new, {self.frontier.qsize()} queued, "
+            + f"{self._num_of_fetched} fetched, {self._num_of_reused} reused"
+        )
+
+    async def _work(self, worker_id: int):
+        worker = await self.fetcher.open_worker()
+        try:
+            while True:
+                task = await self.frontier.get()
+                try:
+                    await self._process(worker, task)
+                except Exception as e:
+                    logging.error(
+                        f"[worker={worker_id}] Error exploring "
+                        + f"{task.name or task.keyword} of {task.keyword}: {e}"
+                    )
+                finally:
+                    self.frontier.task_done()
+        finally:
+            await self.fetcher.close_worker(worker)
+
+    def _restore(self, keywords: list[str], events: list[dict[str, Any]]):
+        # Runs the frontier bookkeeping over the journaled pages without
+        # fetching anything, whatever is still pending afterwards is enqueued
+        pending: dict[tuple[str, tuple[str, ...]], CrawlTask] = {}
+        for keyword in keywords:
+            self.trees[keyword] = {}
+            task = self.frontier.register_root(keyword, self.trees[keyword])
+            pending[(keyword, ())] = task
+
+        def schedule(child: CrawlTask):
+            pending[(child.keyword, child.path)] = child
+
+        for event in events:
+            if event["op"] == "root":
+                task = pending.pop((event["keyword"], ()), None)
+                if task is None:
+                    continue
+                task.node.update(event["data"])
+                task.node["refreshed_at"] = self._refreshed_at[task.keyword]
+            elif event["op"] == "expand":
+                task = pending.pop((event["keyword"], tuple(event["path"])), None)
+                if task is None:
+                    continue
+                task.node["inner"] = event["inner"]
+            else:
+                continue
+            task.node["fingerprint"] = fingerprint(task.node["inner"])
+            self._num_of_fetched += 1
+            self._expand(task, task.node["inner"], schedule)
+
+        for task in pending.values():
+            self._schedule(task)
+
+        if events:
+            logging.info(
+                f"Resumed crawl from {self.journal.file_path}: {len(events)} pages "
+                + f"journaled, {len(pending)} queued"
+            )
+
+    async def crawl(self, keywords: list[str]) -> dict[str, dict[str, Any]]:
+        events = []
+        if self.journal:
+            events = self.journal.load()
+            self.journal.open()
+        self._select_previous_trees(keywords)
+        self._restore(keywords, events)
+
+        try:
+            await self._run_workers()
+            if self.journal:
+                self.journal.record_done()
+        finally:
+            if self.journal:
+                self.journal.close()
+
+        logging.info(
+            f"Crawled {len(keywords)} category trees: {self._num_of_fetched} pages "
+            + f"fetched, {self._num_of_reused} categories reused unchanged"
+        )
+        return self.trees
+
+    async def crawl_unit(
+        self, keyword: str, path: tuple[str, ...] = (), url: Optional[str] = None
+    ) -> tuple[dict[str, Any], list[CrawlTask]]:
+        # Crawls the subtree below `path` of a keyword, the whole keyword tree for
+        # an empty path. With a page budget, whatever is still queued when it
+        # runs out is returned next to the subtree instead of being fetched
+        self._select_previous_trees([keyword])
+        node = {"url": url, "inner": {}} if path else {}
+        if not path:
+            self.trees[keyword] = node
+        self.frontier.put(self.frontier.register_root(keyword, node, path))
+
+        await self._run_workers()
+
+        if "fingerprint" not in node:
+            raise Exception(f"Could not fetch {'/'.join((keyword,) + path)}")
+
+        logging.info(
+            f"[{keyword}] Crawled {'/'.join(path) or 'root'}: "
+            + f"{self._num_of_fetched} pages fetched, {len(self.deferred)} deferred"
+        )
+        return node, self.deferred
+
+    async def _run_workers(self):
+        workers = [
+            asyncio.create_task(self._work(i), name=f"crawler worker {i}")
+            for i in range(self.num_workers)
+        ]
+        join = asyncio.create_task(self.frontier.join())
+        try:
+            # Workers only return on an error, e.g. when no worker could be
+            # opened. Without any left the frontier would never drain
+            pending = {join, *workers}
+            while not join.done():
+                _, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not join.done() and pending == {join}:
+                    errors = [
+                        worker.exception()
+                        for worker in workers
+                        if not worker.cancelled() and worker.exception()
+                    ]
+                    if errors:
+                        raise errors[0]
+                    raise Exception("Every crawler worker exited")
+        finally:
+            join.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(join, *workers, return_exceptions=True)
+
+
+async def dump_category_trees(trees: dict[str, dict[str, Any]], keywords: list[str]):
+    for keyword in keywords:
+        filename = f"{OUT_DIR}/{keyword}.json"
+        async with aiofiles.open(filename, "w", encoding="utf-8") as file:
+            json_data = await asyncio.to_thread(
+                json.dumps, obj=trees.get(keyword, {}), ensure_ascii=False, indent=2
+            )
+            await file.write(json_data)
+            logging.info(f"Done dumping category tree of {keyword} to {filename}")
+
+    filename = OUT_DIR + "/" + " | ".join(keywords) + ".aggregated.json"
+    async with aiofiles.open(filename, "w", encoding="utf-8") as file:
+        json_data = await asyncio.to_thread(
+            json.dumps, obj=trees, ensure_ascii=False, indent=2
+        )
+        await file.write(json_data)
+        logging.info(f"Done dumping all keywords to {filename}")
+
+
+def load_category_trees(keywords: list[str]) -> dict[str, dict[str, Any]]:
+    # Trees dumped by the previous crawl, the baseline of an incremental crawl
+    trees = {}
+    for keyword in keywords:
+        filename = f"{OUT_DIR}/{keyword}.json"
+        try:
+            with open(filename, "r", encoding="utf-8") as file:
+                tree = json.load(file)
+        except FileNotFoundError:
+            continue
+        except ValueError as e:
+            logging.warning(f"Ignoring unreadable category tree {filename}: {e}")
+            continue
+        if tree:
+            trees[keyword] = tree
+    return trees
+
+
+def get_journal_path(keywords: list[str]) -> str:
+    # Keyword batches make for file names longer than the OS allows
+    batch_id = hashlib.sha1(" | ".join(keywords).encode("utf-8")).hexdigest()[:12]
+    return f"{OUT_DIR}/crawl-{batch_id}.journal.jsonl"
+
+
+async def crawl_category_tree(
+    fetcher,
+    keywords: list[str],
+    num_workers: int = 4,
+    max_per_host: int = 4,
+    min_interval: float = 0.5,
+    journal_path: Optional[str] = None,
+    resume: bool = True,
+    full_refresh_interval: Optional[float] = 7 * 24 * 3600,
+):
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    journal_path = journal_path or get_journal_path(keywords)
+    if not resume and os.path.isfile(journal_path):
+        os.remove(journal_path)
+
+    crawler = CategoryCrawler(
+        fetcher,
+        num_workers,
+        HostLimiter(max_per_host, min_interval),
+        CrawlJournal(journal_path),
+        load_category_trees(keywords) if full_refresh_interval is not None else None,
+        full_refresh_interval,
+    )
+    try:
+        await fetcher.start()
+        await crawler.crawl(keywords)
+    finally:
+        await fetcher.close()
+        await dump_category_trees(crawler.trees, keywords)
+
+    return crawler.trees
+
+
+async def keep_unit_alive(
+    queue: CrawlQueueStorage, unit: CrawlUnit, worker_id: str, interval: float
+):
+    # Returns once the lease is lost, the crawl of the unit is then of no use
+    while True:
+        await asyncio.sleep(interval)
+        if not await queue.heartbeat(unit, worker_id):
+            logging.warning(
+                f"[unit_id={unit.id}]: Lease lost, another worker took over"
+            )
+            return
+
+
+async def assemble_trees(
+    queue: CrawlQueueStorage, run_id: str
+) -> dict[str, dict[str, Any]]:
+    # Grafts every finished subtree onto the node it was split off from
+    trees: dict[str, dict[str, Any]] = {}
+    async for keyword, path, result in queue.iter_results(run_id):
+        if not path:
+            trees[keyword] = result
+            continue
+
+        node = trees.get(keyword)
+        for name in path:
+            if not node:
+                break
+            node = node.get("inner", {}).get(name)
+        if not node:
+            logging.warning(f"[{keyword}] No parent for {'/'.join(path)}, skipped")
+            continue
+        node["inner"] = result["inner"]
+        node["fingerprint"] = result["fingerprint"]
+
+    return trees
+
+
+async def crawl_from_queue(
+    fetcher,
+    queue: CrawlQueueStorage,
+    run_id: str,
+    keywords: list[str],
+    num_workers: int = 4,
+    max_per_host: int = 4,
+    min_interval: float = 0.5,
+    max_pages_per_unit: Optional[int] = 200,
+    heartbeat_interval: float = 60.0,
+    poll_interval: float = 10.0,
+):
+    # Any number of processes can run this with the same run id, each one pulls
+    # units until the queue of the run drains. A unit that exceeds its page
+    # budget is split: the part of its frontier left over goes back into the
+    # queue as one unit per category
+    os.makedirs(OUT_DIR, exist_ok=True)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    host_limiter = HostLimiter(max_per_host, min_interval)
+
+    num_of_seeded = await queue.seed(run_id, keywords)
+    logging.info(f"[run_id={run_id}]: {num_of_seeded} keywords seeded")
+
+    try:
+        await fetcher.start()
+        while True:
+            unit = await queue.claim(run_id, worker_id)
+            if unit is None:
+                if await queue.is_drained(run_id):
+                    break
+                # Units still being crawled elsewhere may be split further
+                await asyncio.sleep(poll_interval)
+                continue
+
+            logging.info(
+                f"[run_id={run_id}]: Claimed unit {unit.id} "
+                + f"{'/'.join([unit.keyword, *unit.path])} (attempt {unit.attempts})"
+            )
+            crawler = CategoryCrawler(
+                fetcher, num_workers, host_limiter, max_pages=max_pages_per_unit
+            )
+            crawl = asyncio.create_task(
+                crawler.crawl_unit(unit.keyword, tuple(unit.path), unit.url)
+            )
+            heartbeat = asyncio.create_task(
+                keep_unit_alive(queue, unit, worker_id, heartbeat_interval)
+            )
+            try:
+                await asyncio.wait(
+                    {crawl, heartbeat}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                for task in (crawl, heartbeat):
+                    if not task.done():
+                        task.cancel()
+                await asyncio.gather(crawl, heartbeat, return_exceptions=True)
+
+            if crawl.cancelled():
+                logging.warning(f"[unit_id={unit.id}]: Dropped the crawl of the unit")
+                continue
+            try:
+                node, deferred = crawl.result()
+            except Exception as e:
+                logging.error(f"[unit_id={unit.id}]: Error crawling unit: {e}")
+                if not await queue.fail(unit, worker_id, str(e)):
+                    logging.warning(f"[unit_id={unit.id}]: Could not mark unit failed")
+                continue
+
+            if not await queue.complete(
+                unit,
+                worker_id,
+                node,
+                [(list(task.path), task.node["url"]) for task in deferred],
+            ):
+                # The lease went to another worker, which stores its own result
+                logging.warning(f"[unit_id={unit.id}]: Result of the unit was dropped")
+                continue
+            stats = await queue.get_stats(run_id)
+            logging.info(
+                f"[run_id={run_id}]: {stats.done} units done, {stats.pending} "
+                + f"pending, {stats.claimed} claimed, {stats.failed} failed"
+            )
+    finally:
+        await fetcher.close()
+
+    trees = await assemble_trees(queue, run_id)
+    await dump_category_trees(trees, keywords)
+    return trees
+
+
+async def crawl_category_queue(fetcher, run_id: str, keywords: list[str], **kwargs):
+    queue = PostgreSQLCrawlQueueStorage(os.getenv("POSTGRESQL_CONN_STR"))
+    await queue.initialize()
+    try:
+        return await crawl_from_queue(fetcher, queue, run_id, keywords, **kwargs)
+    finally:
+        await queue.close()
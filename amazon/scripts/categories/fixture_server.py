@@ -0,0 +1,42 @@
+import __init__
+
+import os
+import argparse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http_fetcher import fixture_key
+
+# Serves pages recorded with `main.py scrape --engine http --record_dir DIR`,
+# point the crawler at it with `--root_url http://127.0.0.1:PORT --no_pool`
+
+
+def make_handler(fixture_dir: str):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            file_path = os.path.join(fixture_dir, f"{fixture_key(self.path)}.html")
+            if not os.path.isfile(file_path):
+                self.send_error(404, "Not recorded")
+                return
+
+            with open(file_path, "rb") as file:
+                body = file.read()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return FixtureHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded category pages.")
+    parser.add_argument("fixture_dir", type=str, help="Directory of recorded pages.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.fixture_dir))
+    print(f"Serving {args.fixture_dir} on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,209 @@
+import os
+import asyncio
+import json
+import hashlib
+import logging
+import aiofiles
+
+from typing import Any, Optional
+from urllib.parse import urlparse, urlencode, parse_qsl
+from selectolax.parser import HTMLParser
+from curl_cffi.requests import AsyncSession
+from scripts.api_client import ApiClient
+
+from scraper import (
+    ROOT_URL,
+    SUB_CATEGORY_SELECTOR,
+    SUB_CATEGORY_NAME_SELECTOR,
+    get_cookies,
+    process_category_url,
+)
+
+
+def fixture_key(url: str) -> str:
+    # Recorded pages are looked up by path and query only, so a recording made
+    # against amazon.com replays from any host. "ref" changes on every visit
+    parsed_url = urlparse(url)
+    qs = sorted((k, v) for k, v in parse_qsl(parsed_url.query) if k != "ref")
+    key = f"{parsed_url.path or '/'}?{urlencode(qs)}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def parse_sub_categories(html: str, root_url: str = ROOT_URL) -> dict[str, Any]:
+    data = {}
+    for item in HTMLParser(html).css(SUB_CATEGORY_SELECTOR):
+        name_element = item.css_first(SUB_CATEGORY_NAME_SELECTOR)
+        category_name = name_element.text(strip=True) if name_element else "No name"
+        href = item.attributes.get("href")
+
+        if href:
+            data[category_name] = {
+                "url": process_category_url(href, root_url),
+                "inner": {},
+            }
+
+    return data
+
+
+def parse_search_alias(html: str, keyword: str) -> Optional[str]:
+    for option in HTMLParser(html).css("#searchDropdownBox option"):
+        if option.text(strip=True) == keyword:
+            value = option.attributes.get("value") or ""
+            return dict(parse_qsl(value)).get("search-alias")
+    return None
+
+
+async def get_proxy():
+    data, status_code = await ApiClient().rotate_proxy()
+
+    proxies: list[str] = [
+        proxy_str for proxy in data["proxies"] for proxy_str in proxy["proxies"]
+    ]
+    proxy_str: Optional[str] = proxies[0] if len(proxies) else None
+
+    return proxy_str, status_code
+
+
+def parse_proxy_str(proxy_str: Optional[str]):
+    if not proxy_str:
+        return None, {}
+
+    proxy_parts = proxy_str.split(":")
+    host, port, username, password = proxy_parts[:4]
+    proxy_url = f"http://{username}:{password}@{host}:{port}"
+
+    headers = {}
+    for part in proxy_parts[4:]:
+        if part.startswith("country-"):
+            headers["X-Country"] = part.split("-")[1]
+        elif part.startswith("session-"):
+            headers["X-Session"] = part.split("-")[1]
+        elif part.startswith("lifetime-"):
+            headers["X-Lifetime"] = part.split("-")[1]
+        elif part.startswith("state-"):
+            headers["X-State"] = part.split("-")[1]
+        elif part.startswith("streaming-"):
+            headers["X-Streaming"] = part.split("-")[1]
+
+    return proxy_url, headers
+
+
+class HttpWorker:
+    __slots__ = ("session", "num_of_requests")
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.num_of_requests = 0
+
+
+class HttpFetcher:
+    # Category pages are plain search result pages, the subcategory links are in
+    # the server-rendered HTML, so no browser is needed to walk the tree.
+    # Each worker has its own session with a pooled cookie set and proxy, which
+    # are rotated every `rotate_every` requests or after a failed request
+    def __init__(
+        self,
+        root_url: str = ROOT_URL,
+        use_pool: bool = True,
+        rotate_every: int = 50,
+        record_dir: Optional[str] = None,
+        timeout: float = 30.0,
+    ):
+        self.root_url = root_url.rstrip("/")
+        self.use_pool = use_pool
+        self.rotate_every = rotate_every
+        self.record_dir = record_dir
+        self.timeout = timeout
+
+    async def start(self):
+        if self.record_dir:
+            os.makedirs(self.record_dir, exist_ok=True)
+
+    async def _new_session(self) -> AsyncSession:
+        cookies: dict[str, str] = {}
+        proxies: dict[str, str] = {}
+        headers: dict[str, str] = {}
+
+        if self.use_pool:
+            ((cookie_list, _), _), (proxy_str, _) = await asyncio.gather(
+                get_cookies(), get_proxy()
+            )
+            cookies = {cookie["name"]: cookie["value"] for cookie in cookie_list}
+            proxy, headers = parse_proxy_str(proxy_str)
+            proxies = {} if not proxy else {"http": proxy, "https": proxy}
+
+        return AsyncSession(
+            cookies=cookies,
+            headers=headers,
+            proxies=proxies,
+            impersonate="chrome",
+            timeout=self.timeout,
+        )
+
+    async def _rotate(self, worker: HttpWorker):
+        # The new session is opened first, if that fails the worker keeps the
+        # old one instead of a closed one
+        session = await self._new_session()
+        old_session, worker.session = worker.session, session
+        worker.num_of_requests = 0
+        await old_session.close()
+
+    async def open_worker(self) -> HttpWorker:
+        return HttpWorker(await self._new_session())
+
+    async def close_worker(self, worker: HttpWorker):
+        await worker.session.close()
+
+    async def _record(self, url: str, html: str):
+        key = fixture_key(url)
+        async with aiofiles.open(
+            f"{self.record_dir}/{key}.html", "w", encoding="utf-8"
+        ) as file:
+            await file.write(html)
+        async with aiofiles.open(
+            f"{self.record_dir}/index.jsonl", "a", encoding="utf-8"
+        ) as file:
+            await file.write(json.dumps({"key": key, "url": url}) + "\n")
+
+    async def _get(self, worker: HttpWorker, url: str) -> tuple[str, str]:
+        if self.rotate_every and worker.num_of_requests >= self.rotate_every:
+            await self._rotate(worker)
+        worker.num_of_requests += 1
+
+        resp = await worker.session.get(url)
+        if resp.status_code != 200:
+            await self._rotate(worker)
+            raise Exception(f"GET {url} returned {resp.status_code}")
+
+        if self.record_dir:
+            await self._record(url, resp.text)
+
+        return str(resp.url), resp.text
+
+    async def fetch_root(self, worker: HttpWorker, keyword: str) -> dict[str, Any]:
+        _, html = await self._get(worker, f"{self.root_url}/")
+        search_alias = parse_search_alias(html, keyword)
+        if search_alias is None:
+            logging.error(f"No search alias found for {keyword}")
+            return {}
+
+        url = f"{self.root_url}/s?" + urlencode({"k": keyword, "i": search_alias})
+        page_url, html = await self._get(worker, url)
+        return {
+            "path": keyword,
+            "url": page_url,
+            "inner": parse_sub_categories(html, self.root_url),
+        }
+
+    async def fetch_sub_categories(
+        self, worker: HttpWorker, url: str, category_name: str
+    ) -> dict[str, Any]:
+        logging.info(f"Extracting subcategories from {category_name}")
+        _, html = await self._get(worker, url)
+        sub_categories = parse_sub_categories(html, self.root_url)
+        if not sub_categories:
+            logging.info(f"{category_name}: no expected subcategories")
+        return sub_categories
+
+    async def close(self):
+        await ApiClient().close()
@@ -9,6 +9,9 @@ import argparse
 
 from shared.config.logger import safely_start_logger
 from scraper import scrape_category_tree
+from crawler import PlaywrightFetcher, crawl_category_tree, crawl_category_queue
+from http_fetcher import HttpFetcher
+from scraper import ROOT_URL
 from aggregator import aggregate
 
 
@@ -18,7 +21,23 @@ def run_event_loop(loop: asyncio.AbstractEventLoop):
 
 
 def execute_pipeline(
-    is_headless: bool, browser_type: str, batch_size: int, batch_num: int
+    is_headless: bool,
+    browser_type: str,
+    batch_size: int,
+    batch_num: int,
+    engine: str = "bfs",
+    num_pages: int = 4,
+    num_contexts: int = 1,
+    max_per_host: int = 4,
+    min_interval: float = 0.5,
+    root_url: str = ROOT_URL,
+    use_pool: bool = True,
+    record_dir: str = None,
+    journal_path: str = None,
+    resume: bool = True,
+    full_refresh_days: float = 7.0,
+    queue_run_id: str = None,
+    max_pages_per_unit: int = 200,
 ):
     keywords = [
         "Amazon Devices",
@@ -41,6 +60,32 @@ def execute_pipeline(
     if num_of_keywords == 0:
         raise ValueError("List of explorable keywords is empty")
 
+    if queue_run_id:
+        if engine not in ("bfs", "http"):
+            raise ValueError("The crawl queue needs the bfs or http engine")
+
+        # Every process works on all keywords, units are claimed from the queue
+        logging.info(f"Executing pipeline from crawl queue {queue_run_id}")
+        if engine == "bfs":
+            fetcher = PlaywrightFetcher(is_headless, browser_type, num_contexts)
+        else:
+            fetcher = HttpFetcher(root_url, use_pool, record_dir=record_dir)
+        asyncio.run(
+            crawl_category_queue(
+                fetcher,
+                queue_run_id,
+                keywords,
+                num_workers=num_pages,
+                max_per_host=max_per_host,
+                min_interval=min_interval,
+                max_pages_per_unit=max_pages_per_unit,
+            )
+        )
+        return
+
+    if batch_size is None or batch_num is None:
+        raise ValueError("--batch_size and --batch_num are required without --queue")
+
     if batch_size <= 0 or batch_size > num_of_keywords:
         raise ValueError(
             f"Invalid batch size (must be between 1 and {num_of_keywords})"
@@ -59,17 +104,46 @@ def execute_pipeline(
 
     logging.info(f"Executing pipeline to scrape category tree of {keywords_to_process}")
 
-    asyncio.run(
-        scrape_category_tree(
-            is_headless=is_headless,
-            browser_type_str=browser_type,
-            keywords=keywords_to_process,
+    if engine == "dfs":
+        asyncio.run(
+            scrape_category_tree(
+                is_headless=is_headless,
+                browser_type_str=browser_type,
+                keywords=keywords_to_process,
+            )
         )
-    )
+    elif engine == "bfs":
+        asyncio.run(
+            crawl_category_tree(
+                PlaywrightFetcher(is_headless, browser_type, num_contexts),
+                keywords=keywords_to_process,
+                num_workers=num_pages,
+                max_per_host=max_per_host,
+                min_interval=min_interval,
+                journal_path=journal_path,
+                resume=resume,
+                full_refresh_interval=full_refresh_days * 24 * 3600,
+            )
+        )
+    elif engine == "http":
+        asyncio.run(
+            crawl_category_tree(
+                HttpFetcher(root_url, use_pool, record_dir=record_dir),
+                keywords=keywords_to_process,
+                num_workers=num_pages,
+                max_per_host=max_per_host,
+                min_interval=min_interval,
+                journal_path=journal_path,
+                resume=resume,
+                full_refresh_interval=full_refresh_days * 24 * 3600,
+            )
+        )
+    else:
+        raise ValueError(f"Unsupported engine {engine}")
 
 
-def execute_aggregate():
-    asyncio.run(aggregate())
+def execute_aggregate(dump: bool = False):
+    asyncio.run(aggregate(dump))
 
 
 if __name__ == "__main__":
@@ -97,23 +171,124 @@ if __name__ == "__main__":
         "--browser_type", type=str, required=True, help="Type of browser to use."
     )
     scrape_parser.add_argument(
-        "--batch_size", type=int, required=True, help="Number of keywords per batch."
+        "--batch_size", type=int, default=None, help="Number of keywords per batch."
+    )
+    scrape_parser.add_argument(
+        "--batch_num", type=int, default=None, help="Batch index to process."
+    )
+    scrape_parser.add_argument(
+        "--engine",
+        type=str,
+        default="bfs",
+        choices=["dfs", "bfs", "http"],
+        help="bfs (default) crawls all keywords from a shared frontier with a "
+        + "pool of pages, http does the same without a browser, both resume "
+        + "from a checkpoint journal. dfs walks each keyword on a single page "
+        + "and starts over when interrupted.",
+    )
+    scrape_parser.add_argument(
+        "--num_pages", type=int, default=4, help="Page pool size (bfs, http)."
+    )
+    scrape_parser.add_argument(
+        "--num_contexts", type=int, default=1, help="Browser contexts (bfs)."
+    )
+    scrape_parser.add_argument(
+        "--max_per_host",
+        type=int,
+        default=4,
+        help="Concurrent requests per host (bfs, http).",
     )
     scrape_parser.add_argument(
-        "--batch_num", type=int, required=True, help="Batch index to process."
+        "--min_interval",
+        type=float,
+        default=0.5,
+        help="Seconds between two requests to the same host (bfs, http).",
+    )
+    scrape_parser.add_argument(
+        "--journal",
+        type=str,
+        default=None,
+        help="Checkpoint journal, derived from the keyword batch by default "
+        + "(bfs, http).",
+    )
+    scrape_parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Discard the checkpoint journal instead of resuming (bfs, http).",
+    )
+    scrape_parser.add_argument(
+        "--full_refresh_days",
+        type=float,
+        default=7.0,
+        help="Re-walk the whole tree when the last full crawl is older than this, "
+        + "otherwise only pages whose subcategories changed are expanded again, "
+        + "0 always crawls in full (bfs, http).",
+    )
+    scrape_parser.add_argument(
+        "--queue",
+        type=str,
+        default=None,
+        help="Run id of a crawl queue in PostgreSQL, replaces the keyword batches: "
+        + "every process started with the same id claims keywords and subtrees "
+        + "until the queue drains (bfs, http).",
+    )
+    scrape_parser.add_argument(
+        "--max_pages_per_unit",
+        type=int,
+        default=200,
+        help="Pages crawled per queue unit before the rest of its subtree is split "
+        + "into new units (bfs, http).",
+    )
+    scrape_parser.add_argument(
+        "--root_url",
+        type=str,
+        default=ROOT_URL,
+        help="Site to crawl, e.g. a local fixture server (http).",
+    )
+    scrape_parser.add_argument(
+        "--no_pool",
+        action="store_true",
+        help="Don't take cookies and proxies from the API (http).",
+    )
+    scrape_parser.add_argument(
+        "--record_dir",
+        type=str,
+        default=None,
+        help="Save every fetched page as a fixture into this directory (http).",
     )
 
     # Subparser for aggregate
     aggregate_parser = subparsers.add_parser(
         "aggregate", help="Aggregate scraped data."
     )
+    aggregate_parser.add_argument(
+        "--dump",
+        action="store_true",
+        help="Also write the aggregated categories to final.ndjson for debugging.",
+    )
 
     # Parse arguments
     args = parser.parse_args()
 
     if args.command == "aggregate":
-        execute_aggregate()
+        execute_aggregate(args.dump)
     elif args.command == "scrape":
         execute_pipeline(
-            args.is_headless, args.browser_type, args.batch_size, args.batch_num
+            args.is_headless,
+            args.browser_type,
+            args.batch_size,
+            args.batch_num,
+            args.engine,
+            args.num_pages,
+            args.num_contexts,
+            args.max_per_host,
+            args.min_interval,
+            args.root_url,
+            not args.no_pool,
+            args.record_dir,
+            args.journal,
+            not args.fresh,
+            args.full_refresh_days,
+            args.queue,
+            args.max_pages_per_unit,
         )
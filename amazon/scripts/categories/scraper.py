@@ -5,13 +5,12 @@ import random
 import asyncio
 import logging
 import aiofiles
-import curl_cffi
 
 from typing import Any
-from curl_cffi.requests import AsyncSession
 
 from urllib.parse import urlparse, parse_qs, urlencode
-from shared.utils import AsyncSafeDict
+from shared.utils import AsyncSafeDict, parse_node_id
+from scripts.api_client import ApiClient
 
 from playwright.async_api import (
     Page,
@@ -24,25 +23,31 @@ from playwright.async_api import (
 )
 
 ROOT_URL = "https://amazon.com"
+SUB_CATEGORY_SELECTOR = (
+    ".a-spacing-micro.s-navigation-indent-2 a.a-link-normal.s-navigation-item"
+)
+SUB_CATEGORY_NAME_SELECTOR = "span.a-size-base.a-color-base"
+
+# Runs in the page: pulls (name, href) of every subcategory link in one round trip
+EXTRACT_SUB_CATEGORIES_JS = """
+(items, nameSelector) => items.map((item) => {
+    const nameElement = item.querySelector(nameSelector);
+    return [
+        nameElement ? nameElement.innerText : null,
+        item.getAttribute("href"),
+    ];
+})
+"""
 OUT_DIR = DEFAULT_DATA_DIR
-API_URL = os.getenv("API_URL", "http://localhost:8000")
 
 
 async def get_cookies():
-    async with AsyncSession(http_version=curl_cffi.CurlHttpVersion.V1_1) as session:
-        resp = await session.post(
-            f"{API_URL}/cookie/fetch",
-            json={
-                "browser_type": "firefox",
-                "do_fetch_pool": True,
-            },
-        )
-        data = resp.json()
+    data, status_code = await ApiClient().fetch_cookies()
 
-        cookies: list[Cookie] = data["cookies"]
-        postcode: int = data["postcode"]
+    cookies: list[Cookie] = data["cookies"]
+    postcode: int = data["postcode"]
 
-        return (cookies, postcode), resp.status_code
+    return (cookies, postcode), status_code
 
 
 async def init_browser(
@@ -68,13 +73,13 @@ async def init_browser(
     return playwright, browser, context
 
 
-def process_category_url(url: str) -> str:
+def process_category_url(url: str, root_url: str = ROOT_URL) -> str:
     parsed_url = urlparse(url)
     qs = parse_qs(parsed_url.query)
     qs.pop("k", None)  # Remove unwanted query params
     qs = {k: v[0] for k, v in qs.items()}  # Flatten list values
     qs["fs"] = "true"  # Add fixed query param
-    full_path = f"{ROOT_URL}{parsed_url.path}?{urlencode(qs)}"
+    full_path = f"{root_url}{parsed_url.path}?{urlencode(qs)}"
     return full_path
 
 
@@ -82,8 +87,8 @@ async def extract_sub_categories(page: Page, parent_category_name: str):
     logging.info(
         f"Extracting subcategories from {parent_category_name}",
     )
-    items = await page.query_selector_all(
-        ".a-spacing-micro.s-navigation-indent-2 a.a-link-normal.s-navigation-item"
+    items: list[list[str]] = await page.eval_on_selector_all(
+        SUB_CATEGORY_SELECTOR, EXTRACT_SUB_CATEGORIES_JS, SUB_CATEGORY_NAME_SELECTOR
     )
     data = {}
     if not len(items):
@@ -104,19 +109,19 @@ async def extract_sub_categories(page: Page, parent_category_name: str):
         #     for item in items:
         #         logging.info(await item.inner_text())
 
-    for item in items:
-        name_element = await item.query_selector("span.a-size-base.a-color-base")
-        category_name = await name_element.inner_text() if name_element else "No name"
-        logging.info(f"Extracting href and name from {category_name}")
-        href = await item.get_attribute("href")
+    # URL normalization is a few microseconds of string work per link, cheaper
+    # in-process than a thread hop per link
+    for category_name, href in items:
+        if category_name is None:
+            category_name = "No name"
 
         if href:
-            new_url = await asyncio.to_thread(process_category_url, href)
             data[category_name] = {
-                "url": new_url,
+                "url": process_category_url(href),
                 "inner": {},
             }
 
+    logging.info(f"{parent_category_name}: extracted {len(data)} subcategories")
     return data
 
 
@@ -135,15 +140,20 @@ async def explore_inner(
     new_inner = inner
 
     for category_name in new_inner:
-        if await explored.get(category_name):
+        url = new_inner[category_name]["url"]
+
+        # The same node is linked from several parents, sometimes under
+        # different names, and distinct nodes share names
+        node_id = parse_node_id(url)
+        explored_key = node_id if node_id is not None else category_name
+        if await explored.get(explored_key):
             logging.info(
                 f"{category_name} found in explored categories -> ignore",
             )
             continue
 
-        await explored.set(category_name, True)
+        await explored.set(explored_key, True)
 
-        url = new_inner[category_name]["url"]
         logging.info(f"(category_name, url) = ({category_name}, {url})")
 
         if search_width is not None and not search_width:
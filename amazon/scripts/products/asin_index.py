@@ -0,0 +1,230 @@
+import __init__
+from __init__ import ROOT_PATH
+
+import os
+import re
+import uuid
+import heapq
+import fcntl
+import bisect
+import logging
+import argparse
+
+from array import array
+from typing import Iterable, Iterator, Optional
+
+# ASINs seen by earlier runs, on disk. An ASIN is 10 characters of [0-9A-Z],
+# read as a base 36 number it fits 52 bits, so a set of them is a sorted array
+# of 8 byte integers (8 MB per million instead of ~90 MB as a set of strings).
+# Every key (a category) is a directory of such arrays, a run appends a new
+# file instead of rewriting one, so runs and processes never write the same
+# file. Lookups go through every file of a key, once there are too many of
+# them they are merged into one
+
+DEFAULT_INDEX_DIR = f"{ROOT_PATH}/data/asin_index"
+SEGMENT_SUFFIX = ".asins"
+ASIN_RE = re.compile(r"[0-9A-Z]{10}")
+KEY_RE = re.compile(r"[\w.-]+")
+ASIN_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def encode_asin(asin: str) -> Optional[int]:
+    # None for anything which is not an ASIN, it is never counted as seen
+    if not ASIN_RE.fullmatch(asin):
+        return None
+    return int(asin, 36)
+
+
+def decode_asin(value: int) -> str:
+    chars = []
+    for _ in range(10):
+        value, digit = divmod(value, 36)
+        chars.append(ASIN_DIGITS[digit])
+    return "".join(reversed(chars))
+
+
+class AsinSet:
+    # Immutable, `values` is sorted and without duplicates
+    __slots__ = ("values",)
+
+    def __init__(self, values: Optional[array] = None):
+        self.values = values if values is not None else array("Q")
+
+    @classmethod
+    def from_asins(cls, asins: Iterable[str]) -> "AsinSet":
+        values = {encode_asin(asin) for asin in asins}
+        values.discard(None)
+        return cls(array("Q", sorted(values)))
+
+    @classmethod
+    def load(cls, path: str) -> "AsinSet":
+        values = array("Q")
+        with open(path, "rb") as file:
+            values.fromfile(file, os.fstat(file.fileno()).st_size // values.itemsize)
+        return cls(values)
+
+    def save(self, path: str):
+        # Written aside and renamed, a reader never sees half a file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as file:
+            self.values.tofile(file)
+        os.replace(tmp_path, path)
+
+    def _contains_value(self, value: int) -> bool:
+        i = bisect.bisect_left(self.values, value)
+        return i < len(self.values) and self.values[i] == value
+
+    def __contains__(self, asin: str) -> bool:
+        value = encode_asin(asin)
+        return value is not None and self._contains_value(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[str]:
+        return map(decode_asin, self.values)
+
+    def union(self, *others: "AsinSet") -> "AsinSet":
+        # A merge of the sorted arrays, nothing is held but the result
+        values = array("Q")
+        last = None
+        for value in heapq.merge(self.values, *(other.values for other in others)):
+            if value != last:
+                values.append(value)
+                last = value
+        return AsinSet(values)
+
+
+class AsinUnion:
+    # Read only view of several sets, what a key looks like before a merge
+    __slots__ = ("sets",)
+
+    def __init__(self, sets: list[AsinSet]):
+        self.sets = sets
+
+    def __contains__(self, asin: str) -> bool:
+        value = encode_asin(asin)
+        return value is not None and any(
+            asin_set._contains_value(value) for asin_set in self.sets
+        )
+
+    def __len__(self) -> int:
+        # Counts an ASIN in two sets twice, see AsinIndex.compact
+        return sum(len(asin_set) for asin_set in self.sets)
+
+    def merge(self) -> AsinSet:
+        if not self.sets:
+            return AsinSet()
+        return self.sets[0].union(*self.sets[1:])
+
+
+class AsinIndex:
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, max_segments: int = 8):
+        self.index_dir = index_dir
+        self.max_segments = max_segments
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def _get_key_dir(self, key: str) -> str:
+        if not KEY_RE.fullmatch(key):
+            raise ValueError(f"Invalid ASIN index key {key!r}")
+        return f"{self.index_dir}/{key}"
+
+    def keys(self) -> list[str]:
+        return sorted(
+            name
+            for name in os.listdir(self.index_dir)
+            if os.path.isdir(f"{self.index_dir}/{name}")
+        )
+
+    def _load_sets(self, key_dir: str) -> list[AsinSet]:
+        # A merge may remove files between the listing and the reads
+        while True:
+            try:
+                names = [
+                    name
+                    for name in os.listdir(key_dir)
+                    if name.endswith(SEGMENT_SUFFIX)
+                ]
+            except FileNotFoundError:
+                return []
+            try:
+                return [AsinSet.load(f"{key_dir}/{name}") for name in sorted(names)]
+            except FileNotFoundError:
+                continue
+
+    def get(self, key: Optional[str] = None) -> AsinUnion:
+        # Every key with None, an ASIN seen in any category
+        keys = self.keys() if key is None else [key]
+        sets = []
+        for key in keys:
+            sets.extend(self._load_sets(self._get_key_dir(key)))
+        return AsinUnion(sets)
+
+    def append(self, key: str, asins: Iterable[str]) -> int:
+        asin_set = AsinSet.from_asins(asins)
+        if not asin_set:
+            return 0
+
+        key_dir = self._get_key_dir(key)
+        os.makedirs(key_dir, exist_ok=True)
+        asin_set.save(f"{key_dir}/{uuid.uuid4().hex}{SEGMENT_SUFFIX}")
+
+        num_of_segments = sum(
+            name.endswith(SEGMENT_SUFFIX) for name in os.listdir(key_dir)
+        )
+        if num_of_segments > self.max_segments:
+            self.compact(key)
+        return len(asin_set)
+
+    def compact(self, key: str) -> bool:
+        # The merged file is in place before the merged ones go away, readers
+        # in between see an ASIN twice, which a set lookup does not mind.
+        # Only one process merges a key, the others skip it
+        key_dir = self._get_key_dir(key)
+        with open(f"{key_dir}/.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+
+            names = [
+                name for name in os.listdir(key_dir) if name.endswith(SEGMENT_SUFFIX)
+            ]
+            if len(names) < 2:
+                return False
+            merged = AsinUnion(
+                [AsinSet.load(f"{key_dir}/{name}") for name in names]
+            ).merge()
+            merged.save(f"{key_dir}/{uuid.uuid4().hex}{SEGMENT_SUFFIX}")
+            for name in names:
+                os.remove(f"{key_dir}/{name}")
+        return True
+
+
+def main(args):
+    index = AsinIndex(args.index_dir)
+    keys = [args.key] if args.key else index.keys()
+    if args.compact:
+        for key in keys:
+            index.compact(key)
+
+    total = 0
+    for key in keys:
+        asins = index.get(key)
+        total += len(asins)
+        logging.info(f"[{key}]: {len(asins)} ASINs in {len(asins.sets)} segment(s)")
+    logging.info(f"{len(keys)} key(s), {total} ASINs")
+
+
+if __name__ == "__main__":
+    from shared.config.logger import setup_logger
+
+    parser = argparse.ArgumentParser(description="Inspect or merge an ASIN index.")
+    parser.add_argument("--index_dir", type=str, default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--key", type=str, default=None, help="All keys if omitted.")
+    parser.add_argument(
+        "--compact", action="store_true", help="Merge the segments of every key."
+    )
+
+    setup_logger()
+    main(parser.parse_args())
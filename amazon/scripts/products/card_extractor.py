@@ -0,0 +1,390 @@
+import re
+import bs4
+
+from typing import Any, Optional
+from selectolax.parser import HTMLParser
+
+# Fields of a product card. `extract_card_bs4` is the reference, a full
+# BeautifulSoup tree per card. `extract_card_fast` builds the tree in C with
+# selectolax and only looks at the subtrees holding the fields. The two
+# parsers build the same tree for plain, well nested markup only, anything
+# else raises Unsupported and goes through the reference instead.
+# scripts/benchmarks/card_extraction.py checks that both agree on a corpus
+
+CARD_FIELDS = (
+    "uuid",
+    "title",
+    "url",
+    "avg_rating",
+    "total_review",
+    "sale_count",
+    "price",
+)
+AD_MARKER = "seeing this ad based on the product"
+
+# Raw text elements (html.parser and the HTML5 parser do not agree on which),
+# elements the HTML5 parser closes or moves on its own and anything which is
+# not part of a card fragment
+UNSUPPORTED_TAGS = {
+    "script",
+    "style",
+    "template",
+    "textarea",
+    "title",
+    "xmp",
+    "iframe",
+    "noembed",
+    "noframes",
+    "noscript",
+    "plaintext",
+    "listing",
+    "pre",
+    "p",
+    "table",
+    "caption",
+    "colgroup",
+    "col",
+    "thead",
+    "tbody",
+    "tfoot",
+    "tr",
+    "td",
+    "th",
+    "select",
+    "option",
+    "optgroup",
+    "math",
+    "foreignobject",
+    "image",
+    "html",
+    "head",
+    "body",
+    "frameset",
+    "frame",
+    "keygen",
+    "basefont",
+    "bgsound",
+    "isindex",
+    "menuitem",
+}
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "param",
+    "source",
+    "track",
+    "wbr",
+}
+# Opening one of these inside another one closes the outer one
+NO_NESTING_TAGS = {"a", "button", "form", "nobr", "li", "dd", "dt"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+# HTML elements which end an <svg> in the HTML5 parser
+SVG_BREAKOUT_TAGS = {
+    "b",
+    "big",
+    "blockquote",
+    "body",
+    "br",
+    "center",
+    "code",
+    "dd",
+    "div",
+    "dl",
+    "dt",
+    "em",
+    "embed",
+    "font",
+    "hr",
+    "i",
+    "img",
+    "li",
+    "menu",
+    "meta",
+    "nobr",
+    "ol",
+    "ruby",
+    "s",
+    "small",
+    "span",
+    "strike",
+    "strong",
+    "sub",
+    "sup",
+    "tt",
+    "u",
+    "ul",
+    "var",
+    *HEADING_TAGS,
+}
+
+COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+TAG_START_RE = re.compile(r"<[a-zA-Z/!?]")
+TAG_RE = re.compile(
+    r"<(/?)([a-zA-Z][^\s/>]*)"
+    + r"((?:\s*[^\s\"'>/=]+(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'=<>`]+))?)*)"
+    + r"\s*(/?)>"
+)
+ATTR_NAME_RE = re.compile(
+    r"([^\s\"'>/=]+)(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'=<>`]+))?"
+)
+# html.parser decodes "&copy=1" in an attribute, the HTML5 parser does not
+LOOSE_ENTITY_RE = re.compile(r"&[a-zA-Z][a-zA-Z0-9]*(?![a-zA-Z0-9;])")
+
+
+class Unsupported(Exception):
+    pass
+
+
+def extract_card_bs4(html: str) -> Optional[dict[str, Any]]:
+    parsed = bs4.BeautifulSoup(html, features="html.parser")
+    if AD_MARKER in parsed.text:
+        return None
+
+    uuid = None
+    title = None
+    url = None
+    avg_rating = None
+    total_review = None
+    sale_count = None
+    item_price = None
+
+    product_block = parsed.find("div", attrs={"data-uuid": True})
+    if product_block:
+        uuid = product_block.attrs.get("data-uuid")
+
+    h2_tags = parsed.find("div", attrs={"data-cy": "title-recipe"}).find_all("h2")
+    if len(h2_tags) > 1:
+        h2_tags = h2_tags[1:]
+
+    title_block = h2_tags[0]
+    if title_block:
+        title = title_block.get_text().strip()
+        title_block = title_block.find("a")
+        if title_block:
+            url = f"https://amazon.com/{title_block.attrs.get('href')}"
+
+    review_block = parsed.find("div", attrs={"data-cy": "reviews-block"})
+
+    if review_block:
+        review_and_rating_block = review_block.select_one(
+            "div.a-row.a-size-small",
+        )
+
+        sale_block = review_block.select_one(
+            "div.a-row.a-size-base",
+        )
+
+        if review_and_rating_block:
+            if avg_rating_block := review_and_rating_block.find(
+                "i", attrs={"data-cy": "reviews-ratings-slot"}
+            ):
+                avg_rating = avg_rating_block.get_text()
+                avg_rating = float(avg_rating.split("out of")[0].strip())
+
+            if total_review_block := review_and_rating_block.find(
+                "a", attrs={"class": ["a-size-base", "s-underline-text"]}
+            ):
+                total_review = int(
+                    total_review_block.get_text().replace(",", "").strip()
+                )
+
+        if sale_block:
+            if sale_count := sale_block.find(
+                "span", attrs={"class": ["a-size-base", "a-color-secondary"]}
+            ):
+                sale_count = sale_count.get_text()
+                sale_count = sale_count.split(" ")[0].strip()
+
+    price_block = parsed.find("div", attrs={"data-cy": "price-recipe"})
+    if price_block:
+        first_price_block = price_block.find("div")
+        if first_price_block:
+            first_price_block = first_price_block.find(
+                "span", attrs={"class": "a-price"}
+            )
+        if first_price_block:
+            item_price = first_price_block.get_text()
+            item_price = float(item_price[1 : item_price.find("$", 1)].replace(",", ""))
+
+    return {
+        "uuid": uuid,
+        "title": title,
+        "url": url,
+        "avg_rating": avg_rating,
+        "total_review": total_review,
+        "sale_count": sale_count,
+        "price": item_price,
+    }
+
+
+def is_plain_markup(html: str) -> bool:
+    # True when html.parser and the HTML5 parser build the same tree: every
+    # tag is closed where it was opened and none is treated differently
+    if "\r" in html or "\0" in html or LOOSE_ENTITY_RE.search(html):
+        return False
+    html = COMMENT_RE.sub("", html)
+
+    stack: list[str] = []
+    num_of_tags = 0
+    for match in TAG_RE.finditer(html):
+        num_of_tags += 1
+        is_end, name, attrs, is_self_closing = match.groups()
+        name = name.lower()
+        if name in UNSUPPORTED_TAGS:
+            return False
+
+        if is_end:
+            if not stack or stack[-1] != name:
+                return False
+            stack.pop()
+            continue
+
+        attr_names = [attr_name.lower() for attr_name in ATTR_NAME_RE.findall(attrs)]
+        if len(attr_names) != len(set(attr_names)):
+            return False
+
+        is_foreign = "svg" in stack
+        if is_foreign and name in SVG_BREAKOUT_TAGS:
+            return False
+        if name in VOID_TAGS and not is_foreign:
+            continue
+        if is_self_closing:
+            # Only honored by the HTML5 parser in foreign content
+            if is_foreign or name == "svg":
+                continue
+            return False
+        if name in NO_NESTING_TAGS and name in stack:
+            return False
+        if name in {"dd", "dt"} and ("dd" in stack or "dt" in stack):
+            return False
+        if name in HEADING_TAGS and not HEADING_TAGS.isdisjoint(stack):
+            return False
+        stack.append(name)
+
+    # A "<" the tag pattern skipped is read differently by either parser
+    return not stack and num_of_tags == len(TAG_START_RE.findall(html))
+
+
+def _find(node, selector: str):
+    # css() of a node matches the node itself too, bs4 only looks below it
+    for match in node.css(selector):
+        if match.mem_id != node.mem_id:
+            return match
+    return None
+
+
+def _find_by_class(node, tag: str, classes: set[str]):
+    # bs4 matches a class list against each class and against the whole value
+    for match in node.css(tag):
+        if match.mem_id == node.mem_id:
+            continue
+        value = match.attributes.get("class") or ""
+        if value in classes or not classes.isdisjoint(value.split()):
+            return match
+    return None
+
+
+def _get_attr(node, name: str) -> Optional[str]:
+    # An attribute without a value is "" in bs4 and None in selectolax
+    attributes = node.attributes
+    if name not in attributes:
+        return None
+    return attributes[name] or ""
+
+
+def _get_text(node) -> str:
+    return node.text(deep=True, separator="", strip=False)
+
+
+def extract_card_fast(html: str) -> Optional[dict[str, Any]]:
+    if not is_plain_markup(html):
+        raise Unsupported("markup")
+
+    tree = HTMLParser(html)
+    if tree.body is None:
+        raise Unsupported("no body")
+    if AD_MARKER in _get_text(tree.body):
+        return None
+
+    uuid = None
+    title = None
+    url = None
+    avg_rating = None
+    total_review = None
+    sale_count = None
+    item_price = None
+
+    if product_block := tree.css_first("div[data-uuid]"):
+        uuid = _get_attr(product_block, "data-uuid")
+
+    title_recipe = tree.css_first('div[data-cy="title-recipe"]')
+    if title_recipe is None:
+        raise Unsupported("no title")
+    h2_tags = title_recipe.css("h2")
+    if not h2_tags:
+        raise Unsupported("no title")
+    title_block = h2_tags[1] if len(h2_tags) > 1 else h2_tags[0]
+    title = _get_text(title_block).strip()
+    if link := _find(title_block, "a"):
+        url = f"https://amazon.com/{_get_attr(link, 'href')}"
+
+    try:
+        if review_block := tree.css_first('div[data-cy="reviews-block"]'):
+            if review_and_rating_block := _find(review_block, "div.a-row.a-size-small"):
+                if avg_rating_block := _find(
+                    review_and_rating_block, 'i[data-cy="reviews-ratings-slot"]'
+                ):
+                    avg_rating = float(
+                        _get_text(avg_rating_block).split("out of")[0].strip()
+                    )
+                if total_review_block := _find_by_class(
+                    review_and_rating_block, "a", {"a-size-base", "s-underline-text"}
+                ):
+                    total_review = int(
+                        _get_text(total_review_block).replace(",", "").strip()
+                    )
+
+            if sale_block := _find(review_block, "div.a-row.a-size-base"):
+                if sale_count_block := _find_by_class(
+                    sale_block, "span", {"a-size-base", "a-color-secondary"}
+                ):
+                    sale_count = _get_text(sale_count_block).split(" ")[0].strip()
+
+        if price_block := tree.css_first('div[data-cy="price-recipe"]'):
+            if first_price_block := _find(price_block, "div"):
+                if first_price_block := _find_by_class(
+                    first_price_block, "span", {"a-price"}
+                ):
+                    item_price = _get_text(first_price_block)
+                    item_price = float(
+                        item_price[1 : item_price.find("$", 1)].replace(",", "")
+                    )
+    except ValueError:
+        # The reference raises the same error, let it
+        raise Unsupported("value")
+
+    return {
+        "uuid": uuid,
+        "title": title,
+        "url": url,
+        "avg_rating": avg_rating,
+        "total_review": total_review,
+        "sale_count": sale_count,
+        "price": item_price,
+    }
+
+
+def extract_card(html: str) -> Optional[dict[str, Any]]:
+    # None for a sponsored card
+    try:
+        return extract_card_fast(html)
+    except Unsupported:
+        return extract_card_bs4(html)
@@ -0,0 +1,137 @@
+import __init__
+from __init__ import DEFAULT_DATA_DIR
+
+import os
+import json
+import hashlib
+import logging
+
+from typing import Any, Optional
+from shared.models.category import Category
+from scripts.api_client import ApiClient
+
+CATEGORY_CACHE_DIR = os.getenv(
+    "CATEGORY_CACHE_DIR", f"{DEFAULT_DATA_DIR}/category_cache"
+)
+
+# Category listings are cached on disk together with the tree version (ETag)
+# they were served with. A repeat run sends If-None-Match and gets an empty 304
+# back as long as nobody called /category/replace in between.
+
+
+def _get_cache_path(route: str, params: dict[str, Any]) -> str:
+    key = json.dumps([route, sorted(params.items())], default=str)
+    file_name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(CATEGORY_CACHE_DIR, f"{file_name}.ndjson")
+
+
+def _load_cache(cache_path: str) -> tuple[Optional[str], list[Category]]:
+    try:
+        with open(cache_path, "rb") as file:
+            etag: str = json.loads(file.readline())["etag"]
+            categories = [
+                Category.model_validate_json(line) for line in file if line.strip()
+            ]
+        return etag, categories
+    except FileNotFoundError:
+        return None, []
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Ignoring unreadable category cache {cache_path}: {e}")
+        return None, []
+
+
+def _save_cache(cache_path: str, etag: str, categories: list[Category]):
+    os.makedirs(CATEGORY_CACHE_DIR, exist_ok=True)
+
+    # Scrapers run side by side, write to a private file and swap it in
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(json.dumps({"etag": etag}) + "\n")
+        for category in categories:
+            file.write(category.model_dump_json() + "\n")
+    os.replace(tmp_path, cache_path)
+
+
+async def fetch_categories(
+    route: str,
+    params: dict[str, Any],
+    page_size: Optional[int] = 1000,
+    use_cache: bool = True,
+) -> tuple[list[Category], int]:
+    params = {k: v for k, v in params.items() if v is not None}
+    cache_path = _get_cache_path(route, params)
+    cached_etag, cached_categories = (
+        _load_cache(cache_path) if use_cache else (None, [])
+    )
+
+    query = {**params, "stream": True}
+    if page_size:
+        query["limit"] = page_size
+
+    client = ApiClient()
+    while True:
+        categories: list[Category] = []
+        etag: Optional[str] = None
+        page_query = dict(query)
+        headers = {"If-None-Match": cached_etag} if cached_etag else {}
+        is_consistent = True
+
+        while True:
+            async with client.stream(
+                "GET",
+                f"/category/{route}",
+                params=page_query,
+                headers=headers,
+            ) as resp:
+                if resp.status_code == 304:
+                    logging.info(f"Category cache hit for {route} {params}")
+                    return cached_categories, 200
+                if resp.status_code != 200:
+                    return categories, resp.status_code
+
+                page_etag = resp.headers.get("ETag")
+                if "after" not in page_query:
+                    etag = page_etag
+                elif page_etag != etag:
+                    # Tree was replaced between two pages
+                    is_consistent = False
+                    break
+
+                async for line in resp.aiter_lines():
+                    if line:
+                        categories.append(Category.model_validate_json(line))
+
+                next_cursor = resp.headers.get("X-Next-Cursor")
+
+            if not next_cursor:
+                break
+            page_query["after"] = next_cursor
+            headers = {}
+
+        if is_consistent:
+            break
+        logging.info(f"Category tree changed while paging {route}, restarting")
+
+    if use_cache and etag:
+        _save_cache(cache_path, etag, categories)
+
+    return categories, 200
+
+
+async def get_categories(depth: int = 2, strict: bool = True, page_size: int = 1000):
+    categories, status_code = await fetch_categories(
+        "get_by_depth", {"depth": depth, "strict": strict}, page_size
+    )
+    return (categories, len(categories)), status_code
+
+
+async def get_category_tree(min_depth: int = None, max_depth: int = None):
+    categories, status_code = await fetch_categories(
+        "subtree", {"min_depth": min_depth, "max_depth": max_depth}, None
+    )
+
+    categories_by_depth: dict[int, list[Category]] = {}
+    for category in categories:
+        categories_by_depth.setdefault(category.depth, []).append(category)
+
+    return categories_by_depth, status_code
@@ -0,0 +1,1200 @@
+import __init__
+from __init__ import DEFAULT_DATA_DIR, DEFAULT_OUT_DIR
+
+import os
+import re
+import math
+import json
+import hashlib
+import uuid
+import asyncio
+import logging
+import aiofiles
+import curl_cffi
+import urllib.parse as urlparser
+
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Any, Callable, Container, Optional
+from config import base_headers
+from scheduler import CategoryScheduler
+from parse_stage import ParseStage
+from card_extractor import extract_card
+from search_records import parse_records
+from page_stream import BLOCK_MARKERS, PageScanner
+from segment_store import SegmentWriter, load_index, read_pages
+from asin_index import AsinIndex
+from category_client import get_category_tree
+from shared.models.proxy import Proxy
+from shared.models.category import Category
+from shared.services.rate_limiter import RateLimit, RateLimiter
+from scripts.api_client import ApiClient, Prefetcher
+from curl_cffi.requests import AsyncSession
+
+# One product scraping pipeline, the scraper modules only pick a preset.
+# A category is walked page by page until a stop condition fires, the rotation
+# policy decides when the session (cookies + proxy) is replaced and whether the
+# pages in between are fetched together, the sink decides what is kept on disk
+
+
+class SortTendency(Enum):
+    FEATURED = "featured-rank"
+    NEWEST_PRODUCTS = "date-desc-rank"
+    BESTSELLERS = "exact-aware-popularity-rank"
+    AVG_CUSTOMER_REVIEWS = "review-rank"
+    HIGHEST_PRICE = "price-desc-rank"
+    LOWEST_PRICE = "price-asc-rank"
+
+
+# Responses which mean the session is being throttled or blocked
+BLOCK_STATUS_CODES = {400, 403, 429, 503}
+# Loose enough not to slow a healthy run down, a block halves the rate of the
+# host, the proxy and the cookie set involved
+DEFAULT_RATE_LIMITS = {
+    "host": RateLimit(20.0, burst=20.0),
+    "proxy": RateLimit(4.0, burst=4.0),
+    "cookies": RateLimit(4.0, burst=4.0),
+}
+FETCH_PAYLOAD = json.dumps(
+    {
+        "prefetch-type": "rq",
+        "customer-action": "pagination",
+    }
+)
+
+
+async def get_cookies():
+    data, status_code = await ApiClient().fetch_cookies()
+
+    cookie_dict: dict[str, str] = {
+        cookie["name"]: cookie["value"] for cookie in data["cookies"]
+    }
+    postcode: int = data["postcode"]
+
+    return (cookie_dict, postcode), status_code
+
+
+async def get_proxy():
+    data, status_code = await ApiClient().rotate_proxy()
+
+    proxies: list[Proxy] = [
+        Proxy(**{k: v for k, v in proxy.items() if k != "id"})
+        for proxy in data["proxies"]
+    ]
+
+    proxy: Optional[Proxy] = proxies[0] if len(proxies) else None
+
+    return proxy, status_code
+
+
+def preprocess_url_parts(category_url: str):
+    # To be retained: rh, fs, i, ref, page
+    original_qs = category_url.replace("https://amazon.com/s?", "")
+    original_qs = {
+        k: v[0]
+        for k, v in urlparser.parse_qs(original_qs).items()
+        if k in {"rh", "fs", "i"}
+    }
+    base_url = "https://www.amazon.com/s/query"
+    return base_url, original_qs
+
+
+def build_product_url(
+    url: str,
+    qs: dict[str, str],
+    page: int,
+    sort_tendency: Optional[SortTendency] = SortTendency.FEATURED,
+):
+    final_qs = {**qs, "page": page, "ref": f"sr_pg_{page}"}
+    if sort_tendency is not None:
+        final_qs["s"] = sort_tendency.value
+    full_path = f"{url}?{urlparser.urlencode(final_qs)}"
+    return full_path
+
+
+def parse_proxy_str(proxy_str: Optional[str]):
+    if not proxy_str:
+        return None, {}
+
+    proxy_parts = proxy_str.split(":")
+    host, port, username, password = proxy_parts[:4]
+    proxy_url = f"http://{username}:{password}@{host}:{port}"
+
+    headers = {}
+    for part in proxy_parts[4:]:
+        if part.startswith("country-"):
+            headers["X-Country"] = part.split("-")[1]
+        elif part.startswith("session-"):
+            headers["X-Session"] = part.split("-")[1]
+        elif part.startswith("lifetime-"):
+            headers["X-Lifetime"] = part.split("-")[1]
+        elif part.startswith("state-"):
+            headers["X-State"] = part.split("-")[1]
+        elif part.startswith("streaming-"):
+            headers["X-Streaming"] = part.split("-")[1]
+
+    return proxy_url, headers
+
+
+def detect_block(text_data: str) -> Optional[str]:
+    for marker, reason in BLOCK_MARKERS:
+        if text_data.find(marker) != -1:
+            return reason
+    return None
+
+
+async def fetch_txt(
+    category: Category,
+    url: str,
+    page: int,
+    async_session: AsyncSession,
+):
+    logging.info(f"[{category.name}][{page}]: Fetching page of url={url}")
+    try:
+        resp = await async_session.request(
+            method="POST",
+            url=url,
+            timeout=60,
+            data=FETCH_PAYLOAD,
+        )
+    except curl_cffi.curl.CurlError as e:
+        logging.error(f"[{category.name}][{page}]: Got error while fetching page: {e}")
+        return None, False, 408
+
+    text_data = resp.text
+
+    logging.info(f"[{category.name}][{page}]: Fetched page")
+
+    if resp.status_code != 200:
+        return text_data, False, resp.status_code
+
+    block = detect_block(text_data)
+    if block == "redirect":
+        logging.error(f"[{category.name}][{page}]: Found redirect message")
+        return text_data, False, 400
+    if block == "automation_detected":
+        logging.error(f"[{category.name}][{page}]: Amazon detected the scraper")
+        return text_data, False, 400
+
+    logging.info(f"[{category.name}][{page}]: Successfully fetched HTML TXT")
+    return text_data, True, 200
+
+
+async def fetch_txt_streaming(
+    category: Category,
+    url: str,
+    page: int,
+    async_session: AsyncSession,
+):
+    # Same results as fetch_txt, except that a blocked or empty page is cut
+    # short, see PageScanner
+    logging.info(f"[{category.name}][{page}]: Fetching page of url={url}")
+    try:
+        async with async_session.stream(
+            method="POST",
+            url=url,
+            timeout=60,
+            data=FETCH_PAYLOAD,
+        ) as resp:
+            scanner = PageScanner(resp.encoding)
+            async for chunk in resp.aiter_content():
+                if scanner.feed(chunk):
+                    # Fails the write of the next chunk, which aborts the transfer
+                    resp.close()
+                    break
+            text_data = scanner.get_text()
+    except curl_cffi.curl.CurlError as e:
+        logging.error(f"[{category.name}][{page}]: Got error while fetching page: {e}")
+        return None, False, 408
+
+    logging.info(f"[{category.name}][{page}]: Fetched page")
+
+    if resp.status_code != 200:
+        return text_data, False, resp.status_code
+
+    if scanner.outcome == "redirect":
+        logging.error(f"[{category.name}][{page}]: Found redirect message")
+        return text_data, False, 400
+    if scanner.outcome == "automation_detected":
+        logging.error(f"[{category.name}][{page}]: Amazon detected the scraper")
+        return text_data, False, 400
+    if scanner.outcome == "empty":
+        logging.info(f"[{category.name}][{page}]: Found empty page")
+
+    logging.info(f"[{category.name}][{page}]: Successfully fetched HTML TXT")
+    return text_data, True, 200
+
+
+def preprocess_txt(content: str):
+    new_json_data = {
+        "metadata": {},
+        "data": [],
+    }
+    data_exclude_keys = {"index", "data"}
+
+    for _, key, record in parse_records(content):
+        if key == "data-search-metadata":
+            new_json_data["metadata"] = record[2]["metadata"]
+        else:
+            new_json_record = {
+                k: v for k, v in record[2].items() if k not in data_exclude_keys
+            }
+            new_json_data["data"].append(new_json_record)
+
+    new_json_data["metadata"]["actualTotalResultCount"] = len(new_json_data["data"])
+
+    return new_json_data
+
+
+def postprocess_json(json_data: dict):
+    asins = []
+    products = []
+    for record in json_data["data"]:
+        fields = extract_card(record["html"])
+        if fields is None:
+            # Sponsored
+            continue
+
+        del record["html"]
+        products.append({**record, **fields})
+        asins.append(record["asin"])
+
+    json_data["data"] = products
+    json_data["metadata"]["asins"] = asins
+    return json_data
+
+
+def parse_page(text_data: str, needs_products: bool) -> dict[str, Any]:
+    # Runs in a parse worker process, see ParseStage
+    json_data = preprocess_txt(text_data)
+    if needs_products:
+        json_data = postprocess_json(json_data)
+    return json_data
+
+
+class ProductPage:
+    __slots__ = ("page", "text", "data")
+
+    def __init__(self, page: int, text: str, data: dict[str, Any]):
+        self.page = page
+        self.text = text
+        self.data = data
+
+    @property
+    def in_page_count(self) -> int:
+        return self.data["metadata"].get("asinOnPageCount", 0)
+
+    @property
+    def total_count(self) -> int:
+        return self.data["metadata"].get("totalResultCount", 0)
+
+    @property
+    def product_count(self) -> int:
+        return self.data["metadata"]["actualTotalResultCount"]
+
+    @property
+    def asins(self) -> list[str]:
+        # Postprocessed pages list the asins without the sponsored cards
+        asins = self.data["metadata"].get("asins")
+        if asins is None:
+            asins = [record["asin"] for record in self.data["data"]]
+        return asins
+
+
+class CategoryRun:
+    __slots__ = (
+        "category",
+        "seen_asins",
+        "new_asins",
+        "num_of_pages",
+        "num_of_products",
+        "num_of_overlaps",
+        "num_of_failures",
+        "stop_reason",
+    )
+
+    def __init__(self, category: Category, seen_asins: Optional[Container[str]] = None):
+        self.category = category
+        # A set, or the category's part of the ASIN index
+        self.seen_asins = seen_asins if seen_asins is not None else set()
+        # Not seen before this run, added to the ASIN index at the end
+        self.new_asins: set[str] = set()
+        self.num_of_pages = 0
+        self.num_of_products = 0
+        self.num_of_overlaps = 0
+        self.num_of_failures = 0
+        self.stop_reason: Optional[str] = None
+
+
+class StopCondition(ABC):
+    # Checked after every stored page, in page order, the first reason returned
+    # stops the category. Conditions keep their state in the run
+    @abstractmethod
+    def check(self, run: CategoryRun, page: ProductPage) -> Optional[str]:
+        pass
+
+
+class EndOfCategory(StopCondition):
+    def __init__(self, min_in_page_count: int = 5, match_total: bool = True):
+        self.min_in_page_count = min_in_page_count
+        self.match_total = match_total
+
+    def check(self, run: CategoryRun, page: ProductPage) -> Optional[str]:
+        in_page_count = page.in_page_count
+        if (
+            self.match_total and page.total_count == in_page_count
+        ) or in_page_count < self.min_in_page_count:
+            return "end of category"
+        return None
+
+
+class OverlapThreshold(StopCondition):
+    # Stops once more than `limit` pages were mostly made of already seen asins
+    def __init__(self, threshold: float = 95.0, limit: int = 10):
+        self.threshold = threshold
+        self.limit = limit
+
+    def check(self, run: CategoryRun, page: ProductPage) -> Optional[str]:
+        page_asins = set(page.asins)
+        if not page_asins:
+            return None
+
+        num_of_seen = sum(asin in run.seen_asins for asin in page_asins)
+        overlap_perc = num_of_seen / len(page_asins) * 100
+        if overlap_perc > self.threshold:
+            run.num_of_overlaps += 1
+            logging.warning(
+                f"[{run.category.name}][{page.page}]: "
+                + f"Found overlapping products "
+                + f"({overlap_perc}% > {self.threshold}%) "
+                + f"({self.limit - run.num_of_overlaps} times left)"
+            )
+            if run.num_of_overlaps > self.limit:
+                return "found overlapped products"
+        return None
+
+
+class ProductCap(StopCondition):
+    def __init__(self, cap: int):
+        self.cap = cap
+
+    def check(self, run: CategoryRun, page: ProductPage) -> Optional[str]:
+        if run.num_of_products >= self.cap:
+            return f"exceeded product cap ({run.num_of_products}/{self.cap})"
+        return None
+
+
+class RotationPolicy:
+    # The session is replaced after every page p with (p - offset) % every == 0,
+    # the pages in between form a window which shares it. A concurrent window
+    # is fetched at once and its stop conditions are checked afterwards
+    def __init__(
+        self,
+        every: int,
+        offset: int = 1,
+        rotate_cookies: bool = True,
+        concurrent: bool = False,
+    ):
+        self.every = max(every, 1)
+        self.offset = offset
+        self.rotate_cookies = rotate_cookies
+        self.concurrent = concurrent
+
+    def window_end(self, page: int) -> int:
+        return page + (self.offset - page) % self.every
+
+
+class Sink(ABC):
+    # Run the card extraction (postprocess_json) before writing
+    needs_products = True
+
+    def exists(self, category: Category, page: int) -> bool:
+        return False
+
+    def load_asins(self, category: Category) -> set[str]:
+        return set()
+
+    @abstractmethod
+    async def write(self, run: CategoryRun, page: ProductPage):
+        pass
+
+    async def write_failure(
+        self, category: Category, page: int, text_data: str, reason: str
+    ):
+        pass
+
+    async def close(self):
+        pass
+
+
+def _format_name(name_template: str, run_id: str, category: Category, page: Any) -> str:
+    return name_template.format(run_id=run_id, category=category, page=page)
+
+
+class JsonFileSink(Sink):
+    def __init__(
+        self,
+        name_template: str,
+        data_dir: str = DEFAULT_DATA_DIR,
+        run_id: Optional[str] = None,
+    ):
+        self.name_template = name_template
+        self.data_dir = data_dir
+        self.run_id = run_id or str(uuid.uuid4())
+
+    def _get_path(self, category: Category, page: int) -> str:
+        name = _format_name(self.name_template, self.run_id, category, page)
+        return f"{self.data_dir}/{name}.json"
+
+    def exists(self, category: Category, page: int) -> bool:
+        return os.path.exists(self._get_path(category, page))
+
+    def load_asins(self, category: Category) -> set[str]:
+        # Pages of this category written by any earlier run
+        pattern = re.escape(
+            _format_name(self.name_template, "\0", category, "\1") + ".json"
+        )
+        pattern = pattern.replace("\0", ".+").replace("\1", r"\d+")
+        name_re = re.compile(pattern)
+
+        asins = set()
+        for name in os.listdir(self.data_dir):
+            if not name_re.fullmatch(name):
+                continue
+            try:
+                with open(f"{self.data_dir}/{name}", "r") as file:
+                    asins.update(json.load(file)["metadata"].get("asins", ()))
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Ignoring unreadable product page {name}: {e}")
+        return asins
+
+    async def write(self, run: CategoryRun, page: ProductPage):
+        json_str = await asyncio.to_thread(json.dumps, page.data, separators=(",", ":"))
+        async with aiofiles.open(self._get_path(run.category, page.page), "w") as file:
+            await file.write(json_str)
+        logging.info(f"[{run.category.name}][{page.page}]: Dumped JSON string to file")
+
+
+class SegmentSink(Sink):
+    # The pages of a run in a few compressed segments instead of a file each,
+    # see segment_store. Lines carry the category next to the page data
+    def __init__(
+        self,
+        data_dir: str = DEFAULT_DATA_DIR,
+        run_id: Optional[str] = None,
+        max_segment_size: int = 64 << 20,
+    ):
+        self.data_dir = data_dir
+        self.run_id = run_id or str(uuid.uuid4())
+        self.max_segment_size = max_segment_size
+        self._writer: Optional[SegmentWriter] = None
+        self._pages: Optional[set[tuple[str, int]]] = None
+        self._entries: Optional[dict[str, list[dict[str, Any]]]] = None
+
+    def exists(self, category: Category, page: int) -> bool:
+        if self._pages is None:
+            self._pages = {
+                (entry["category_id"], entry["page"])
+                for entry in load_index(self.data_dir, self.run_id)
+            }
+        return (str(category.id), page) in self._pages
+
+    def load_asins(self, category: Category) -> set[str]:
+        # Pages of this category written by any earlier run, the indexes are
+        # read once and only the members of the category are decompressed
+        if self._entries is None:
+            self._entries = {}
+            for entry in load_index(self.data_dir):
+                self._entries.setdefault(entry["category_id"], []).append(entry)
+
+        asins = set()
+        try:
+            for _, page_data in read_pages(
+                self.data_dir, self._entries.get(str(category.id), [])
+            ):
+                asins.update(page_data["metadata"].get("asins", ()))
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"[{category.name}]: Ignoring unreadable segment: {e}")
+        return asins
+
+    async def write(self, run: CategoryRun, page: ProductPage):
+        if self._writer is None:
+            self._writer = SegmentWriter(
+                self.data_dir, self.run_id, self.max_segment_size
+            )
+        category = run.category
+        entry = {
+            "category_id": str(category.id),
+            "category": category.name,
+            "depth": category.depth,
+            "page": page.page,
+        }
+        entry = await self._writer.write(entry, {**entry, **page.data})
+        logging.info(
+            f"[{category.name}][{page.page}]: Appended JSON to {entry['segment']}"
+        )
+
+    async def close(self):
+        if self._writer is not None:
+            await asyncio.to_thread(self._writer.close)
+            self._writer = None
+
+
+class RawTextSink(Sink):
+    # Keeps the raw responses for `preprocessor.py`, which doubles as the
+    # recording format of the benchmark fixtures
+    needs_products = False
+
+    def __init__(
+        self,
+        name_template: str = "{category.name}-{page}",
+        data_dir: str = DEFAULT_DATA_DIR,
+        out_dir: str = DEFAULT_OUT_DIR,
+        run_id: Optional[str] = None,
+    ):
+        self.name_template = name_template
+        self.data_dir = data_dir
+        self.out_dir = out_dir
+        self.run_id = run_id or str(uuid.uuid4())
+
+    def _get_name(self, category: Category, page: int) -> str:
+        return _format_name(self.name_template, self.run_id, category, page)
+
+    def exists(self, category: Category, page: int) -> bool:
+        name = self._get_name(category, page)
+        return os.path.exists(f"{self.data_dir}/{name}.txt") or os.path.exists(
+            f"{self.out_dir}/{name}.json"
+        )
+
+    async def write(self, run: CategoryRun, page: ProductPage):
+        # The empty page past the end carries no product
+        if not page.in_page_count:
+            return
+        name = self._get_name(run.category, page.page)
+        async with aiofiles.open(f"{self.data_dir}/{name}.txt", "w") as file:
+            await file.write(page.text)
+        logging.info(f"[{run.category.name}][{page.page}]: Saved data in .txt")
+
+    async def write_failure(
+        self, category: Category, page: int, text_data: str, reason: str
+    ):
+        # Picked up by preprocessor.data_checker
+        name = self._get_name(category, page)
+        async with aiofiles.open(f"{self.data_dir}/{name}.{reason}.txt", "w") as file:
+            await file.write(text_data)
+
+
+class HttpSession:
+    __slots__ = ("session", "cookies", "proxy_str")
+
+    def __init__(
+        self, session: AsyncSession, cookies: dict[str, str], proxy_str: Optional[str]
+    ):
+        self.session = session
+        self.cookies = cookies
+        self.proxy_str = proxy_str
+
+
+class HttpPageFetcher:
+    # Cookie sets and proxies of the next rotations are fetched in the
+    # background, opening a session does not wait for the API. Streamed pages
+    # stop downloading once they are known to be blocked or empty
+    def __init__(self, prefetch: int = 2, streaming: bool = True):
+        self.streaming = streaming
+        self._cookies = Prefetcher(get_cookies, prefetch)
+        self._proxies = Prefetcher(get_proxy, prefetch)
+
+    async def open_session(
+        self, previous: Optional[HttpSession], rotate_cookies: bool
+    ) -> HttpSession:
+        if previous is None or rotate_cookies:
+            ((cookies, _), _), (proxy, _) = await asyncio.gather(
+                self._cookies.get(), self._proxies.get()
+            )
+        else:
+            cookies = previous.cookies
+            proxy, _ = await self._proxies.get()
+        proxy_str = None if not proxy else proxy.proxies[0]
+
+        proxy, proxy_headers = parse_proxy_str(proxy_str)
+        proxies = {} if not proxy else {"http": proxy, "https": proxy}
+        headers = {**base_headers, **proxy_headers}
+
+        return HttpSession(
+            AsyncSession(cookies=cookies, headers=headers, proxies=proxies),
+            cookies,
+            proxy_str,
+        )
+
+    async def close_session(self, session: HttpSession):
+        await session.session.close()
+
+    async def close(self):
+        await asyncio.gather(self._cookies.close(), self._proxies.close())
+
+    def get_limit_keys(self, session: HttpSession) -> dict[str, Optional[str]]:
+        cookie_key = hashlib.sha1(
+            json.dumps(sorted(session.cookies.items())).encode("utf-8")
+        ).hexdigest()
+        return {"proxy": session.proxy_str, "cookies": cookie_key}
+
+    async def fetch(
+        self, session: HttpSession, category: Category, page: int, url: str
+    ) -> tuple[Optional[str], bool, int]:
+        if self.streaming:
+            return await fetch_txt_streaming(category, url, page, session.session)
+        return await fetch_txt(category, url, page, session.session)
+
+
+class RotationSessions:
+    # Sessions of the rotation windows a sliding walk has pages in flight in,
+    # a window's session is closed once its last page has come back
+    def __init__(self, fetcher, rotation: RotationPolicy):
+        self.fetcher = fetcher
+        self.rotation = rotation
+        self.previous = None
+        self.sessions: dict[int, list] = {}
+
+    async def acquire(self, page: int):
+        key = self.rotation.window_end(page)
+        entry = self.sessions.get(key)
+        if entry is None:
+            session = await self.fetcher.open_session(
+                self.previous, self.rotation.rotate_cookies
+            )
+            self.previous = session
+            entry = self.sessions[key] = [session, 0]
+        entry[1] += 1
+        return key, entry[0]
+
+    async def release(self, key: int, next_page: int):
+        self.sessions[key][1] -= 1
+        for key in [
+            key
+            for key, (_, num_of_pages) in self.sessions.items()
+            if num_of_pages == 0 and key < next_page
+        ]:
+            await self.fetcher.close_session(self.sessions.pop(key)[0])
+
+    async def close(self):
+        for session, _ in self.sessions.values():
+            await self.fetcher.close_session(session)
+        self.sessions = {}
+
+
+class EngineConfig:
+    def __init__(
+        self,
+        name: str,
+        sink: Sink,
+        rotation: RotationPolicy,
+        stop_conditions: list[StopCondition],
+        sort_tendency: Optional[SortTendency] = SortTendency.FEATURED,
+        page_start: int = 1,
+        page_end: Optional[int] = None,
+        overwrite: bool = True,
+        load_seen_asins: bool = False,
+        max_concurrent_categories: int = 16,
+        rate_limits: Optional[dict[str, RateLimit]] = None,
+        category_priority: Optional[Callable[[Category], Any]] = None,
+        progress_interval: float = 30.0,
+        progress_path: Optional[str] = None,
+        max_failed_pages: int = 10,
+        pages_in_flight: int = 1,
+        parse_workers: Optional[int] = None,
+        parse_batch_size: int = 8,
+        parse_queue_size: int = 256,
+        asin_index: Optional[AsinIndex] = None,
+    ):
+        self.name = name
+        self.sink = sink
+        self.rotation = rotation
+        self.stop_conditions = stop_conditions
+        self.sort_tendency = sort_tendency
+        self.page_start = max(page_start, 1)
+        self.page_end = page_end
+        self.overwrite = overwrite
+        self.load_seen_asins = load_seen_asins
+        self.max_concurrent_categories = max_concurrent_categories
+        self.rate_limits = rate_limits
+        self.category_priority = category_priority
+        self.progress_interval = progress_interval
+        self.progress_path = progress_path
+        self.max_failed_pages = max_failed_pages
+        self.pages_in_flight = max(pages_in_flight, 1)
+        # Worker processes parsing the pages, one per core by default and none
+        # (a thread of this process) with 0
+        self.parse_workers = parse_workers
+        self.parse_batch_size = parse_batch_size
+        self.parse_queue_size = parse_queue_size
+        # Seen asins are read from the index instead of the sink and every run
+        # adds the asins it found to it
+        self.asin_index = asin_index
+
+        if self.pages_in_flight > 1 and rotation.concurrent:
+            raise ValueError("A sliding window needs a sequential rotation policy")
+
+        # Existing pages are skipped without a fetch, nothing would end the walk
+        if not overwrite and page_end is None:
+            raise ValueError("Keeping existing pages requires a page_end")
+
+
+def preset_v1(
+    page_start: int = 1,
+    page_end: int = 45,
+    batch_size: int = 5,
+    overwrite: bool = False,
+) -> EngineConfig:
+    # Raw responses, unsorted, a new proxy for every batch of concurrent pages
+    # and one cookie set per category, stops on the first empty page
+    return EngineConfig(
+        name="v1",
+        sink=RawTextSink(),
+        rotation=RotationPolicy(
+            batch_size,
+            offset=page_start - 1,
+            rotate_cookies=False,
+            concurrent=True,
+        ),
+        stop_conditions=[
+            EndOfCategory(min_in_page_count=1, match_total=False),
+        ],
+        sort_tendency=None,
+        page_start=page_start,
+        page_end=page_end,
+        overwrite=overwrite,
+        max_concurrent_categories=1,
+        # 0.16 to 0.58 s between two requests
+        rate_limits={**DEFAULT_RATE_LIMITS, "host": RateLimit(1 / 0.16, jitter=0.42)},
+    )
+
+
+def preset_v2(product_cap: int = 70) -> EngineConfig:
+    run_id = str(uuid.uuid4()).split("-")[0]
+    return EngineConfig(
+        name="v2",
+        sink=JsonFileSink("{category.id}_{page}_{run_id}", run_id=run_id),
+        rotation=RotationPolicy(3, concurrent=True),
+        stop_conditions=[EndOfCategory(), ProductCap(product_cap)],
+        sort_tendency=SortTendency.NEWEST_PRODUCTS,
+        max_concurrent_categories=50,
+        rate_limits=DEFAULT_RATE_LIMITS,
+    )
+
+
+def preset_v3(product_cap: int = 10000, pages_in_flight: int = 1) -> EngineConfig:
+    run_id = str(uuid.uuid4()).split("-")[0]
+    return EngineConfig(
+        name="v3",
+        sink=JsonFileSink("{run_id}_{category.id}_{page}", run_id=run_id),
+        rotation=RotationPolicy(3),
+        stop_conditions=[
+            EndOfCategory(),
+            OverlapThreshold(95.0, 10),
+            ProductCap(product_cap),
+        ],
+        sort_tendency=SortTendency.NEWEST_PRODUCTS,
+        load_seen_asins=True,
+        max_concurrent_categories=26,
+        rate_limits=DEFAULT_RATE_LIMITS,
+        pages_in_flight=pages_in_flight,
+    )
+
+
+def preset_v4(product_cap: int = 50000, pages_in_flight: int = 1) -> EngineConfig:
+    return EngineConfig(
+        name="v4",
+        sink=JsonFileSink(
+            "{run_id}_{category.name}_{category.depth}_{page}",
+            run_id=str(uuid.uuid4()),
+        ),
+        rotation=RotationPolicy(8),
+        stop_conditions=[EndOfCategory(), ProductCap(product_cap)],
+        sort_tendency=SortTendency.FEATURED,
+        max_concurrent_categories=16,
+        rate_limits=DEFAULT_RATE_LIMITS,
+        pages_in_flight=pages_in_flight,
+    )
+
+
+def parse_depths(specified_depths: str = "-1", max_depth: int = 20) -> list[int]:
+    if specified_depths == "-1":
+        return list(range(max_depth, 0, -1))
+    return [int(depth) for depth in specified_depths.split(",")]
+
+
+PRESETS = {
+    "v1": preset_v1,
+    "v2": preset_v2,
+    "v3": preset_v3,
+    "v4": preset_v4,
+}
+
+
+class ProductEngine:
+    def __init__(
+        self,
+        config: EngineConfig,
+        fetcher=None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        self.config = config
+        self.fetcher = fetcher or HttpPageFetcher()
+        # Shared by every category of the run, pass one in to share it further
+        self.rate_limiter = rate_limiter or RateLimiter(config.rate_limits)
+        self.parse_stage: Optional[ParseStage] = None
+
+    def _is_kept(self, category: Category, page: int) -> bool:
+        if self.config.overwrite or not self.config.sink.exists(category, page):
+            return False
+        logging.error(f"[{category.name}][{page}]: Page already exists (no overriding)")
+        return True
+
+    async def process_page(
+        self, session, category: Category, base_url: str, qs: dict[str, str], page: int
+    ) -> Optional[ProductPage]:
+        sink = self.config.sink
+        url = build_product_url(base_url, qs, page, self.config.sort_tendency)
+        limit_keys = {
+            **self.fetcher.get_limit_keys(session),
+            "host": urlparser.urlparse(url).netloc,
+        }
+        await self.rate_limiter.acquire(**limit_keys)
+
+        text_data, is_success, status_code = await self.fetcher.fetch(
+            session, category, page, url
+        )
+        if is_success or status_code in BLOCK_STATUS_CODES:
+            self.rate_limiter.report(not is_success, **limit_keys)
+
+        if not is_success:
+            if text_data is not None and (reason := detect_block(text_data)):
+                await sink.write_failure(category, page, text_data, reason)
+            return None
+
+        try:
+            if self.parse_stage:
+                json_data = await self.parse_stage.parse(text_data, sink.needs_products)
+            else:
+                json_data = await asyncio.to_thread(
+                    parse_page, text_data, sink.needs_products
+                )
+            logging.info(f"[{category.name}][{page}]: Parsed raw TXT to dict data")
+        except Exception as e:
+            logging.error(f"[{category.name}][{page}]: Could not parse page: {e}")
+            return None
+
+        return ProductPage(page, text_data, json_data)
+
+    async def _store(self, run: CategoryRun, page: Optional[ProductPage]) -> bool:
+        if page is None:
+            # Without this a blocked session would walk the page numbers forever
+            run.num_of_failures += 1
+            if run.num_of_failures >= self.config.max_failed_pages:
+                run.stop_reason = f"{run.num_of_failures} failed pages in a row"
+                logging.error(f"[{run.category.name}]: Stopping ({run.stop_reason})")
+                return True
+            return False
+
+        run.num_of_failures = 0
+        run.num_of_pages += 1
+        run.num_of_products += page.product_count
+        logging.info(
+            f"[{run.category.name}][{page.page}]: "
+            + f"Product count after update = {run.num_of_products}"
+        )
+        await self.config.sink.write(run, page)
+        if self.config.asin_index is not None:
+            run.new_asins.update(
+                asin for asin in page.asins if asin not in run.seen_asins
+            )
+
+        for condition in self.config.stop_conditions:
+            if reason := condition.check(run, page):
+                run.stop_reason = reason
+                logging.warning(
+                    f"[{run.category.name}][{page.page}]: Stopping ({reason})"
+                )
+                return True
+        return False
+
+    async def _walk_windows(self, run: CategoryRun, base_url: str, qs: dict[str, str]):
+        config = self.config
+        rotation = config.rotation
+        category = run.category
+
+        previous = None
+        session = None
+        page = config.page_start
+        try:
+            while run.stop_reason is None:
+                if config.page_end is not None and page > config.page_end:
+                    run.stop_reason = f"reached last page ({config.page_end})"
+                    break
+
+                window_end = rotation.window_end(page)
+                if config.page_end is not None:
+                    window_end = min(window_end, config.page_end)
+                pages = [
+                    window_page
+                    for window_page in range(page, window_end + 1)
+                    if not self._is_kept(category, window_page)
+                ]
+                page = window_end + 1
+                if not pages:
+                    continue
+
+                session = await self.fetcher.open_session(
+                    previous, rotation.rotate_cookies
+                )
+
+                if rotation.concurrent:
+                    tasks = []
+                    for window_page in pages:
+                        tasks.append(
+                            asyncio.create_task(
+                                self.process_page(
+                                    session, category, base_url, qs, window_page
+                                )
+                            )
+                        )
+
+                    results = await asyncio.gather(*tasks, return_exceptions=True)
+                    for result in results:
+                        if isinstance(result, Exception):
+                            logging.error(f"[{category.name}]: Page failed: {result}")
+                            result = None
+                        if await self._store(run, result):
+                            break
+                else:
+                    for window_page in pages:
+                        result = await self.process_page(
+                            session, category, base_url, qs, window_page
+                        )
+                        if await self._store(run, result):
+                            break
+
+                previous, session = session, None
+                await self.fetcher.close_session(previous)
+        finally:
+            if session is not None:
+                await self.fetcher.close_session(session)
+
+    async def _walk_sliding(self, run: CategoryRun, base_url: str, qs: dict[str, str]):
+        # Keeps `pages_in_flight` pages fetching while the results are stored in
+        # page order, so the files and the stop decisions do not depend on which
+        # response came back first. The first page alone bounds the page range
+        config = self.config
+        category = run.category
+        sessions = RotationSessions(self.fetcher, config.rotation)
+
+        last_page = config.page_end
+        is_bounded = False
+        in_flight: dict[asyncio.Task, tuple[int, int]] = {}
+        finished: dict[int, Optional[ProductPage]] = {}
+        kept: set[int] = set()
+        next_page = next_store = config.page_start
+
+        try:
+            while run.stop_reason is None:
+                while (
+                    len(in_flight) < config.pages_in_flight
+                    and (last_page is None or next_page <= last_page)
+                    and (is_bounded or next_page == next_store)
+                ):
+                    page = next_page
+                    next_page += 1
+                    if self._is_kept(category, page):
+                        kept.add(page)
+                        continue
+
+                    key, session = await sessions.acquire(page)
+                    task = asyncio.create_task(
+                        self.process_page(session, category, base_url, qs, page)
+                    )
+                    in_flight[task] = (page, key)
+
+                if in_flight:
+                    done, _ = await asyncio.wait(
+                        in_flight, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        page, key = in_flight.pop(task)
+                        try:
+                            finished[page] = task.result()
+                        except Exception as e:
+                            logging.error(
+                                f"[{category.name}][{page}]: Page failed: {e}"
+                            )
+                            finished[page] = None
+                        await sessions.release(key, next_page)
+
+                while next_store in finished or next_store in kept:
+                    page = next_store
+                    next_store += 1
+                    if page in kept:
+                        kept.discard(page)
+                        continue
+
+                    result = finished.pop(page)
+                    if await self._store(run, result):
+                        break
+
+                    if not is_bounded and result is not None:
+                        is_bounded = True
+                        if result.in_page_count > 0:
+                            bound = math.ceil(result.total_count / result.in_page_count)
+                            last_page = (
+                                bound if last_page is None else min(last_page, bound)
+                            )
+                            logging.info(
+                                f"[{category.name}]: Page range bounded to {last_page}"
+                            )
+
+                if (
+                    run.stop_reason is None
+                    and not in_flight
+                    and next_store == next_page
+                    and last_page is not None
+                    and next_page > last_page
+                ):
+                    run.stop_reason = f"reached last page ({last_page})"
+        finally:
+            # Requests past the end of the category are of no use
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            await sessions.close()
+
+    async def _prepare_run(self, category: Category) -> CategoryRun:
+        seen_asins = None
+        if self.config.load_seen_asins and self.config.asin_index is not None:
+            seen_asins = await asyncio.to_thread(
+                self.config.asin_index.get, str(category.id)
+            )
+        elif self.config.load_seen_asins:
+            seen_asins = await asyncio.to_thread(self.config.sink.load_asins, category)
+        return CategoryRun(category, seen_asins)
+
+    async def walk_category(self, run: CategoryRun):
+        category = run.category
+        logging.info(f"[{category.name}]: Scraping category")
+        base_url, qs = preprocess_url_parts(category.url)
+
+        if self.config.pages_in_flight > 1:
+            await self._walk_sliding(run, base_url, qs)
+        else:
+            await self._walk_windows(run, base_url, qs)
+
+        if self.config.asin_index is not None and run.new_asins:
+            await asyncio.to_thread(
+                self.config.asin_index.append, str(category.id), run.new_asins
+            )
+
+        logging.info(
+            f"[{category.name}]: Finished processing "
+            + f"({run.num_of_pages} pages, {run.num_of_products} products)"
+        )
+
+    async def process_category(
+        self, category: Category, seen_asins: Optional[Container[str]] = None
+    ) -> CategoryRun:
+        run = CategoryRun(category, seen_asins)
+        await self.walk_category(run)
+        return run
+
+    async def process_categories(self, categories: list[Category]) -> list[CategoryRun]:
+        config = self.config
+        if config.parse_workers != 0:
+            self.parse_stage = ParseStage(
+                parse_page,
+                config.parse_workers,
+                config.parse_batch_size,
+                config.parse_queue_size,
+            )
+            await self.parse_stage.start()
+
+        scheduler = CategoryScheduler(
+            config.name,
+            config.max_concurrent_categories,
+            config.category_priority,
+            config.progress_interval,
+            config.progress_path,
+            self._get_metrics,
+        )
+        try:
+            return await scheduler.run(
+                categories, self._prepare_run, self.walk_category
+            )
+        finally:
+            await self.fetcher.close()
+            await config.sink.close()
+            if self.parse_stage:
+                await self.parse_stage.close()
+                self.parse_stage = None
+
+    def _get_metrics(self) -> dict[str, Any]:
+        if not self.parse_stage:
+            return {}
+        return {"parse": self.parse_stage.get_metrics()}
+
+    async def execute_pipeline(
+        self,
+        depths: list[int],
+        max_categories_per_depth: int = -1,
+        categories_to_scrape: str = "",
+    ) -> list[CategoryRun]:
+        try:
+            return await self._execute_pipeline(
+                depths, max_categories_per_depth, categories_to_scrape
+            )
+        finally:
+            await ApiClient().close()
+
+    async def _execute_pipeline(
+        self,
+        depths: list[int],
+        max_categories_per_depth: int,
+        categories_to_scrape: str,
+    ) -> list[CategoryRun]:
+        # One request for every depth to be processed instead of one per depth
+        categories_by_depth, status_code = await get_category_tree(
+            min(depths), max(depths)
+        )
+        if status_code != 200:
+            logging.error(f"Failed to fetch category tree of depths {depths}")
+            return []
+
+        filter_category_names = (
+            set() if not categories_to_scrape else set(categories_to_scrape.split("|"))
+        )
+
+        # Every depth goes into one queue, the workers do not wait for the
+        # slowest category of a depth before starting on the next one
+        all_categories = []
+        for depth in depths:
+            categories = categories_by_depth.get(depth, [])
+            if not categories:
+                logging.warning(f"No category to scrape, skipping depth {depth}")
+                continue
+
+            if max_categories_per_depth > -1:
+                categories = categories[:max_categories_per_depth]
+
+            if filter_category_names:
+                categories = [
+                    category
+                    for category in categories
+                    if (
+                        category.ancestor is None
+                        and category.name in filter_category_names
+                    )
+                    or category.ancestor in filter_category_names
+                ]
+
+            logging.info(
+                f"[{self.config.name}]: Queued {len(categories)} of depth {depth}"
+            )
+            all_categories.extend(categories)
+
+        return await self.process_categories(all_categories)
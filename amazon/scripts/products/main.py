@@ -6,6 +6,10 @@ import asyncio
 import preprocessor
 import scraper
 
+from engine import PRESETS, HttpPageFetcher, ProductEngine, SegmentSink, parse_depths
+from asin_index import AsinIndex
+from scheduler import largest_first, load_estimates
+
 from shared.config.logger import setup_logger
 
 
@@ -22,6 +26,35 @@ def preprocess(args):
 
 
 def scrape(args):
+    if args.preset != "v1":
+        preset_kwargs = {}
+        if args.max_products_per_category is not None:
+            preset_kwargs["product_cap"] = args.max_products_per_category
+        if args.pages_in_flight > 1:
+            preset_kwargs["pages_in_flight"] = args.pages_in_flight
+
+        config = PRESETS[args.preset](**preset_kwargs)
+        config.parse_workers = args.parse_workers
+        if args.segmented:
+            config.sink = SegmentSink(run_id=config.sink.run_id)
+        if args.asin_index:
+            config.asin_index = AsinIndex(args.asin_index)
+        config.progress_path = args.progress_file
+        if args.estimates_file:
+            config.category_priority = largest_first(
+                load_estimates(args.estimates_file)
+            )
+
+        engine = ProductEngine(config, HttpPageFetcher(streaming=not args.buffered))
+        asyncio.run(
+            engine.execute_pipeline(
+                parse_depths(args.depths),
+                args.max_categories_per_depth,
+                args.categories,
+            )
+        )
+        return
+
     # Start the scraping process
     asyncio.run(
         scraper.execute_pipeline(
@@ -99,12 +132,87 @@ def main():
         help="Maximum pages per category.",
     )
     scrape_parser.add_argument("--overwrite", action="store_true")
+    scrape_parser.add_argument(
+        "--preset",
+        type=str,
+        choices=list(PRESETS),
+        default="v1",
+        help="Scraper version to reproduce, the page options only apply to v1.",
+    )
+    scrape_parser.add_argument(
+        "--max_products_per_category",
+        type=int,
+        default=None,
+        help="Product cap of the v2-v4 presets (preset default if omitted).",
+    )
+    scrape_parser.add_argument(
+        "--depths",
+        type=str,
+        default="-1",
+        help="Comma separated depths for v2-v4 (-1 for 20 down to 1).",
+    )
+    scrape_parser.add_argument(
+        "--pages_in_flight",
+        type=int,
+        default=1,
+        help="Pages fetched at once per category (v3 and v4 only).",
+    )
+    scrape_parser.add_argument(
+        "--parse_workers",
+        type=int,
+        default=None,
+        help="Page parsing processes of v2-v4, one per core by default, 0 for none.",
+    )
+    scrape_parser.add_argument(
+        "--progress_file",
+        type=str,
+        default=None,
+        help="JSON file the per-category progress is written to (v2-v4).",
+    )
+    scrape_parser.add_argument(
+        "--estimates_file",
+        type=str,
+        default=None,
+        help="Progress file of an earlier run, its largest categories go first.",
+    )
+    scrape_parser.add_argument(
+        "--max_categories_per_depth", type=int, default=-1, help="-1 for all."
+    )
+    scrape_parser.add_argument(
+        "--segmented",
+        action="store_true",
+        help="Append pages to compressed NDJSON segments, not a file each (v2-v4).",
+    )
+    scrape_parser.add_argument(
+        "--asin_index",
+        type=str,
+        default=None,
+        help="ASIN index directory, read for seen asins and added to (v2-v4).",
+    )
+    scrape_parser.add_argument(
+        "--buffered",
+        action="store_true",
+        help="Download whole pages before checking them for blocks (v2-v4).",
+    )
+    scrape_parser.add_argument(
+        "--categories",
+        type=str,
+        default="",
+        help="'|' separated root categories to restrict v2-v4 to.",
+    )
 
     args = parser.parse_args()
 
     # Setup logger
     setup_logger()
 
+    if (
+        args.command == "scrape"
+        and args.pages_in_flight > 1
+        and args.preset not in {"v3", "v4"}
+    ):
+        parser.error("--pages_in_flight only applies to the v3 and v4 presets")
+
     # Execute the appropriate command
     if args.command == "preprocess":
         preprocess(args)
@@ -0,0 +1,127 @@
+import json
+import codecs
+
+from typing import Any, Optional
+from search_records import SEPARATOR, HEADER_RE, MAX_HEADER_LENGTH, WHITESPACE_RE
+
+# A response body is looked at while it arrives. A block marker settles the
+# page at once, so does the metadata record of a page without products, which
+# comes ahead of the slots. The rest of such a body is never downloaded: a
+# blocked page is kept as far as it was read, an empty one up to the end of
+# its metadata record, which parses the same as the whole page would
+
+# In the order `detect_block` checks them
+BLOCK_MARKERS = (
+    ("data-redirect", "redirect"),
+    ("To discuss automated access", "automation_detected"),
+)
+MAX_MARKER_LENGTH = max(len(marker) for marker, _ in BLOCK_MARKERS)
+METADATA_KEY = "data-search-metadata"
+
+
+class PageScanner:
+    def __init__(self, encoding: str = "utf-8"):
+        # Decoded the way Response.text does, a character may span two chunks
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.outcome: Optional[str] = None
+        self.metadata: Optional[dict[str, Any]] = None
+        self._chunks: list[str] = []
+        self._tail = ""
+        self._end: Optional[int] = None
+
+        # Records ahead of the metadata one, `_pending` starts at `_offset`
+        # of the text. Only the key of a skipped record is read
+        self._is_scanning = True
+        self._pending = ""
+        self._offset = 0
+        self._key: Optional[str] = None
+        self._searched = 0
+
+    def feed(self, data: bytes) -> Optional[str]:
+        # The outcome ("redirect", "automation_detected" or "empty") once the
+        # rest of the body does not matter any more
+        if self.outcome is not None:
+            return self.outcome
+        text = self._decoder.decode(data)
+        if not text:
+            return None
+        self._chunks.append(text)
+
+        # A marker may start in the previous chunk
+        window = self._tail + text
+        for marker, reason in BLOCK_MARKERS:
+            if marker in window:
+                self.outcome = reason
+                return reason
+        self._tail = window[-(MAX_MARKER_LENGTH - 1) :]
+
+        if self._is_scanning:
+            self._pending += text
+            self._scan()
+        return self.outcome
+
+    def _scan(self):
+        while self._is_scanning:
+            if self._key is None:
+                start = WHITESPACE_RE.match(self._pending).end()
+                header = HEADER_RE.match(self._pending, start)
+                if header is None:
+                    if len(self._pending) - start > MAX_HEADER_LENGTH:
+                        # Not a record, the parser will have to make sense of it
+                        self._is_scanning = False
+                    return
+                self._key = header.group(1)
+                self._searched = header.end()
+
+            end = self._pending.find(SEPARATOR, self._searched)
+            if end == -1:
+                if self._key == METADATA_KEY:
+                    self._searched = max(
+                        self._searched, len(self._pending) - len(SEPARATOR) + 1
+                    )
+                else:
+                    # A separator may start at the end of this chunk
+                    kept = self._pending[-(len(SEPARATOR) - 1) :]
+                    self._offset += len(self._pending) - len(kept)
+                    self._pending = kept
+                    self._searched = 0
+                return
+
+            record_end = end + len(SEPARATOR)
+            if self._key != METADATA_KEY:
+                self._offset += record_end
+                self._pending = self._pending[record_end:]
+                self._key = None
+                continue
+
+            try:
+                record = json.loads(self._pending[:end])
+            except json.JSONDecodeError:
+                # The separator was inside a string
+                self._searched = record_end
+                continue
+            self._read_metadata(record, self._offset + record_end)
+
+    def _read_metadata(self, record: list, end: int):
+        self._is_scanning = False
+        self._pending = ""
+        try:
+            metadata = record[2]["metadata"]
+        except (IndexError, KeyError, TypeError):
+            return
+        if not isinstance(metadata, dict):
+            return
+
+        self.metadata = metadata
+        if metadata.get("asinOnPageCount") == 0:
+            self.outcome = "empty"
+            self._end = end
+
+    def get_text(self) -> str:
+        if self.outcome is None:
+            self._chunks.append(self._decoder.decode(b"", final=True))
+        text = "".join(self._chunks)
+        return text if self._end is None else text[: self._end]
@@ -0,0 +1,174 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+# Pages are parsed in worker processes, the event loop only ships the text out
+# and the dict back, so parsing neither holds the GIL of the fetchers nor is
+# limited to one core. Fetchers put their pages on a bounded queue and wait
+# when the workers fall behind, a free worker takes as many queued pages as a
+# batch holds, which amortizes the round trip to the process under load
+
+
+def run_batch(func: Callable, items: list[tuple]) -> list[tuple[Any, Any, float]]:
+    # One failing page does not take the others of its batch down
+    results = []
+    for args in items:
+        start = time.perf_counter()
+        try:
+            result, error = func(*args), None
+        except Exception as e:
+            result, error = None, e
+        results.append((result, error, time.perf_counter() - start))
+    return results
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+class ParseMetrics:
+    # Latency is from the page being queued to its result being back, parse
+    # time is the part spent in the worker. Both over the last `window` pages
+    def __init__(self, window: int = 1000):
+        self.num_of_pages = 0
+        self.num_of_batches = 0
+        self.num_of_errors = 0
+        self.max_queued = 0
+        self.started_at = time.monotonic()
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._parse_times: deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float, parse_time: float, is_error: bool):
+        self.num_of_pages += 1
+        self.num_of_errors += is_error
+        self._latencies.append(latency)
+        self._parse_times.append(parse_time)
+
+    def get(self, queued: int, batches_in_flight: int) -> dict[str, Any]:
+        latencies = list(self._latencies)
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "pages": self.num_of_pages,
+            "batches": self.num_of_batches,
+            "errors": self.num_of_errors,
+            "queued": queued,
+            "max_queued": self.max_queued,
+            "batches_in_flight": batches_in_flight,
+            "pages_per_second": round(self.num_of_pages / elapsed, 1),
+            "latency_ms": {
+                "mean": round(sum(latencies) / max(len(latencies), 1) * 1000, 1),
+                "p50": round(_percentile(latencies, 0.5) * 1000, 1),
+                "p95": round(_percentile(latencies, 0.95) * 1000, 1),
+            },
+            "parse_ms": round(
+                sum(self._parse_times) / max(len(self._parse_times), 1) * 1000, 1
+            ),
+        }
+
+
+class ParseStage:
+    def __init__(
+        self,
+        func: Callable,
+        num_workers: Optional[int] = None,
+        batch_size: int = 8,
+        max_queued: int = 256,
+    ):
+        # `func` runs in another process, it has to be a module level function
+        self.func = func
+        self.num_workers = max(num_workers or os.cpu_count() or 1, 1)
+        self.batch_size = max(batch_size, 1)
+        self.max_queued = max_queued
+        self.metrics = ParseMetrics()
+
+        self._executor: ProcessPoolExecutor = None
+        self._queue: asyncio.Queue = None
+        self._slots: asyncio.Semaphore = None
+        self._dispatcher: asyncio.Task = None
+        self._batches: set[asyncio.Task] = set()
+
+    async def start(self):
+        # Not forked, the children would inherit the event loop and the curl
+        # threads of the parent in whatever state they are in. Spawned children
+        # import the main module, its entry point has to be guarded
+        self._executor = ProcessPoolExecutor(
+            self.num_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._queue = asyncio.Queue(self.max_queued)
+        self._slots = asyncio.Semaphore(self.num_workers)
+        self.metrics = ParseMetrics()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def parse(self, *args) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((time.monotonic(), args, future))
+        self.metrics.max_queued = max(self.metrics.max_queued, self._queue.qsize())
+        return await future
+
+    async def _dispatch(self):
+        while True:
+            # A batch is only cut when a worker is free to take it
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            task = asyncio.create_task(self._run(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run(self, batch: list[tuple[float, tuple, asyncio.Future]]):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._executor, run_batch, self.func, [args for _, args, _ in batch]
+            )
+        except Exception as e:
+            logging.error(f"[parse]: Batch of {len(batch)} pages failed: {e}")
+            results = [(None, e, 0.0)] * len(batch)
+        except asyncio.CancelledError:
+            for _, _, future in batch:
+                future.cancel()
+            raise
+        finally:
+            self._slots.release()
+
+        now = time.monotonic()
+        self.metrics.num_of_batches += 1
+        for (queued_at, _, future), (result, error, parse_time) in zip(batch, results):
+            self.metrics.record(now - queued_at, parse_time, error is not None)
+            # The walk which queued the page may have been cancelled meanwhile
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def get_metrics(self) -> dict[str, Any]:
+        return self.metrics.get(
+            self._queue.qsize() if self._queue else 0, len(self._batches)
+        )
+
+    async def close(self):
+        if self._executor is None:
+            return
+
+        self._dispatcher.cancel()
+        for task in list(self._batches):
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._batches, return_exceptions=True)
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            future.cancel()
+
+        await asyncio.to_thread(self._executor.shutdown, True, cancel_futures=True)
+        self._executor = None
@@ -8,6 +8,7 @@ import bs4
 
 from multiprocessing import cpu_count
 from concurrent.futures import ProcessPoolExecutor, wait
+from search_records import parse_record_file
 
 
 def data_checker(data_dir: str):
@@ -48,14 +49,11 @@ def process_txt_file(name: str, data_dir: str, out_dir: str, overwrite=False):
 
     logging.info(f"TXT: Processing {name}")
     with open(txt_file_dir, "r") as file:
-        txt_data = file.read()
+        # Only the records process_json_file looks at, each one followed by its
+        # index in the response
+        json_data = [[*record, index] for index, _, record in parse_record_file(file)]
 
     with open(json_file_dir, "w") as file:
-        json_data = txt_data.replace("&&&", ",", txt_data.count("&&&") - 1).replace(
-            "&&&", ""
-        )
-        json_data = json.loads(f"[{json_data}]")
-
         json.dump(json_data, file, indent=2)
         logging.info(f"TXT: Converted {txt_file_dir} to {json_file_dir}")
 
@@ -85,7 +83,8 @@ def process_json_file(json_file_dir: str):
         ):
             k = "metadata"
             new_json_record = {
-                "node_index": i,
+                # Files written before the records were filtered have no index
+                "node_index": record[3] if len(record) > 3 else i,
                 "node_key": record[1],
                 **{f"item_{k}": v for k, v in record[2].items()},
             }
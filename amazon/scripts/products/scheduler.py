@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+from typing import Any, Awaitable, Callable, Optional
+from shared.models.category import Category
+
+# A fixed number of workers pull categories from a priority queue, so a huge
+# category only holds its own worker and the others keep going until the
+# queue is empty. Runs are reported while they are in progress, the progress
+# file of one run is the size estimate of the next
+
+
+def load_estimates(progress_path: str) -> dict[str, int]:
+    try:
+        with open(progress_path, "r") as file:
+            progress = json.load(file)
+    except (OSError, ValueError) as e:
+        logging.warning(f"No size estimates from {progress_path}: {e}")
+        return {}
+
+    return {
+        path: category["products"]
+        for path, category in progress.get("categories", {}).items()
+    }
+
+
+def largest_first(estimates: dict[str, int]) -> Callable[[Category], Any]:
+    # Longest jobs first keeps the tail of the run short. Categories which
+    # were never scraped could be of any size, they go before the known ones
+    unknown = max(estimates.values(), default=0) + 1
+
+    def priority(category: Category) -> int:
+        return -estimates.get(category.path, unknown)
+
+    return priority
+
+
+class CategoryScheduler:
+    def __init__(
+        self,
+        name: str,
+        num_workers: int,
+        priority: Optional[Callable[[Category], Any]] = None,
+        progress_interval: float = 30.0,
+        progress_path: Optional[str] = None,
+        metrics: Optional[Callable[[], dict[str, Any]]] = None,
+    ):
+        self.name = name
+        self.num_workers = max(num_workers, 1)
+        self.priority = priority
+        self.progress_interval = progress_interval
+        self.progress_path = progress_path
+        # Stages shared by the categories (parsing) report through this
+        self.metrics = metrics
+
+        self._queue: asyncio.PriorityQueue = None
+        self._running: dict[int, Any] = {}
+        self._finished: list[tuple[int, Any]] = []
+        self._started_at = 0.0
+
+    async def _worker(
+        self,
+        prepare: Callable[[Category], Awaitable[Any]],
+        walk: Callable[[Any], Awaitable[None]],
+    ):
+        while True:
+            try:
+                _, index, category = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            try:
+                run = await prepare(category)
+                self._running[index] = run
+                try:
+                    await walk(run)
+                finally:
+                    del self._running[index]
+                self._finished.append((index, run))
+            except Exception as e:
+                logging.error(f"[{self.name}][{category.name}]: Category failed: {e}")
+
+    def _get_progress(self) -> dict[str, Any]:
+        def summarize(run, done: bool):
+            return {
+                "pages": run.num_of_pages,
+                "products": run.num_of_products,
+                "stop_reason": run.stop_reason,
+                "done": done,
+            }
+
+        categories = {
+            run.category.path: summarize(run, True) for _, run in self._finished
+        }
+        for run in self._running.values():
+            categories[run.category.path] = summarize(run, False)
+
+        return {
+            "name": self.name,
+            "elapsed": round(time.monotonic() - self._started_at, 1),
+            "done": len(self._finished),
+            "running": len(self._running),
+            "queued": self._queue.qsize(),
+            "metrics": self.metrics() if self.metrics else {},
+            "categories": categories,
+        }
+
+    def _report(self):
+        progress = self._get_progress()
+        logging.info(
+            f"[{self.name}]: {progress['done']} categories done, "
+            + f"{progress['running']} running, {progress['queued']} queued "
+            + f"({progress['elapsed']} s)"
+        )
+        for stage, metrics in progress["metrics"].items():
+            logging.info(f"[{self.name}][{stage}]: {json.dumps(metrics)}")
+        for run in self._running.values():
+            logging.info(
+                f"[{self.name}][{run.category.name}]: "
+                + f"{run.num_of_pages} pages, {run.num_of_products} products so far"
+            )
+
+        if self.progress_path:
+            # Readers never see a half written file
+            tmp_path = f"{self.progress_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(progress, file, ensure_ascii=False)
+            os.replace(tmp_path, self.progress_path)
+
+    async def _report_periodically(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self._report()
+
+    async def run(
+        self,
+        categories: list[Category],
+        prepare: Callable[[Category], Awaitable[Any]],
+        walk: Callable[[Any], Awaitable[None]],
+    ) -> list:
+        self._queue = asyncio.PriorityQueue()
+        self._running = {}
+        self._finished = []
+        self._started_at = time.monotonic()
+
+        # The index keeps equal priorities in input order
+        for index, category in enumerate(categories):
+            priority = self.priority(category) if self.priority else 0
+            self._queue.put_nowait((priority, index, category))
+
+        reporter = asyncio.create_task(self._report_periodically())
+        try:
+            await asyncio.gather(
+                *(
+                    self._worker(prepare, walk)
+                    for _ in range(min(self.num_workers, len(categories)))
+                )
+            )
+        finally:
+            reporter.cancel()
+            await asyncio.gather(reporter, return_exceptions=True)
+            self._report()
+
+        return [run for _, run in sorted(self._finished, key=lambda item: item[0])]
@@ -0,0 +1,177 @@
+import re
+import json
+
+from typing import Callable, Iterator, TextIO
+
+# A search response is a run of JSON arrays ["dispatch", key, payload], each
+# one followed by "&&&". Only a few keys are of any use, the stream reads the
+# key at the head of a record and decodes the record only when it is wanted,
+# the others are skipped over without being parsed or kept. Text is read in
+# chunks and dropped once scanned, a file never has to be held in memory
+
+SEPARATOR = "&&&"
+SEARCH_KEYWORDS = ("data-search-metadata", "data-main-slot:search-result")
+
+WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+# The opening bracket, the first string and the key of a record
+HEADER_RE = re.compile(
+    r'\[[ \t\n\r]*"(?:[^"\\]|\\.)*"[ \t\n\r]*,[ \t\n\r]*"((?:[^"\\]|\\.)*)"'
+)
+# A longer head without a match is not a record
+MAX_HEADER_LENGTH = 4096
+
+_decoder = json.JSONDecoder()
+
+
+def _is_wanted(key: str, keywords: tuple[str, ...]) -> bool:
+    return any(keyword in key for keyword in keywords)
+
+
+class RecordStream:
+    def __init__(
+        self,
+        read: Callable[[int], str],
+        keywords: tuple[str, ...] = SEARCH_KEYWORDS,
+        chunk_size: int = 1 << 16,
+    ):
+        self.read = read
+        self.keywords = keywords
+        self.chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        self._is_eof = False
+
+    def _fill(self) -> bool:
+        # Text before the position is dropped, positions shift by its length
+        if self._is_eof:
+            return False
+        chunk = self.read(self.chunk_size)
+        if not chunk:
+            self._is_eof = True
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            self._pos = WHITESPACE_RE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                return
+
+    def _read_header(self):
+        while True:
+            header = HEADER_RE.match(self._buffer, self._pos)
+            if header:
+                return header
+            if len(self._buffer) - self._pos > MAX_HEADER_LENGTH or not self._fill():
+                raise ValueError(f"No record at {self._buffer[self._pos:][:40]!r}")
+
+    def _raw_decode(self) -> list:
+        record, self._pos = _decoder.raw_decode(self._buffer, self._pos)
+        return record
+
+    def _decode(self) -> list:
+        # The first separator after the head almost always ends the record,
+        # the decoder only runs again when that one was inside a string
+        searched = self._pos
+        while True:
+            end = self._buffer.find(SEPARATOR, searched)
+            if end == -1:
+                searched = max(self._pos, len(self._buffer) - len(SEPARATOR) + 1)
+                offset = self._pos
+                if self._fill():
+                    searched -= offset
+                    continue
+                return self._raw_decode()
+
+            try:
+                return self._raw_decode()
+            except json.JSONDecodeError:
+                searched = end + len(SEPARATOR)
+
+    def _read_separator(self):
+        self._skip_whitespace()
+        while len(self._buffer) - self._pos < len(SEPARATOR) and self._fill():
+            pass
+        if self._buffer.startswith(SEPARATOR, self._pos):
+            self._pos += len(SEPARATOR)
+        elif self._pos < len(self._buffer):
+            raise ValueError(f"Expected {SEPARATOR} after a record")
+
+    def _skip_record(self):
+        while True:
+            end = self._buffer.find(SEPARATOR, self._pos)
+            if end != -1:
+                self._pos = end + len(SEPARATOR)
+                return
+            # A separator may start at the end of this chunk
+            self._pos = max(self._pos, len(self._buffer) - len(SEPARATOR) + 1)
+            if not self._fill():
+                self._pos = len(self._buffer)
+                return
+
+    def __iter__(self) -> Iterator[tuple[int, str, list]]:
+        index = 0
+        while True:
+            self._skip_whitespace()
+            if self._pos == len(self._buffer):
+                return
+
+            header = self._read_header()
+            key = header.group(1)
+            if "\\" in key:
+                key = json.loads(f'"{key}"')
+
+            if _is_wanted(key, self.keywords):
+                record = self._decode()
+                self._read_separator()
+                yield index, key, record
+            else:
+                self._pos = header.end()
+                self._skip_record()
+            index += 1
+
+
+def _read_text(content: str) -> Callable[[int], str]:
+    # io.StringIO would copy the whole text into a buffer of its own
+    pos = 0
+
+    def read(size: int) -> str:
+        nonlocal pos
+        chunk = content[pos : pos + size]
+        pos += len(chunk)
+        return chunk
+
+    return read
+
+
+def decode_records(
+    content: str, keywords: tuple[str, ...] = SEARCH_KEYWORDS
+) -> Iterator[tuple[int, str, list]]:
+    # Every record at once, the way the responses were read before the stream
+    json_data = content.replace(SEPARATOR, ",", content.count(SEPARATOR) - 1)
+    json_data = json_data.replace(SEPARATOR, "")
+    for index, record in enumerate(json.loads(f"[{json_data}]")):
+        if _is_wanted(record[1], keywords):
+            yield index, record[1], record
+
+
+def parse_records(
+    content: str, keywords: tuple[str, ...] = SEARCH_KEYWORDS
+) -> list[tuple[int, str, list]]:
+    try:
+        return list(RecordStream(_read_text(content), keywords))
+    except ValueError:
+        # A separator inside a skipped string throws the stream off
+        return list(decode_records(content, keywords))
+
+
+def parse_record_file(
+    file: TextIO, keywords: tuple[str, ...] = SEARCH_KEYWORDS
+) -> list[tuple[int, str, list]]:
+    try:
+        return list(RecordStream(file.read, keywords))
+    except ValueError:
+        file.seek(0)
+        return list(decode_records(file.read(), keywords))
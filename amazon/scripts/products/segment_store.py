@@ -0,0 +1,163 @@
+import os
+import re
+import gzip
+import json
+import asyncio
+
+from collections import defaultdict
+from typing import Any, Iterator, Optional
+
+# Pages of a run are appended to a few gzip compressed NDJSON segments instead
+# of a file each. A page is one line and one gzip member of its own, a segment
+# is read as a whole with gzip/zcat or page by page from the offsets in the
+# index. The index is one NDJSON line per page, written once the page is in its
+# segment, so every entry points to a complete member
+
+SEGMENT_SUFFIX = ".ndjson.gz"
+INDEX_SUFFIX = ".index.ndjson"
+
+
+def get_segment_name(run_id: str, number: int) -> str:
+    return f"{run_id}-{number:05d}{SEGMENT_SUFFIX}"
+
+
+def get_index_path(data_dir: str, run_id: str) -> str:
+    return f"{data_dir}/{run_id}{INDEX_SUFFIX}"
+
+
+def encode_page(record: dict[str, Any], compresslevel: int) -> bytes:
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    return gzip.compress(line.encode("utf-8"), compresslevel, mtime=0)
+
+
+class SegmentWriter:
+    def __init__(
+        self,
+        data_dir: str,
+        run_id: str,
+        max_segment_size: int = 64 << 20,
+        compresslevel: int = 6,
+    ):
+        self.data_dir = data_dir
+        self.run_id = run_id
+        self.max_segment_size = max_segment_size
+        self.compresslevel = compresslevel
+
+        self._lock: Optional[asyncio.Lock] = None
+        self._segment = None
+        self._segment_name: Optional[str] = None
+        self._segment_size = 0
+        self._index = None
+        # A resumed run starts a segment of its own after the existing ones
+        segment_re = re.compile(
+            re.escape(self.run_id) + r"-(\d+)" + re.escape(SEGMENT_SUFFIX)
+        )
+        self._next_number = 1 + max(
+            (
+                int(match.group(1))
+                for name in os.listdir(self.data_dir)
+                if (match := segment_re.fullmatch(name))
+            ),
+            default=-1,
+        )
+
+    def _roll(self):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment_name = get_segment_name(self.run_id, self._next_number)
+        self._segment = open(f"{self.data_dir}/{self._segment_name}", "ab")
+        self._segment_size = 0
+        self._next_number += 1
+
+    def _append(self, entry: dict[str, Any], member: bytes) -> dict[str, Any]:
+        if self._segment is None or (
+            self._segment_size
+            and self._segment_size + len(member) > self.max_segment_size
+        ):
+            self._roll()
+        if self._index is None:
+            self._index = open(get_index_path(self.data_dir, self.run_id), "a")
+
+        entry = {
+            **entry,
+            "segment": self._segment_name,
+            "offset": self._segment_size,
+            "length": len(member),
+        }
+        self._segment.write(member)
+        self._segment.flush()
+        self._segment_size += len(member)
+        self._index.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._index.flush()
+        return entry
+
+    async def write(
+        self, entry: dict[str, Any], record: dict[str, Any]
+    ) -> dict[str, Any]:
+        # Pages are compressed side by side, only the appends take turns
+        member = await asyncio.to_thread(encode_page, record, self.compresslevel)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            return await asyncio.to_thread(self._append, entry, member)
+
+    def close(self):
+        for file in (self._segment, self._index):
+            if file is not None:
+                file.close()
+        self._segment = None
+        self._index = None
+
+
+def load_index(data_dir: str, run_id: Optional[str] = None) -> list[dict[str, Any]]:
+    # Entries of one run, or of every run in the directory
+    if run_id is not None:
+        paths = [get_index_path(data_dir, run_id)]
+    else:
+        paths = [
+            f"{data_dir}/{name}"
+            for name in sorted(os.listdir(data_dir))
+            if name.endswith(INDEX_SUFFIX)
+        ]
+
+    entries = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r") as file:
+            for line in file:
+                # The last line of a run which was killed may be cut short
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+    return entries
+
+
+def read_pages(
+    data_dir: str,
+    entries: list[dict[str, Any]],
+) -> Iterator[tuple[dict[str, Any], dict[str, Any]]]:
+    # Only the members of the given entries are read, one segment at a time
+    by_segment = defaultdict(list)
+    for entry in entries:
+        by_segment[entry["segment"]].append(entry)
+
+    for segment_name, segment_entries in by_segment.items():
+        with open(f"{data_dir}/{segment_name}", "rb") as file:
+            for entry in sorted(segment_entries, key=lambda entry: entry["offset"]):
+                file.seek(entry["offset"])
+                member = file.read(entry["length"])
+                yield entry, json.loads(gzip.decompress(member))
+
+
+def read_category(
+    data_dir: str, category_id: str, run_id: Optional[str] = None
+) -> Iterator[tuple[dict[str, Any], dict[str, Any]]]:
+    entries = [
+        entry
+        for entry in load_index(data_dir, run_id)
+        if entry["category_id"] == category_id
+    ]
+    entries.sort(key=lambda entry: entry["page"])
+    return read_pages(data_dir, entries)
@@ -13,3 +13,12 @@ class Category(BaseModel):
     path: str
     url: str
     is_leaf: bool = False
+    node_id: Optional[int] = None
+    parent_node_id: Optional[int] = None
+
+
+class CategoryReplaceStats(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+class CrawlUnit(BaseModel):
+    id: int
+    run_id: str
+    keyword: str
+    # Category names below the keyword root, empty for the whole keyword tree
+    path: list[str] = []
+    url: Optional[str] = None
+    attempts: int = 0
+
+
+class CrawlQueueStats(BaseModel):
+    pending: int = 0
+    claimed: int = 0
+    done: int = 0
+    failed: int = 0
@@ -0,0 +1,246 @@
+import json
+import base64
+import bisect
+
+from typing import Iterable, Optional, Sequence
+from shared.models.category import Category
+
+
+def encode_cursor(category: Category) -> str:
+    raw = json.dumps([category.depth, category.name, category.path], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[int, str, str]:
+    # Names are not unique within a level, the path breaks ties. Cursors handed
+    # out before it was added resume at the first category with that name
+    depth, name, *rest = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    path = rest[0] if rest else ""
+    return int(depth), str(name), str(path)
+
+
+def paginate(
+    categories: Sequence[Category],
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    depth_desc: bool = False,
+) -> tuple[Sequence[Category], Optional[str]]:
+    # Keyset pagination over a listing sorted by (depth, name, path), or by
+    # (depth DESC, name, path) for the non-strict depth listing
+    def sort_key(depth: int, name: str, path: str):
+        return (-depth if depth_desc else depth, name, path)
+
+    start = 0
+    if after is not None:
+        start = bisect.bisect_right(
+            categories,
+            sort_key(*decode_cursor(after)),
+            key=lambda category: sort_key(category.depth, category.name, category.path),
+        )
+
+    if limit is None:
+        return categories[start:], None
+
+    end = start + limit
+    page = categories[start:end]
+    next_cursor = encode_cursor(page[-1]) if page and end < len(categories) else None
+    return page, next_cursor
+
+
+class CategoryIndex:
+    # Immutable snapshot of the category table, every lookup is a dict hit
+    # followed by a copy of the matching bucket
+    __slots__ = (
+        "version",
+        "size",
+        "_by_name",
+        "_by_node_id",
+        "_by_depth",
+        "_by_parent",
+        "_by_ancestor",
+        "_by_ancestor_depth",
+        "_by_leaf",
+        "_depths_desc",
+        "_by_key",
+        "_children",
+        "_children_by_node_id",
+    )
+
+    def __init__(self, categories: Iterable[Category] = (), version: int = 0):
+        by_name: dict[str, Category] = {}
+        by_node_id: dict[int, Category] = {}
+        by_depth: dict[int, list[Category]] = {}
+        by_parent: dict[str, list[Category]] = {}
+        by_ancestor: dict[str, list[Category]] = {}
+        by_ancestor_depth: dict[str, dict[int, list[Category]]] = {}
+        by_leaf: dict[bool, list[Category]] = {True: [], False: []}
+        # A child points to its parent by node id, categories without one fall
+        # back to (parent, depth - 1), which is ambiguous for repeated names
+        by_key: dict[tuple[str, int], list[Category]] = {}
+        children: dict[tuple[str, int], list[Category]] = {}
+        children_by_node_id: dict[int, list[Category]] = {}
+
+        ordered = sorted(
+            categories,
+            key=lambda category: (category.depth, category.name, category.path),
+        )
+
+        for category in ordered:
+            by_name.setdefault(category.name, category)
+            by_depth.setdefault(category.depth, []).append(category)
+            by_leaf[bool(category.is_leaf)].append(category)
+            by_key.setdefault((category.name, category.depth), []).append(category)
+            if category.node_id is not None:
+                by_node_id[category.node_id] = category
+
+            if category.parent is not None:
+                by_parent.setdefault(category.parent, []).append(category)
+
+            if category.parent_node_id is not None:
+                children_by_node_id.setdefault(category.parent_node_id, []).append(
+                    category
+                )
+            elif category.parent is not None and category.depth > 0:
+                children.setdefault((category.parent, category.depth - 1), []).append(
+                    category
+                )
+
+            if category.ancestor is not None:
+                by_ancestor.setdefault(category.ancestor, []).append(category)
+                by_ancestor_depth.setdefault(category.ancestor, {}).setdefault(
+                    category.depth, []
+                ).append(category)
+
+        self.version = version
+        self.size = len(ordered)
+        self._by_name = by_name
+        self._by_node_id = by_node_id
+        self._by_depth = {k: tuple(v) for k, v in by_depth.items()}
+        self._by_parent = {k: tuple(v) for k, v in by_parent.items()}
+        self._by_ancestor = {k: tuple(v) for k, v in by_ancestor.items()}
+        self._by_ancestor_depth = {
+            ancestor: {depth: tuple(v) for depth, v in depths.items()}
+            for ancestor, depths in by_ancestor_depth.items()
+        }
+        self._by_leaf = {k: tuple(v) for k, v in by_leaf.items()}
+        self._depths_desc = tuple(sorted(self._by_depth, reverse=True))
+        self._by_key = {k: tuple(v) for k, v in by_key.items()}
+        self._children = {k: tuple(v) for k, v in children.items()}
+        self._children_by_node_id = {
+            k: tuple(v) for k, v in children_by_node_id.items()
+        }
+
+    def _get_children(self, category: Category) -> tuple[Category, ...]:
+        children = self._children.get((category.name, category.depth), ())
+        if category.node_id is None:
+            return children
+        return self._children_by_node_id.get(category.node_id, ()) + children
+
+    def _get_parent(self, category: Category) -> Optional[Category]:
+        if category.parent_node_id is not None:
+            return self._by_node_id.get(category.parent_node_id)
+        parents = self._by_key.get((category.parent, category.depth - 1))
+        return parents[0] if parents else None
+
+    def get_by_name(self, name: str) -> Optional[Category]:
+        return self._by_name.get(name)
+
+    def get_by_node_id(self, node_id: int) -> Optional[Category]:
+        return self._by_node_id.get(node_id)
+
+    def get_by_depth(self, depth: int, strict: bool = False) -> list[Category]:
+        if strict:
+            return list(self._by_depth.get(depth, ()))
+
+        # Same order as the SQL query: deepest categories first
+        categories = []
+        for current_depth in self._depths_desc:
+            if current_depth <= depth:
+                categories.extend(self._by_depth[current_depth])
+        return categories
+
+    def get_by_ancestor(self, ancestor: str) -> list[Category]:
+        return list(self._by_ancestor.get(ancestor, ()))
+
+    def get_by_parent(self, parent: str) -> list[Category]:
+        return list(self._by_parent.get(parent, ()))
+
+    def get_by_leaf(self, is_leaf: bool) -> list[Category]:
+        return list(self._by_leaf.get(bool(is_leaf), ()))
+
+    def get_by_ancestors_and_depth(
+        self, ancestors: list[str], depth: int
+    ) -> list[Category]:
+        categories = []
+        for ancestor in dict.fromkeys(ancestors):
+            depths = self._by_ancestor_depth.get(ancestor)
+            if not depths:
+                continue
+            for current_depth, bucket in depths.items():
+                if current_depth <= depth:
+                    categories.extend(bucket)
+        return categories
+
+    def get_subtree(
+        self,
+        root: Optional[str] = None,
+        root_depth: Optional[int] = None,
+        min_depth: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> list[Category]:
+        def in_bounds(depth: int):
+            return (min_depth is None or depth >= min_depth) and (
+                max_depth is None or depth <= max_depth
+            )
+
+        if root is None:
+            categories = []
+            for depth in reversed(self._depths_desc):
+                if in_bounds(depth):
+                    categories.extend(self._by_depth[depth])
+            return categories
+
+        if root_depth is not None:
+            depths = (root_depth,)
+        else:
+            depths = reversed(self._depths_desc)
+        level = [
+            category
+            for depth in depths
+            for category in self._by_key.get((root, depth), ())
+        ]
+
+        categories = []
+        while level:
+            categories.extend(
+                category for category in level if in_bounds(category.depth)
+            )
+            level = [
+                child
+                for category in level
+                if max_depth is None or category.depth < max_depth
+                for child in self._get_children(category)
+            ]
+
+        # Same ordering as the storage query
+        categories.sort(
+            key=lambda category: (category.depth, category.name, category.path)
+        )
+        return categories
+
+    def get_path(self, name: str, depth: Optional[int] = None) -> list[Category]:
+        if depth is None:
+            category = self._by_name.get(name)
+        else:
+            categories = self._by_key.get((name, depth))
+            category = categories[0] if categories else None
+
+        lineage = []
+        while category is not None:
+            lineage.append(category)
+            if category.depth <= 0:
+                break
+            category = self._get_parent(category)
+
+        lineage.reverse()
+        return lineage
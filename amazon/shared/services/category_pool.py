@@ -1,38 +1,115 @@
+import time
 import uuid
 import asyncio
+import logging
+from contextlib import aclosing
 from shared.storages.category.base import CategoryStorage
-from shared.models.category import Category
-from typing import Optional
+from shared.services.category_index import CategoryIndex
+from shared.models.category import Category, CategoryReplaceStats
+from typing import AsyncIterator, Iterable, Optional
 
 
 class CategoryPool:
     _instance = None
 
-    def __new__(cls, storage: CategoryStorage = None) -> "CategoryPool":
+    def __new__(
+        cls, storage: CategoryStorage = None, version_check_interval: float = 5.0
+    ) -> "CategoryPool":
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance.initialize(storage)
+            cls._instance.initialize(storage, version_check_interval)
         return cls._instance
 
     def initialize(
         self,
         storage: CategoryStorage = None,
+        version_check_interval: float = 5.0,
     ):
         self._pool: CategoryStorage = None
         if storage:
             self._pool = storage
 
+        # Reads are served from an immutable snapshot which is swapped as a whole,
+        # the version counter in the storage tells other processes to reload it
+        self._index: Optional[CategoryIndex] = None
+        self._index_lock = asyncio.Lock()
+        self._version_check_interval = version_check_interval
+        self._last_version_check = 0.0
+
     @staticmethod
     def is_initialized() -> bool:
         return CategoryPool._instance is not None
 
+    @property
+    def version(self) -> Optional[int]:
+        return self._index.version if self._index else None
+
+    async def _rebuild_index(
+        self,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> Optional[CategoryIndex]:
+        snapshot = await self._pool.get_snapshot(coroutine_id, lock)
+        if snapshot is None:
+            return self._index
+
+        categories, version = snapshot
+        self._index = CategoryIndex(categories, version)
+        self._last_version_check = time.monotonic()
+        logging.info(
+            f"[coroutine_id={coroutine_id}]: Loaded category snapshot "
+            + f"(version={version}, size={self._index.size})"
+        )
+        return self._index
+
+    async def _get_index(
+        self,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> Optional[CategoryIndex]:
+        def is_fresh(index: Optional[CategoryIndex]):
+            return (
+                index is not None
+                and time.monotonic() - self._last_version_check
+                < self._version_check_interval
+            )
+
+        index = self._index
+        if is_fresh(index):
+            return index
+
+        async with self._index_lock:
+            index = self._index
+            if is_fresh(index):
+                return index
+
+            if index is not None:
+                version = await self._pool.get_version(coroutine_id, lock)
+                if version is None or version == index.version:
+                    self._last_version_check = time.monotonic()
+                    return index
+
+            return await self._rebuild_index(coroutine_id, lock)
+
+    async def get_version(
+        self,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> Optional[int]:
+        index = await self._get_index(coroutine_id, lock)
+        return index.version if index else None
+
     async def replace(
         self,
-        categories: list[Category],
+        categories: Iterable[Category],
         coroutine_id: uuid.UUID = None,
         lock: asyncio.Lock = None,
-    ):
-        return await self._pool.replace(categories, coroutine_id, lock)
+    ) -> Optional[CategoryReplaceStats]:
+        stats = await self._pool.replace(categories, coroutine_id, lock)
+        if stats is not None and (stats.inserted or stats.updated or stats.deleted):
+            async with self._index_lock:
+                await self._rebuild_index(coroutine_id, lock)
+        return stats
 
     async def get_by_name(
         self,
@@ -40,7 +117,21 @@ class CategoryPool:
         coroutine_id: uuid.UUID = None,
         lock: asyncio.Lock = None,
     ) -> Optional[Category]:
-        return await self._pool.get_by_name(name, coroutine_id, lock)
+        index = await self._get_index(coroutine_id, lock)
+        if index is None:
+            return await self._pool.get_by_name(name, coroutine_id, lock)
+        return index.get_by_name(name)
+
+    async def get_by_node_id(
+        self,
+        node_id: int,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> Optional[Category]:
+        index = await self._get_index(coroutine_id, lock)
+        if index is None:
+            return await self._pool.get_by_node_id(node_id, coroutine_id, lock)
+        return index.get_by_node_id(node_id)
 
     async def get_by_depth(
         self,
@@ -49,7 +140,11 @@ class CategoryPool:
         coroutine_id: uuid.UUID = None,
         lock: asyncio.Lock = None,
     ) -> tuple[list[Category], int]:
-        return await self._pool.get_by_depth(depth, strict, coroutine_id, lock)
+        index = await self._get_index(coroutine_id, lock)
+        if index is None:
+            return await self._pool.get_by_depth(depth, strict, coroutine_id, lock)
+        categories = index.get_by_depth(depth, strict)
+        return categories, len(categories)
 
     async def get_by_ancestor(
         self,
@@ -57,7 +152,10 @@ class CategoryPool:
         coroutine_id: uuid.UUID = None,
         lock: asyncio.Lock = None,
     ) -> list[Category]:
-        return await self._pool.get_by_ancestor(ancestor, coroutine_id, lock)
+        index = await self._get_index(coroutine_id, lock)
+        if index is None:
+            return await self._pool.get_by_ancestor(ancestor, coroutine_id, lock)
+        return index.get_by_ancestor(ancestor)
 
     async def get_by_parent(
         self,
@@ -65,7 +163,10 @@ class CategoryPool:
         coroutine_id: uuid.UUID = None,
         lock: asyncio.Lock = None,
     ) -> list[Category]:
-        return await self._pool.get_by_parent(parent, coroutine_id, lock)
+        index = await self._get_index(coroutine_id, lock)
+        if index is None:
+            return await self._pool.get_by_parent(parent, coroutine_id, lock)
+        return index.get_by_parent(parent)
 
     async def get_by_leaf(
         self,
@@ -73,7 +174,10 @@ class CategoryPool:
         coroutine_id: uuid.UUID = None,
         lock: asyncio.Lock = None,
     ) -> list[Category]:
-        return await self._pool.get_by_leaf(is_leaf, coroutine_id, lock)
+        index = await self._get_index(coroutine_id, lock)
+        if index is None:
+            return await self._pool.get_by_leaf(is_leaf, coroutine_id, lock)
+        return index.get_by_leaf(is_leaf)
 
     async def get_by_ancestors_and_depth(
         self,
@@ -82,6 +186,46 @@ class CategoryPool:
         coroutine_id: uuid.UUID = None,
         lock: asyncio.Lock = None,
     ) -> list[Category]:
-        return await self._pool.get_by_ancestors_and_depth(
-            ancestors, depth, coroutine_id, lock
-        )
+        index = await self._get_index(coroutine_id, lock)
+        if index is None:
+            return await self._pool.get_by_ancestors_and_depth(
+                ancestors, depth, coroutine_id, lock
+            )
+        return index.get_by_ancestors_and_depth(ancestors, depth)
+
+    async def iter_subtree(
+        self,
+        root: Optional[str] = None,
+        root_depth: Optional[int] = None,
+        min_depth: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> AsyncIterator[Category]:
+        # Without a snapshot the rows come from the storage cursor as they are
+        # consumed, nothing holds the whole subtree
+        index = await self._get_index(coroutine_id, lock)
+        if index is None:
+            async with aclosing(
+                self._pool.iter_subtree(
+                    root, root_depth, min_depth, max_depth, coroutine_id
+                )
+            ) as categories:
+                async for category in categories:
+                    yield category
+            return
+
+        for category in index.get_subtree(root, root_depth, min_depth, max_depth):
+            yield category
+
+    async def get_path(
+        self,
+        name: str,
+        depth: Optional[int] = None,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> list[Category]:
+        index = await self._get_index(coroutine_id, lock)
+        if index is None:
+            return await self._pool.get_path(name, depth, coroutine_id, lock)
+        return index.get_path(name, depth)
@@ -0,0 +1,120 @@
+import time
+import random
+import asyncio
+
+from typing import Optional
+
+
+class RateLimit:
+    # `rate` requests per second with bursts of up to `burst` requests, each
+    # request pushes the next ones back by up to `jitter` extra seconds. A block
+    # multiplies the rate by `backoff` down to `min_rate`, each success gives
+    # back `recovery` of `max_rate` (additive increase, multiplicative decrease)
+    def __init__(
+        self,
+        rate: float,
+        burst: float = 1.0,
+        jitter: float = 0.0,
+        max_rate: Optional[float] = None,
+        min_rate: Optional[float] = None,
+        backoff: float = 0.5,
+        recovery: float = 0.05,
+    ):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.jitter = jitter
+        self.max_rate = max_rate or rate
+        self.min_rate = min_rate or rate / 16
+        self.backoff = backoff
+        self.recovery = recovery
+
+
+class TokenBucket:
+    __slots__ = ("limit", "rate", "tokens", "updated_at")
+
+    def __init__(self, limit: RateLimit, now: float):
+        self.limit = limit
+        self.rate = limit.rate
+        self.tokens = limit.burst
+        self.updated_at = now
+
+    def reserve(self, now: float) -> float:
+        # Takes a token even when there is none, the debt is the caller's wait,
+        # so concurrent callers queue up in arrival order without a lock
+        self.tokens = min(
+            self.limit.burst, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+        self.tokens -= 1
+        if self.limit.jitter:
+            self.tokens -= random.uniform(0, self.limit.jitter) * self.rate
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def on_block(self):
+        self.rate = max(self.limit.min_rate, self.rate * self.limit.backoff)
+
+    def on_success(self):
+        self.rate = min(
+            self.limit.max_rate, self.rate + self.limit.max_rate * self.limit.recovery
+        )
+
+
+class RateLimiter:
+    # Token buckets per scope ("proxy", "cookies", "host") and key within the
+    # scope. A request waits for every bucket it goes through, scopes without
+    # a limit are not paced. Buckets idle for `idle_timeout` are dropped, as
+    # rotated proxies and cookie sets do not come back
+    def __init__(
+        self,
+        limits: Optional[dict[str, RateLimit]] = None,
+        idle_timeout: float = 600.0,
+    ):
+        self.limits = limits or {}
+        self.idle_timeout = idle_timeout
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self._last_prune = time.monotonic()
+
+    def _get_buckets(self, keys: dict[str, Optional[str]], now: float):
+        for scope, key in keys.items():
+            limit = self.limits.get(scope)
+            if limit is None or key is None:
+                continue
+
+            bucket = self._buckets.get((scope, key))
+            if bucket is None:
+                bucket = self._buckets[(scope, key)] = TokenBucket(limit, now)
+            yield bucket
+
+    def _prune(self, now: float):
+        if now - self._last_prune < self.idle_timeout:
+            return
+        self._last_prune = now
+        self._buckets = {
+            key: bucket
+            for key, bucket in self._buckets.items()
+            if now - bucket.updated_at < self.idle_timeout
+        }
+
+    async def acquire(self, **keys: Optional[str]) -> float:
+        now = time.monotonic()
+        self._prune(now)
+
+        delay = 0.0
+        for bucket in self._get_buckets(keys, now):
+            delay = max(delay, bucket.reserve(now))
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def report(self, is_blocked: bool, **keys: Optional[str]):
+        now = time.monotonic()
+        for bucket in self._get_buckets(keys, now):
+            if is_blocked:
+                bucket.on_block()
+            else:
+                bucket.on_success()
+
+    def get_rate(self, scope: str, key: str) -> Optional[float]:
+        bucket = self._buckets.get((scope, key))
+        return bucket.rate if bucket else None
@@ -1,9 +1,9 @@
 import uuid
 import asyncio
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import AsyncIterator, Iterable, List, Optional
 
-from shared.models.category import Category
+from shared.models.category import Category, CategoryReplaceStats
 
 
 class CategoryStorage(ABC):
@@ -11,10 +11,26 @@ class CategoryStorage(ABC):
     @abstractmethod
     async def replace(
         self,
-        categories: List[Category],
+        categories: Iterable[Category],
         coroutine_id: uuid.UUID = None,
         lock: asyncio.Lock = None,
-    ) -> bool:
+    ) -> Optional[CategoryReplaceStats]:
+        pass
+
+    @abstractmethod
+    async def get_version(
+        self,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> Optional[int]:
+        pass
+
+    @abstractmethod
+    async def get_snapshot(
+        self,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> Optional[tuple[List[Category], int]]:
         pass
 
     @abstractmethod
@@ -26,6 +42,15 @@ class CategoryStorage(ABC):
     ) -> Optional[Category]:
         pass
 
+    @abstractmethod
+    async def get_by_node_id(
+        self,
+        node_id: int,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> Optional[Category]:
+        pass
+
     @abstractmethod
     async def get_by_depth(
         self,
@@ -72,3 +97,24 @@ class CategoryStorage(ABC):
         lock: asyncio.Lock = None,
     ) -> List[Category]:
         pass
+
+    @abstractmethod
+    def iter_subtree(
+        self,
+        root: Optional[str] = None,
+        root_depth: Optional[int] = None,
+        min_depth: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        coroutine_id: uuid.UUID = None,
+    ) -> AsyncIterator[Category]:
+        pass
+
+    @abstractmethod
+    async def get_path(
+        self,
+        name: str,
+        depth: Optional[int] = None,
+        coroutine_id: uuid.UUID = None,
+        lock: asyncio.Lock = None,
+    ) -> List[Category]:
+        pass
@@ -2,9 +2,10 @@ import logging
 import uuid
 import asyncpg
 from asyncio import Lock
-from typing import List, Optional
-from shared.models.category import Category
+from typing import AsyncIterator, Iterable, List, Optional
+from shared.models.category import Category, CategoryReplaceStats
 from shared.storages.category.base import CategoryStorage
+from shared.storages.row_mapping import category_from_row, categories_from_rows
 
 
 class PostgreSQLCategoryStorage(CategoryStorage):
@@ -26,25 +27,80 @@ class PostgreSQLCategoryStorage(CategoryStorage):
                 parent VARCHAR(100),
                 path TEXT,
                 url TEXT,
-                is_leaf BOOLEAN,
-                CONSTRAINT unique_name_per_level UNIQUE (name, depth)
+                is_leaf BOOLEAN
             );
         """,
+        "init_parent_index": """
+            CREATE INDEX IF NOT EXISTS amazon_categories_parent_depth_idx
+            ON "scraping"."amazon_categories" (parent, depth);
+        """,
+        "init_node_id": """
+            ALTER TABLE "scraping"."amazon_categories"
+            ADD COLUMN IF NOT EXISTS node_id BIGINT,
+            ADD COLUMN IF NOT EXISTS parent_node_id BIGINT;
+        """,
+        "drop_unique_name_per_level": """
+            ALTER TABLE "scraping"."amazon_categories"
+            DROP CONSTRAINT IF EXISTS unique_name_per_level;
+        """,
+        "init_name_depth_index": """
+            CREATE INDEX IF NOT EXISTS amazon_categories_name_depth_idx
+            ON "scraping"."amazon_categories" (name, depth);
+        """,
+        "init_node_id_index": """
+            CREATE UNIQUE INDEX IF NOT EXISTS amazon_categories_node_id_idx
+            ON "scraping"."amazon_categories" (node_id);
+        """,
+        "init_parent_node_id_index": """
+            CREATE INDEX IF NOT EXISTS amazon_categories_parent_node_id_idx
+            ON "scraping"."amazon_categories" (parent_node_id);
+        """,
+        "init_version_table": """
+            CREATE TABLE IF NOT EXISTS "scraping"."amazon_categories_version" (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                version BIGINT NOT NULL DEFAULT 0
+            );
+        """,
+        "init_version": """
+            INSERT INTO "scraping"."amazon_categories_version" (id, version)
+            VALUES (TRUE, 0)
+            ON CONFLICT (id) DO NOTHING;
+        """,
+        "get_version": """
+            SELECT version FROM "scraping"."amazon_categories_version"
+            WHERE id = TRUE;
+        """,
+        "bump_version": """
+            UPDATE "scraping"."amazon_categories_version"
+            SET version = version + 1
+            WHERE id = TRUE
+            RETURNING version;
+        """,
+        "get_all": """
+            SELECT * FROM "scraping"."amazon_categories"
+            ORDER BY depth ASC, name ASC, path ASC;
+        """,
         "get_by_name": """
             SELECT * FROM "scraping"."amazon_categories"
-            WHERE name = $1;
+            WHERE name = $1
+            ORDER BY depth ASC, path ASC
+            LIMIT 1;
+        """,
+        "get_by_node_id": """
+            SELECT * FROM "scraping"."amazon_categories"
+            WHERE node_id = $1;
         """,
         "get_by_depth": """
             SELECT * 
             FROM "scraping"."amazon_categories"
             WHERE depth <= $1
-            ORDER BY depth DESC;
+            ORDER BY depth DESC, name, path;
         """,
         "get_by_exact_depth": """
             SELECT * 
             FROM "scraping"."amazon_categories"
             WHERE depth = $1
-            ORDER BY name ASC;
+            ORDER BY name ASC, path ASC;
         """,
         "get_by_ancestor": """
             SELECT * FROM "scraping"."amazon_categories"
@@ -56,19 +112,149 @@ class PostgreSQLCategoryStorage(CategoryStorage):
         """,
         "get_by_leaf": """
             SELECT * FROM "scraping"."amazon_categories"
-            WHERE is_leaf = $1;
+            WHERE is_leaf = $1
+            ORDER BY depth, name, path;
         """,
         "get_by_ancestors_and_depth": """
             SELECT * FROM "scraping"."amazon_categories"
             WHERE ancestor = ANY($1) AND depth <= $2;
         """,
-        "insert": """
-            INSERT INTO "scraping"."amazon_categories" (
-                name, depth, ancestor, parent, path, url, is_leaf
-            ) VALUES ($1, $2, $3, $4, $5, $6, $7);
+        "get_forest": """
+            SELECT * FROM "scraping"."amazon_categories"
+            WHERE ($1::INT IS NULL OR depth >= $1)
+                AND ($2::INT IS NULL OR depth <= $2)
+            ORDER BY depth ASC, name ASC, path ASC;
+        """,
+        "get_subtree": """
+            WITH RECURSIVE subtree AS (
+                SELECT * FROM "scraping"."amazon_categories"
+                WHERE name = $1 AND ($2::INT IS NULL OR depth = $2)
+                UNION ALL
+                SELECT child.* FROM "scraping"."amazon_categories" child
+                JOIN subtree node
+                    ON child.parent_node_id = node.node_id
+                    OR (
+                        child.parent_node_id IS NULL
+                        AND child.parent = node.name
+                        AND child.depth = node.depth + 1
+                    )
+                WHERE $4::INT IS NULL OR child.depth <= $4
+            )
+            SELECT * FROM subtree
+            WHERE ($3::INT IS NULL OR depth >= $3)
+                AND ($4::INT IS NULL OR depth <= $4)
+            ORDER BY depth ASC, name ASC, path ASC;
         """,
-        "delete": """
-            DELETE FROM "scraping"."amazon_categories";
+        "get_path": """
+            WITH RECURSIVE lineage AS (
+                (
+                    SELECT * FROM "scraping"."amazon_categories"
+                    WHERE name = $1 AND ($2::INT IS NULL OR depth = $2)
+                    ORDER BY depth ASC, path ASC
+                    LIMIT 1
+                )
+                UNION ALL
+                SELECT parent.* FROM "scraping"."amazon_categories" parent
+                JOIN lineage node
+                    ON parent.node_id = node.parent_node_id
+                    OR (
+                        node.parent_node_id IS NULL
+                        AND parent.name = node.parent
+                        AND parent.depth = node.depth - 1
+                    )
+            )
+            SELECT * FROM lineage
+            ORDER BY depth ASC;
+        """,
+        "init_natural_key": """
+            ALTER TABLE "scraping"."amazon_categories"
+            ADD COLUMN IF NOT EXISTS natural_key TEXT;
+        """,
+        "get_keys": """
+            SELECT id, path, url, node_id, natural_key
+            FROM "scraping"."amazon_categories";
+        """,
+        "backfill_node_id": """
+            UPDATE "scraping"."amazon_categories"
+            SET node_id = $2, parent_node_id = $3, natural_key = $4
+            WHERE id = $1;
+        """,
+        "backfill_natural_key": """
+            UPDATE "scraping"."amazon_categories"
+            SET natural_key = path
+            WHERE natural_key IS NULL;
+        """,
+        "init_natural_key_index": """
+            CREATE UNIQUE INDEX IF NOT EXISTS amazon_categories_natural_key_idx
+            ON "scraping"."amazon_categories" (natural_key);
+        """,
+        "create_staging": """
+            CREATE TEMPORARY TABLE amazon_categories_staging (
+                natural_key TEXT NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                depth INT NOT NULL,
+                ancestor VARCHAR(100),
+                parent VARCHAR(100),
+                path TEXT,
+                url TEXT,
+                is_leaf BOOLEAN,
+                node_id BIGINT,
+                parent_node_id BIGINT
+            ) ON COMMIT DROP;
+        """,
+        "dedup_staging": """
+            DELETE FROM amazon_categories_staging staged
+            USING amazon_categories_staging duplicate
+            WHERE staged.natural_key = duplicate.natural_key
+                AND staged.ctid > duplicate.ctid;
+        """,
+        "count_staging": """
+            SELECT COUNT(*) FROM amazon_categories_staging;
+        """,
+        "delete_missing": """
+            DELETE FROM "scraping"."amazon_categories" current
+            WHERE NOT EXISTS (
+                SELECT 1 FROM amazon_categories_staging staged
+                WHERE staged.natural_key = current.natural_key
+            );
+        """,
+        "update_changed": """
+            UPDATE "scraping"."amazon_categories" current
+            SET name = staged.name,
+                depth = staged.depth,
+                ancestor = staged.ancestor,
+                parent = staged.parent,
+                path = staged.path,
+                url = staged.url,
+                is_leaf = staged.is_leaf,
+                node_id = staged.node_id,
+                parent_node_id = staged.parent_node_id
+            FROM amazon_categories_staging staged
+            WHERE current.natural_key = staged.natural_key
+                AND (
+                    current.name, current.depth, current.ancestor, current.parent,
+                    current.path, current.url, current.is_leaf, current.node_id,
+                    current.parent_node_id
+                ) IS DISTINCT FROM (
+                    staged.name, staged.depth, staged.ancestor, staged.parent,
+                    staged.path, staged.url, staged.is_leaf, staged.node_id,
+                    staged.parent_node_id
+                );
+        """,
+        "insert_new": """
+            INSERT INTO "scraping"."amazon_categories" (
+                natural_key, name, depth, ancestor, parent, path, url, is_leaf,
+                node_id, parent_node_id
+            )
+            SELECT
+                staged.natural_key, staged.name, staged.depth, staged.ancestor,
+                staged.parent, staged.path, staged.url, staged.is_leaf,
+                staged.node_id, staged.parent_node_id
+            FROM amazon_categories_staging staged
+            WHERE NOT EXISTS (
+                SELECT 1 FROM "scraping"."amazon_categories" current
+                WHERE current.natural_key = staged.natural_key
+            );
         """,
     }
 
@@ -102,6 +288,18 @@ class PostgreSQLCategoryStorage(CategoryStorage):
         is_success = True
         try:
             await conn.execute(self.sql_queries["init_table"])
+            await conn.execute(self.sql_queries["init_parent_index"])
+            await conn.execute(self.sql_queries["init_natural_key"])
+            await conn.execute(self.sql_queries["init_node_id"])
+            await self._backfill_node_ids(conn)
+            await conn.execute(self.sql_queries["backfill_natural_key"])
+            await conn.execute(self.sql_queries["init_natural_key_index"])
+            await conn.execute(self.sql_queries["drop_unique_name_per_level"])
+            await conn.execute(self.sql_queries["init_name_depth_index"])
+            await conn.execute(self.sql_queries["init_node_id_index"])
+            await conn.execute(self.sql_queries["init_parent_node_id_index"])
+            await conn.execute(self.sql_queries["init_version_table"])
+            await conn.execute(self.sql_queries["init_version"])
         except Exception as e:
             logging.error(f"Error initializing category storage: {e}")
             is_success = False
@@ -115,12 +313,66 @@ class PostgreSQLCategoryStorage(CategoryStorage):
     async def close(self):
         await self.pool.close()
 
+    async def _backfill_node_ids(self, conn: asyncpg.Connection):
+        # Rows written before node ids were stored get theirs from the url, and
+        # the natural key `replace` gives them, so they keep their ids. Rows an
+        # earlier migration keyed by path are picked up too
+        from shared.utils import parse_node_id  # shared.utils imports this module
+
+        async with conn.transaction():
+            rows = await conn.fetch(self.sql_queries["get_keys"])
+            node_ids = {row["path"]: row["node_id"] for row in rows}
+            taken = {row["node_id"] for row in rows if row["node_id"] is not None}
+
+            updates = []
+            for row in sorted(rows, key=lambda row: row["path"] or ""):
+                if row["node_id"] is not None or row["natural_key"] not in {
+                    None,
+                    row["path"],
+                }:
+                    continue
+                node_id = parse_node_id(row["url"])
+                # The first of two rows with the same node is the one kept
+                if node_id is None or node_id in taken:
+                    continue
+                taken.add(node_id)
+                node_ids[row["path"]] = node_id
+                updates.append([row["id"], row["path"], node_id])
+
+            await conn.executemany(
+                self.sql_queries["backfill_node_id"],
+                [
+                    (
+                        row_id,
+                        node_id,
+                        node_ids.get((path or "").rpartition("/")[0]),
+                        f"node:{node_id}",
+                    )
+                    for row_id, path, node_id in updates
+                ],
+            )
+        if updates:
+            logging.info(f"Backfilled the node id of {len(updates)} categories")
+
+    @staticmethod
+    def _natural_key(category: Category) -> str:
+        # Stable across aggregation runs, unlike the generated UUID. The node id
+        # survives renames and moves, keyword roots have none and keep the path
+        if category.node_id is not None:
+            return f"node:{category.node_id}"
+        return category.path
+
+    @staticmethod
+    def _affected_rows(status: str) -> int:
+        # asyncpg returns the command tag, e.g. "UPDATE 3" or "INSERT 0 3"
+        return int(status.split()[-1])
+
     async def replace(
         self,
-        categories: List[Category],
+        categories: Iterable[Category],
         coroutine_id: uuid.UUID = None,
         lock: Lock = None,
-    ) -> bool:
+    ) -> Optional[CategoryReplaceStats]:
         if lock is None:
             return await self._replace(categories, coroutine_id)
         async with lock:
@@ -128,40 +380,128 @@ class PostgreSQLCategoryStorage(CategoryStorage):
 
     async def _replace(
         self,
-        categories: List[Category],
+        categories: Iterable[Category],
         coroutine_id: uuid.UUID = None,
-    ) -> bool:
+    ) -> Optional[CategoryReplaceStats]:
         conn: asyncpg.Connection = await self.pool.acquire()
-        is_success = True
+        stats = None
         try:
             async with conn.transaction():
-                await conn.execute(self.sql_queries["delete"])
-                lst_categories = [
-                    (
-                        category.name,
-                        category.depth,
-                        category.ancestor,
-                        category.parent,
-                        category.path,
-                        category.url,
-                        category.is_leaf,
-                    )
-                    for category in categories
-                ]
-                await conn.executemany(
-                    self.sql_queries["insert"],
-                    lst_categories,
+                await conn.execute(self.sql_queries["create_staging"])
+                # A generator keeps memory flat, asyncpg pulls the records as it
+                # fills its COPY buffers
+                await conn.copy_records_to_table(
+                    "amazon_categories_staging",
+                    records=(
+                        (
+                            self._natural_key(category),
+                            category.name,
+                            category.depth,
+                            category.ancestor,
+                            category.parent,
+                            category.path,
+                            category.url,
+                            category.is_leaf,
+                            category.node_id,
+                            category.parent_node_id,
+                        )
+                        for category in categories
+                    ),
+                )
+                await conn.execute(self.sql_queries["dedup_staging"])
+                total = await conn.fetchval(self.sql_queries["count_staging"])
+
+                deleted = self._affected_rows(
+                    await conn.execute(self.sql_queries["delete_missing"])
+                )
+                updated = self._affected_rows(
+                    await conn.execute(self.sql_queries["update_changed"])
+                )
+                inserted = self._affected_rows(
+                    await conn.execute(self.sql_queries["insert_new"])
+                )
+
+                if deleted or updated or inserted:
+                    await conn.execute(self.sql_queries["bump_version"])
+
+                stats = CategoryReplaceStats(
+                    inserted=inserted,
+                    updated=updated,
+                    deleted=deleted,
+                    unchanged=total - inserted - updated,
                 )
 
         except Exception as e:
             logging.error(
                 f"[coroutine_id={coroutine_id}]: Can't replace categories: {e}"
             )
-            is_success = False
+            stats = None
+        finally:
+            await self.pool.release(conn)
+
+        return stats
+
+    async def get_version(
+        self,
+        coroutine_id: uuid.UUID = None,
+        lock: Lock = None,
+    ) -> Optional[int]:
+        if lock is None:
+            return await self._get_version(coroutine_id)
+        async with lock:
+            return await self._get_version(coroutine_id)
+
+    async def _get_version(
+        self,
+        coroutine_id: uuid.UUID = None,
+    ) -> Optional[int]:
+        version = None
+        try:
+            version = await self.pool.fetchval(self.sql_queries["get_version"])
+        except Exception as e:
+            logging.error(
+                f"[coroutine_id={coroutine_id}]: Error getting category version: {e}"
+            )
+
+        return version
+
+    async def get_snapshot(
+        self,
+        coroutine_id: uuid.UUID = None,
+        lock: Lock = None,
+    ) -> Optional[tuple[List[Category], int]]:
+        if lock is None:
+            return await self._get_snapshot(coroutine_id)
+        async with lock:
+            return await self._get_snapshot(coroutine_id)
+
+    async def _get_snapshot(
+        self,
+        coroutine_id: uuid.UUID = None,
+    ) -> Optional[tuple[List[Category], int]]:
+        conn: asyncpg.Connection = await self.pool.acquire()
+        snapshot = None
+        try:
+            # Version and rows must come from the same MVCC snapshot
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                version = await conn.fetchval(self.sql_queries["get_version"])
+                # Server-side cursor, rows are mapped batch by batch instead of
+                # materializing the whole result set first
+                categories = [
+                    category_from_row(row)
+                    async for row in conn.cursor(
+                        self.sql_queries["get_all"], prefetch=1000
+                    )
+                ]
+            snapshot = categories, version
+        except Exception as e:
+            logging.error(
+                f"[coroutine_id={coroutine_id}]: Error getting category snapshot: {e}"
+            )
         finally:
             await self.pool.release(conn)
 
-        return is_success
+        return snapshot
 
     async def get_by_name(
         self,
@@ -184,16 +524,7 @@ class PostgreSQLCategoryStorage(CategoryStorage):
         try:
             row = await conn.fetchrow(self.sql_queries["get_by_name"], name)
             if row:
-                category = Category(
-                    id=row["id"],
-                    name=row["name"],
-                    depth=row["depth"],
-                    ancestor=row["ancestor"],
-                    parent=row["parent"],
-                    path=row["path"],
-                    url=row["url"],
-                    is_leaf=row["is_leaf"],
-                )
+                category = category_from_row(row)
         except Exception as e:
             logging.error(
                 f"[coroutine_id={coroutine_id}]: Error getting category by name: {e}"
@@ -203,6 +534,37 @@ class PostgreSQLCategoryStorage(CategoryStorage):
 
         return category
 
+    async def get_by_node_id(
+        self,
+        node_id: int,
+        coroutine_id: uuid.UUID = None,
+        lock: Lock = None,
+    ) -> Optional[Category]:
+        if lock is None:
+            return await self._get_by_node_id(node_id, coroutine_id)
+        async with lock:
+            return await self._get_by_node_id(node_id, coroutine_id)
+
+    async def _get_by_node_id(
+        self,
+        node_id: int,
+        coroutine_id: uuid.UUID = None,
+    ) -> Optional[Category]:
+        conn: asyncpg.Connection = await self.pool.acquire()
+        category = None
+        try:
+            row = await conn.fetchrow(self.sql_queries["get_by_node_id"], node_id)
+            if row:
+                category = category_from_row(row)
+        except Exception as e:
+            logging.error(
+                f"[coroutine_id={coroutine_id}]: Error getting category by node id: {e}"
+            )
+        finally:
+            await self.pool.release(conn)
+
+        return category
+
     async def get_by_depth(
         self,
         depth: int,
@@ -228,19 +590,7 @@ class PostgreSQLCategoryStorage(CategoryStorage):
                 "get_by_exact_depth" if strict else "get_by_depth"
             ]
             rows = await conn.fetch(sql_query, depth)
-            categories = [
-                Category(
-                    id=row["id"],
-                    name=row["name"],
-                    depth=row["depth"],
-                    ancestor=row["ancestor"],
-                    parent=row["parent"],
-                    path=row["path"],
-                    url=row["url"],
-                    is_leaf=row["is_leaf"],
-                )
-                for row in rows
-            ]
+            categories = categories_from_rows(rows)
         except Exception as e:
             logging.error(
                 f"[coroutine_id={coroutine_id}]: Error getting categories by depth: {e}"
@@ -270,19 +620,7 @@ class PostgreSQLCategoryStorage(CategoryStorage):
         categories = []
         try:
             rows = await conn.fetch(self.sql_queries["get_by_ancestor"], ancestor)
-            categories = [
-                Category(
-                    id=row["id"],
-                    name=row["name"],
-                    depth=row["depth"],
-                    ancestor=row["ancestor"],
-                    parent=row["parent"],
-                    path=row["path"],
-                    url=row["url"],
-                    is_leaf=row["is_leaf"],
-                )
-                for row in rows
-            ]
+            categories = categories_from_rows(rows)
         except Exception as e:
             logging.error(
                 f"[coroutine_id={coroutine_id}]: Error getting categories by ancestor: {e}"
@@ -312,19 +650,7 @@ class PostgreSQLCategoryStorage(CategoryStorage):
         categories = []
         try:
             rows = await conn.fetch(self.sql_queries["get_by_parent"], parent)
-            categories = [
-                Category(
-                    id=row["id"],
-                    name=row["name"],
-                    depth=row["depth"],
-                    ancestor=row["ancestor"],
-                    parent=row["parent"],
-                    path=row["path"],
-                    url=row["url"],
-                    is_leaf=row["is_leaf"],
-                )
-                for row in rows
-            ]
+            categories = categories_from_rows(rows)
         except Exception as e:
             logging.error(
                 f"[coroutine_id={coroutine_id}]: Error getting categories by parent: {e}"
@@ -354,19 +680,7 @@ class PostgreSQLCategoryStorage(CategoryStorage):
         categories = []
         try:
             rows = await conn.fetch(self.sql_queries["get_by_leaf"], is_leaf)
-            categories = [
-                Category(
-                    id=row["id"],
-                    name=row["name"],
-                    depth=row["depth"],
-                    ancestor=row["ancestor"],
-                    parent=row["parent"],
-                    path=row["path"],
-                    url=row["url"],
-                    is_leaf=row["is_leaf"],
-                )
-                for row in rows
-            ]
+            categories = categories_from_rows(rows)
         except Exception as e:
             logging.error(
                 f"[coroutine_id={coroutine_id}]: Error getting categories by leaf status: {e}"
@@ -404,19 +718,7 @@ class PostgreSQLCategoryStorage(CategoryStorage):
             rows = await conn.fetch(
                 self.sql_queries["get_by_ancestors_and_depth"], ancestors, depth
             )
-            categories = [
-                Category(
-                    id=row["id"],
-                    name=row["name"],
-                    depth=row["depth"],
-                    ancestor=row["ancestor"],
-                    parent=row["parent"],
-                    path=row["path"],
-                    url=row["url"],
-                    is_leaf=row["is_leaf"],
-                )
-                for row in rows
-            ]
+            categories = categories_from_rows(rows)
         except Exception as e:
             logging.error(
                 f"[coroutine_id={coroutine_id}]: Error getting categories by ancestors and depth: {e}"
@@ -425,3 +727,64 @@ class PostgreSQLCategoryStorage(CategoryStorage):
             await self.pool.release(conn)
 
         return categories
+
+    async def iter_subtree(
+        self,
+        root: Optional[str] = None,
+        root_depth: Optional[int] = None,
+        min_depth: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        coroutine_id: uuid.UUID = None,
+    ) -> AsyncIterator[Category]:
+        if root is None:
+            sql_query, args = self.sql_queries["get_forest"], (min_depth, max_depth)
+        else:
+            sql_query = self.sql_queries["get_subtree"]
+            args = (root, root_depth, min_depth, max_depth)
+
+        conn: asyncpg.Connection = await self.pool.acquire()
+        try:
+            # Server-side cursor, rows are pulled from PostgreSQL as they are consumed
+            async with conn.transaction(readonly=True):
+                async for row in conn.cursor(sql_query, *args, prefetch=500):
+                    yield category_from_row(row)
+        except Exception as e:
+            # Raised, not swallowed: a tree cut short would be served as whole
+            logging.error(
+                f"[coroutine_id={coroutine_id}]: Error streaming category subtree: {e}"
+            )
+            raise
+        finally:
+            await self.pool.release(conn)
+
+    async def get_path(
+        self,
+        name: str,
+        depth: Optional[int] = None,
+        coroutine_id: uuid.UUID = None,
+        lock: Lock = None,
+    ) -> List[Category]:
+        if lock is None:
+            return await self._get_path(name, depth, coroutine_id)
+        async with lock:
+            return await self._get_path(name, depth, coroutine_id)
+
+    async def _get_path(
+        self,
+        name: str,
+        depth: Optional[int] = None,
+        coroutine_id: uuid.UUID = None,
+    ) -> List[Category]:
+        conn: asyncpg.Connection = await self.pool.acquire()
+        categories = []
+        try:
+            rows = await conn.fetch(self.sql_queries["get_path"], name, depth)
+            categories = categories_from_rows(rows)
+        except Exception as e:
+            logging.error(
+                f"[coroutine_id={coroutine_id}]: Error getting category path: {e}"
+            )
+        finally:
+            await self.pool.release(conn)
+
+        return categories
@@ -9,6 +9,7 @@ from typing import Optional, List
 from shared.models.cookie import Cookie, AmazonCookieSet
 from shared.models.enums import BrowserType
 from shared.storages.cookie_set.base import CookieSetStorage
+from shared.storages.row_mapping import cookie_set_from_row
 
 
 class PostgreSQLCookieSetStorage(CookieSetStorage):
@@ -195,14 +196,7 @@ class PostgreSQLCookieSetStorage(CookieSetStorage):
                 if not row:
                     raise Exception("No cookie set found")
 
-                cookie_set_id = row["id"]
-                cookie_set = AmazonCookieSet(
-                    id=cookie_set_id,
-                    postcode=row["postcode"],
-                    location=row["location"],
-                    cookies=json.loads(row["cookies"]),
-                    expires=row["expires"],
-                )
+                cookie_set = cookie_set_from_row(row)
                 cookie_set_id = row["id"]
                 await conn.execute(
                     self.sql_queries["update_cookie_set"],
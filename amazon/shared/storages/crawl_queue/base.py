@@ -0,0 +1,47 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Optional
+
+from shared.models.crawl_unit import CrawlUnit, CrawlQueueStats
+
+
+class CrawlQueueStorage(ABC):
+
+    @abstractmethod
+    async def seed(self, run_id: str, keywords: list[str]) -> int:
+        pass
+
+    @abstractmethod
+    async def claim(self, run_id: str, worker_id: str) -> Optional[CrawlUnit]:
+        pass
+
+    @abstractmethod
+    async def heartbeat(self, unit: CrawlUnit, worker_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def complete(
+        self,
+        unit: CrawlUnit,
+        worker_id: str,
+        result: dict[str, Any],
+        deferred: list[tuple[list[str], str]],
+    ) -> bool:
+        pass
+
+    @abstractmethod
+    async def fail(self, unit: CrawlUnit, worker_id: str, error: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def get_stats(self, run_id: str) -> CrawlQueueStats:
+        pass
+
+    @abstractmethod
+    async def is_drained(self, run_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def iter_results(
+        self, run_id: str
+    ) -> AsyncIterator[tuple[str, list[str], dict[str, Any]]]:
+        pass
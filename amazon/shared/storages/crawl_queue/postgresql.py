@@ -0,0 +1,298 @@
+import json
+import asyncpg
+import logging
+
+from typing import Any, AsyncIterator, Optional
+from shared.models.crawl_unit import CrawlUnit, CrawlQueueStats
+from shared.storages.crawl_queue.base import CrawlQueueStorage
+
+
+class PostgreSQLCrawlQueueStorage(CrawlQueueStorage):
+    # Work queue of a distributed category crawl. A unit is a keyword tree or a
+    # subtree of it, crawler processes claim units with SKIP LOCKED so they never
+    # wait on each other. A claim is a lease: a unit whose worker stopped sending
+    # heartbeats for `lease_seconds` is handed out again, up to `max_attempts`
+    sql_queries = {
+        "check_schema": """
+            SELECT nspname
+            FROM "pg_catalog"."pg_namespace"
+            WHERE nspname = 'scraping';
+        """,
+        "init_schema": """
+            CREATE SCHEMA IF NOT EXISTS scraping;
+        """,
+        "init_table": """
+            CREATE TABLE IF NOT EXISTS "scraping"."amazon_category_crawl_units" (
+                id BIGSERIAL PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                path TEXT[] NOT NULL DEFAULT '{}',
+                url TEXT,
+                status VARCHAR(15) NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                claimed_by TEXT,
+                claimed_at TIMESTAMPTZ,
+                result JSONB,
+                error TEXT,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                CONSTRAINT unique_crawl_unit UNIQUE (run_id, keyword, path)
+            );
+        """,
+        "init_claim_index": """
+            CREATE INDEX IF NOT EXISTS amazon_category_crawl_units_claim_idx
+            ON "scraping"."amazon_category_crawl_units" (run_id, status, id);
+        """,
+        "insert": """
+            INSERT INTO "scraping"."amazon_category_crawl_units" (
+                run_id, keyword, path, url
+            )
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT ON CONSTRAINT unique_crawl_unit DO NOTHING;
+        """,
+        "claim": """
+            UPDATE "scraping"."amazon_category_crawl_units" unit
+            SET status = 'claimed',
+                claimed_by = $2,
+                claimed_at = NOW(),
+                attempts = unit.attempts + 1
+            WHERE unit.id = (
+                SELECT id FROM "scraping"."amazon_category_crawl_units"
+                WHERE run_id = $1
+                    AND attempts < $4
+                    AND (
+                        status IN ('pending', 'failed')
+                        OR (
+                            status = 'claimed'
+                            AND claimed_at < NOW() - make_interval(secs => $3)
+                        )
+                    )
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, run_id, keyword, path, url, attempts;
+        """,
+        "heartbeat": """
+            UPDATE "scraping"."amazon_category_crawl_units"
+            SET claimed_at = NOW()
+            WHERE id = $1 AND claimed_by = $2 AND status = 'claimed';
+        """,
+        "complete": """
+            UPDATE "scraping"."amazon_category_crawl_units"
+            SET status = 'done', result = $3::JSONB, error = NULL
+            WHERE id = $1 AND claimed_by = $2 AND status = 'claimed';
+        """,
+        "fail": """
+            UPDATE "scraping"."amazon_category_crawl_units"
+            SET status = 'failed', error = $3
+            WHERE id = $1 AND claimed_by = $2 AND status = 'claimed';
+        """,
+        "get_stats": """
+            SELECT status, COUNT(*) AS count
+            FROM "scraping"."amazon_category_crawl_units"
+            WHERE run_id = $1
+            GROUP BY status;
+        """,
+        "has_open_units": """
+            SELECT EXISTS (
+                SELECT 1 FROM "scraping"."amazon_category_crawl_units"
+                WHERE run_id = $1
+                    AND (
+                        status = 'pending'
+                        OR (status = 'failed' AND attempts < $2)
+                        OR (
+                            status = 'claimed'
+                            AND (
+                                claimed_at >= NOW() - make_interval(secs => $3)
+                                OR attempts < $2
+                            )
+                        )
+                    )
+            );
+        """,
+        "get_results": """
+            SELECT keyword, path, result
+            FROM "scraping"."amazon_category_crawl_units"
+            WHERE run_id = $1 AND status = 'done'
+            ORDER BY keyword, cardinality(path), id;
+        """,
+    }
+
+    def __init__(
+        self,
+        /,
+        conn_str: str = None,
+        max_conn: int = 2,
+        lease_seconds: float = 600,
+        max_attempts: int = 3,
+        **kwargs,
+    ) -> None:
+        self.conn_str = conn_str
+        self.max_conn = max_conn
+        self.min_conn = min(1, self.max_conn)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.pool: asyncpg.Pool = None
+
+    async def initialize(self):
+        pool = await asyncpg.create_pool(
+            dsn=self.conn_str,
+            min_size=self.min_conn,
+            max_size=self.max_conn,
+        )
+        try:
+            schema_check = await pool.fetchrow(self.sql_queries["check_schema"])
+            if schema_check is None:
+                logging.info("Schema is not present, creating one ...")
+                await pool.execute(self.sql_queries["init_schema"])
+        except Exception as e:
+            logging.error(f"Error checking schema: {e}")
+
+        conn: asyncpg.Connection = await pool.acquire()
+        is_success = True
+        try:
+            await conn.execute(self.sql_queries["init_table"])
+            await conn.execute(self.sql_queries["init_claim_index"])
+        except Exception as e:
+            logging.error(f"Error initializing crawl queue storage: {e}")
+            is_success = False
+        finally:
+            await pool.release(conn)
+            if not is_success:
+                await pool.close()
+                raise Exception("Could not initialize PostgreSQL crawl queue storage")
+            self.pool = pool
+
+    async def close(self):
+        await self.pool.close()
+
+    async def seed(self, run_id: str, keywords: list[str]) -> int:
+        # Every process seeds the run on startup, the keyword roots are only
+        # inserted by the first one
+        conn: asyncpg.Connection = await self.pool.acquire()
+        num_of_units = 0
+        try:
+            async with conn.transaction():
+                for keyword in keywords:
+                    status = await conn.execute(
+                        self.sql_queries["insert"], run_id, keyword, [], None
+                    )
+                    num_of_units += int(status.split()[-1])
+        except Exception as e:
+            logging.error(f"[run_id={run_id}]: Error seeding crawl queue: {e}")
+        finally:
+            await self.pool.release(conn)
+
+        return num_of_units
+
+    async def claim(self, run_id: str, worker_id: str) -> Optional[CrawlUnit]:
+        unit = None
+        try:
+            row = await self.pool.fetchrow(
+                self.sql_queries["claim"],
+                run_id,
+                worker_id,
+                float(self.lease_seconds),
+                self.max_attempts,
+            )
+            if row:
+                unit = CrawlUnit(**dict(row))
+        except Exception as e:
+            logging.error(f"[run_id={run_id}]: Error claiming crawl unit: {e}")
+
+        return unit
+
+    async def heartbeat(self, unit: CrawlUnit, worker_id: str) -> bool:
+        try:
+            status = await self.pool.execute(
+                self.sql_queries["heartbeat"], unit.id, worker_id
+            )
+            return status.split()[-1] != "0"
+        except Exception as e:
+            logging.error(f"[unit_id={unit.id}]: Error renewing crawl unit lease: {e}")
+            return False
+
+    async def complete(
+        self,
+        unit: CrawlUnit,
+        worker_id: str,
+        result: dict[str, Any],
+        deferred: list[tuple[list[str], str]],
+    ) -> bool:
+        # The result and the units split off it are written together, a unit
+        # whose lease was lost to another worker changes nothing
+        conn: asyncpg.Connection = await self.pool.acquire()
+        is_success = False
+        try:
+            async with conn.transaction():
+                status = await conn.execute(
+                    self.sql_queries["complete"],
+                    unit.id,
+                    worker_id,
+                    json.dumps(result, ensure_ascii=False),
+                )
+                if status.split()[-1] != "0":
+                    await conn.executemany(
+                        self.sql_queries["insert"],
+                        [
+                            (unit.run_id, unit.keyword, path, url)
+                            for path, url in deferred
+                        ],
+                    )
+                    is_success = True
+        except Exception as e:
+            logging.error(f"[unit_id={unit.id}]: Error completing crawl unit: {e}")
+        finally:
+            await self.pool.release(conn)
+
+        return is_success
+
+    async def fail(self, unit: CrawlUnit, worker_id: str, error: str) -> bool:
+        try:
+            status = await self.pool.execute(
+                self.sql_queries["fail"], unit.id, worker_id, error
+            )
+            return status.split()[-1] != "0"
+        except Exception as e:
+            logging.error(f"[unit_id={unit.id}]: Error failing crawl unit: {e}")
+            return False
+
+    async def get_stats(self, run_id: str) -> CrawlQueueStats:
+        stats = CrawlQueueStats()
+        try:
+            rows = await self.pool.fetch(self.sql_queries["get_stats"], run_id)
+            stats = CrawlQueueStats(**{row["status"]: row["count"] for row in rows})
+        except Exception as e:
+            logging.error(f"[run_id={run_id}]: Error getting crawl queue stats: {e}")
+
+        return stats
+
+    async def is_drained(self, run_id: str) -> bool:
+        # A unit whose worker died on its last attempt is never claimed again,
+        # once its lease is over it does not hold the run open any more
+        try:
+            return not await self.pool.fetchval(
+                self.sql_queries["has_open_units"],
+                run_id,
+                self.max_attempts,
+                float(self.lease_seconds),
+            )
+        except Exception as e:
+            logging.error(f"[run_id={run_id}]: Error checking crawl queue: {e}")
+            return False
+
+    async def iter_results(
+        self, run_id: str
+    ) -> AsyncIterator[tuple[str, list[str], dict[str, Any]]]:
+        conn: asyncpg.Connection = await self.pool.acquire()
+        try:
+            # Shallow units first, so a subtree is always grafted onto its parent
+            async with conn.transaction(readonly=True):
+                async for row in conn.cursor(
+                    self.sql_queries["get_results"], run_id, prefetch=100
+                ):
+                    yield row["keyword"], list(row["path"]), json.loads(row["result"])
+        except Exception as e:
+            logging.error(f"[run_id={run_id}]: Error reading crawl results: {e}")
+        finally:
+            await self.pool.release(conn)
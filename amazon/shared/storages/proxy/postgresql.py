@@ -8,6 +8,7 @@ from typing import Optional
 from shared.models.enums import ProxyType
 from shared.models.proxy import Proxy
 from shared.storages.proxy.base import ProxyStorage
+from shared.storages.row_mapping import proxy_from_row
 
 
 class PostgreSQLProxyStorage(ProxyStorage):
@@ -136,10 +137,8 @@ class PostgreSQLProxyStorage(ProxyStorage):
                 if not row:
                     raise Exception("No proxy found")
 
-                proxy_id, proxy_content = row["id"], row["content"]
-                proxy = Proxy(
-                    provider=provider, proxies=[proxy_content], last_used=current_time
-                )
+                proxy_id = row["id"]
+                proxy = proxy_from_row(row, provider, current_time)
                 await conn.execute(
                     self.sql_queries["update_proxy"],
                     current_time,
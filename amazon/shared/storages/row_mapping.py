@@ -0,0 +1,61 @@
+import json
+
+from datetime import datetime
+from typing import Any, Iterable, Mapping
+from shared.models.proxy import Proxy
+from shared.models.category import Category
+from shared.models.cookie import AmazonCookieSet, Cookie
+
+# Rows coming out of our own tables already have the column types the models
+# declare, so they are turned into models without running the validators again.
+# Anything coming from a client still goes through validation.
+
+_CATEGORY_FIELDS = tuple(Category.model_fields)
+_CATEGORY_FIELDS_SET = frozenset(_CATEGORY_FIELDS)
+_COOKIE_FIELDS = tuple(Cookie.model_fields)
+
+
+def category_from_row(row: Mapping[str, Any]) -> Category:
+    # Same end state as `Category.model_construct`, which on pydantic v2 is slower
+    # than validating because it resolves defaults field by field in Python.
+    # Every column is present in a row, so the instance state is set directly,
+    # see scripts/benchmarks/row_mapping.py for the numbers
+    category = Category.__new__(Category)
+    _set = object.__setattr__
+    _set(category, "__dict__", {field: row[field] for field in _CATEGORY_FIELDS})
+    _set(category, "__pydantic_fields_set__", _CATEGORY_FIELDS_SET)
+    _set(category, "__pydantic_extra__", None)
+    _set(category, "__pydantic_private__", None)
+    return category
+
+
+def categories_from_rows(rows: Iterable[Mapping[str, Any]]) -> list[Category]:
+    return [category_from_row(row) for row in rows]
+
+
+def cookie_from_dict(cookie: Mapping[str, Any]) -> Cookie:
+    return Cookie.model_construct(
+        **{field: cookie[field] for field in _COOKIE_FIELDS if field in cookie}
+    )
+
+
+def cookie_set_from_row(row: Mapping[str, Any]) -> AmazonCookieSet:
+    cookies = row["cookies"]
+    if isinstance(cookies, (str, bytes)):
+        cookies = json.loads(cookies)
+
+    return AmazonCookieSet.model_construct(
+        id=row["id"],
+        postcode=row["postcode"],
+        location=row["location"],
+        cookies=[cookie_from_dict(cookie) for cookie in cookies],
+        expires=row["expires"],
+    )
+
+
+def proxy_from_row(
+    row: Mapping[str, Any], provider: str, last_used: datetime = None
+) -> Proxy:
+    return Proxy.model_construct(
+        provider=provider, proxies=[row["content"]], last_used=last_used
+    )
@@ -1,3 +1,4 @@
+import re
 import json
 import random
 import asyncio
@@ -13,7 +14,7 @@ from shared.factories.storage_factory import (
     category_storage_factory,
 )
 from os import getenv
-from typing import Any
+from typing import Any, Optional
 
 event_queue = asyncio.Queue(5)
 event_loop_lock = asyncio.Lock()
@@ -55,6 +56,29 @@ def load_json_file(file_path: str):
             return json.load(file)
 
 
+# Category links carry their browse node as the last "n:" entry of the
+# refinement chain, e.g. rh=n%3A7141123011%2Cn%3A7147440011, browse pages use
+# node=. Matched on the raw URL, urlparse + parse_qs cost more than the whole
+# rest of the aggregation per category
+_RH_PATTERN = re.compile(r"[?&]rh=([^&#]*)")
+_RH_NODE_PATTERN = re.compile(r"(?:^|,|%2C)n(?::|%3A)(\d+)(?=$|,|%2C)", re.IGNORECASE)
+_NODE_PATTERN = re.compile(r"[?&]node=(\d+)(?=$|[&#])")
+
+
+def parse_node_id(url: Optional[str]) -> Optional[int]:
+    if not url:
+        return None
+
+    match = _RH_PATTERN.search(url)
+    if match:
+        node_ids = _RH_NODE_PATTERN.findall(match.group(1))
+        if node_ids:
+            return int(node_ids[-1])
+
+    match = _NODE_PATTERN.search(url)
+    return int(match.group(1)) if match else None
+
+
 def run_event_loop(loop: asyncio.AbstractEventLoop):
     asyncio.set_event_loop(loop)
     loop.run_forever()